@@ -8,7 +8,8 @@ import func_timeout.exceptions as timeout_exceptions
 import os
 import time
 from core.lib.content import Task
-from core.lib.common import LOGGER, Context, YamlOps, FileOps, Counter, SystemConstant, TaskConstant
+from core.lib.common import LOGGER, Context, YamlOps, FileOps, Counter, SystemConstant, TaskConstant, VideoOps
+from core.lib.common import ClassFactory, ClassType
 from core.lib.network import http_request, NodeInfo, PortInfo, merge_address, NetworkAPIPath, NetworkAPIMethod
 
 from kube_helper import KubeHelper
@@ -30,6 +31,8 @@ class BackendCore:
         self.result_visualization_configs = None
         self.system_visualization_configs = None
         self.customized_source_result_visualization_configs = {}
+        # source id -> (visualization configs, visualizer instances), rebuilt when configs of source change
+        self.result_visualizers = {}
 
         self.source_configs = []
 
@@ -38,6 +41,7 @@ class BackendCore:
         self.time_ticket = 0
 
         self.result_url = None
+        self.result_stream_url = None
         self.result_file_url = None
         self.resource_url = None
         self.log_fetch_url = None
@@ -50,6 +54,10 @@ class BackendCore:
         self.task_results = {}
 
         self.is_get_result = False
+        self.result_stream = Context.get_parameter('RESULT_STREAM', 'True', direct=False)
+        self.result_stream_size = Context.get_parameter('RESULT_STREAM_SIZE', '8', direct=False)
+        # cursor of the last streamed result, kept across queries so that reopening a query does not replay results
+        self.result_cursor = 0
 
         self.cur_yaml_docs = None
         self.save_yaml_path = 'resources.yaml'
@@ -571,17 +579,36 @@ class BackendCore:
 
         return source_ids
 
-    def prepare_result_visualization_data(self, task):
-        source_id = task.get_source_id()
+    def get_result_visualizers(self, source_id):
+        """visualizer instances (None for failed ones) of source, kept alive until its visualization configs change"""
         visualizations = self.customized_source_result_visualization_configs[
             source_id] if source_id in self.customized_source_result_visualization_configs else self.result_visualization_configs
-        visualization_data = []
-        for idx, vf in enumerate(visualizations):
+
+        cached = self.result_visualizers.get(source_id)
+        if cached and cached[0] is visualizations:
+            return cached[1]
+
+        visualizers = []
+        for vf in visualizations:
             try:
                 al_name = vf['hook_name']
                 al_params = eval(vf['hook_params']) if 'hook_params' in vf else {}
                 al_params.update({'variables': vf['variables']})
-                vf_func = Context.get_algorithm('RESULT_VISUALIZER', al_name=al_name, **al_params)
+                visualizers.append(Context.get_algorithm('RESULT_VISUALIZER', al_name=al_name, **al_params))
+            except Exception as e:
+                LOGGER.warning(f'Failed to load result visualizer: {e}')
+                LOGGER.exception(e)
+                visualizers.append(None)
+
+        self.result_visualizers[source_id] = (visualizations, visualizers)
+        return visualizers
+
+    def prepare_result_visualization_data(self, task):
+        visualization_data = []
+        for idx, vf_func in enumerate(self.get_result_visualizers(task.get_source_id())):
+            if vf_func is None:
+                continue
+            try:
                 visualization_data.append({"id": idx, "data": vf_func(task)})
             except Exception as e:
                 LOGGER.warning(f'Failed to load result visualization data: {e}')
@@ -624,7 +651,11 @@ class BackendCore:
             source_id = task.get_source_id()
             task_id = task.get_task_id()
             file_path = self.get_file_result(task.get_file_path())
-            LOGGER.debug(task.get_delay_info())
+            try:
+                LOGGER.debug(task.get_delay_info())
+            except (AssertionError, KeyError, ValueError):
+                # delay info is unavailable in tasks projected to visualization fields
+                pass
 
             try:
                 visualization_data = self.prepare_result_visualization_data(task)
@@ -639,12 +670,41 @@ class BackendCore:
             if not self.source_open:
                 break
 
-            self.task_results[source_id].put_all([{
+            # results of sources from earlier queries
+            task_result_queue = self.task_results.get(source_id)
+            if task_result_queue is None:
+                LOGGER.debug(f'Skip result of unknown source {source_id} (task {task_id})')
+                continue
+            task_result_queue.put_all([{
                 'task_id': task_id,
                 'data': visualization_data,
             }])
 
+    def get_result_fields(self):
+        """task fields needed by all result visualizers (None if any visualizer needs the whole task)"""
+        visualizations = list(self.result_visualization_configs or [])
+        for configs in self.customized_source_result_visualization_configs.values():
+            visualizations.extend(configs)
+
+        fields = {'file_path'}
+        for vf in visualizations:
+            try:
+                vf_cls = ClassFactory.get_cls(ClassType.RESULT_VISUALIZER, vf['hook_name'])
+            except ValueError:
+                return None
+            if vf_cls.required_fields is None:
+                return None
+            fields.update(vf_cls.required_fields)
+
+        return sorted(fields)
+
     def run_get_result(self):
+        if self.result_stream:
+            self.run_stream_result()
+        else:
+            self.run_poll_result()
+
+    def run_poll_result(self):
         time_ticket = 0
         while self.is_get_result:
             try:
@@ -672,6 +732,48 @@ class BackendCore:
                 LOGGER.warning(f'Error occurred in getting task result: {str(e)}')
                 LOGGER.exception(e)
 
+    def run_stream_result(self):
+        """
+        subscribe results from distributor stream with only the fields needed by result visualizers,
+        resubscribe with the server-side cursor when connection breaks or visualizations change
+        """
+        while self.is_get_result:
+            try:
+                self.get_result_url()
+                if not self.result_stream_url:
+                    LOGGER.debug('[NO RESULT] Fetch result url failed.')
+                    time.sleep(1)
+                    continue
+
+                fields = self.get_result_fields()
+                response = http_request(self.result_stream_url,
+                                        method=NetworkAPIMethod.DISTRIBUTOR_RESULT_STREAM,
+                                        no_decode=True,
+                                        stream=True,
+                                        json={'cursor': self.result_cursor, 'fields': fields,
+                                              'size': self.result_stream_size})
+                if response is None:
+                    self.result_stream_url = None
+                    self.result_file_url = None
+                    LOGGER.debug('[NO RESULT] Request result stream failed.')
+                    time.sleep(1)
+                    continue
+
+                with response:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        self.result_cursor = data['cursor']
+                        self.parse_task_result(data['result'])
+                        if not self.is_get_result or self.get_result_fields() != fields:
+                            break
+
+            except Exception as e:
+                LOGGER.warning(f'Error occurred in getting task result stream: {str(e)}')
+                LOGGER.exception(e)
+                time.sleep(1)
+
     def get_system_parameters(self):
         return [{'data': self.prepare_system_visualizations_data()}]
 
@@ -749,6 +851,9 @@ class BackendCore:
         self.result_url = merge_address(NodeInfo.hostname2ip(cloud_hostname),
                                         port=distributor_port,
                                         path=NetworkAPIPath.DISTRIBUTOR_RESULT)
+        self.result_stream_url = merge_address(NodeInfo.hostname2ip(cloud_hostname),
+                                               port=distributor_port,
+                                               path=NetworkAPIPath.DISTRIBUTOR_RESULT_STREAM)
         self.result_file_url = merge_address(NodeInfo.hostname2ip(cloud_hostname),
                                              port=distributor_port,
                                              path=NetworkAPIPath.DISTRIBUTOR_FILE)
@@ -767,16 +872,22 @@ class BackendCore:
                                            path=NetworkAPIPath.DISTRIBUTOR_CLEAR_DATABASE)
 
     def get_file_result(self, file_path):
+        """
+        download thumbnail of task file (saved to thumbnail path of file),
+        or the file itself if distributor has no thumbnail of it; return the saved path
+        """
         if not self.result_file_url:
             return ''
         response = http_request(self.result_file_url,
                                 method=NetworkAPIMethod.DISTRIBUTOR_FILE,
                                 no_decode=True,
-                                json={'file': file_path},
+                                json={'file': file_path, 'thumbnail': True},
                                 stream=True)
         if response is None:
             self.result_file_url = None
             return ''
+        if response.headers.get('content-type', '').startswith('image/'):
+            file_path = VideoOps.get_thumbnail_path(file_path)
         dir_path = os.path.dirname(file_path)
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
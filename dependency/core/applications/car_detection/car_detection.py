@@ -19,7 +19,7 @@ from core.lib.common import Context
 
 class CarDetection:
 
-    def __init__(self, weights, plugin_library, device=0):
+    def __init__(self, weights, plugin_library, device=0, batch_size=None):
 
         self.weights = Context.get_file_path(weights)
         self.plugin_library = Context.get_file_path(plugin_library)
@@ -68,7 +68,9 @@ class CarDetection:
         self.host_outputs = host_outputs
         self.cuda_outputs = cuda_outputs
         self.bindings = bindings
-        self.batch_size = 1
+        # frames per forward pass, bounded by max batch size of the TensorRT engine
+        self.batch_size = min(batch_size, engine.max_batch_size) if batch_size else engine.max_batch_size
+        self.batch_input_image = np.empty(shape=[self.batch_size, 3, self.input_h, self.input_w], dtype=np.float32)
 
         self.warm_up_turns = 5
         self.conf_thres = 0.3
@@ -295,6 +297,11 @@ class CarDetection:
         return boxes
 
     def infer(self, raw_image):
+        return self.infer_batch([raw_image])[0]
+
+    def infer_batch(self, raw_images: List[np.ndarray]):
+        assert 0 < len(raw_images) <= self.batch_size, \
+            f'Batch of {len(raw_images)} images exceeds engine batch size {self.batch_size}'
 
         # Make self the active context, pushing it on top of the context stack.
         self.ctx.push()
@@ -302,35 +309,31 @@ class CarDetection:
         # Restore
         stream = self.stream
         context = self.context
-        engine = self.engine
         host_inputs = self.host_inputs
         cuda_inputs = self.cuda_inputs
         host_outputs = self.host_outputs
         cuda_outputs = self.cuda_outputs
         bindings = self.bindings
         # Do image preprocess
-        batch_image_raw = []
         batch_origin_h = []
         batch_origin_w = []
-        batch_input_image = np.empty(shape=[self.batch_size, 3, self.input_h, self.input_w])
-
-        input_image, image_raw, origin_h, origin_w = self.preprocess_image(raw_image)
-        batch_image_raw.append(image_raw)
-        batch_origin_h.append(origin_h)
-        batch_origin_w.append(origin_w)
-
-        np.copyto(batch_input_image[0], input_image)
+        batch_input_image = self.batch_input_image
 
-        batch_input_image = np.ascontiguousarray(batch_input_image)
+        for i, raw_image in enumerate(raw_images):
+            input_image, _, origin_h, origin_w = self.preprocess_image(raw_image)
+            batch_origin_h.append(origin_h)
+            batch_origin_w.append(origin_w)
+            np.copyto(batch_input_image[i], input_image[0])
 
-        # Copy input image to host buffer
-        np.copyto(host_inputs[0], batch_input_image.ravel())
+        # Copy input images to host buffer
+        input_size = batch_input_image[0].size * len(raw_images)
+        np.copyto(host_inputs[0][:input_size], batch_input_image[:len(raw_images)].ravel())
 
         # Transfer input data  to the GPU.
         cuda.memcpy_htod_async(cuda_inputs[0], host_inputs[0], stream)
 
         # Run inference.
-        context.execute_async(batch_size=self.batch_size, bindings=bindings, stream_handle=stream.handle)
+        context.execute_async(batch_size=len(raw_images), bindings=bindings, stream_handle=stream.handle)
 
         # Transfer predictions back from the GPU.
         cuda.memcpy_dtoh_async(host_outputs[0], cuda_outputs[0], stream)
@@ -340,28 +343,31 @@ class CarDetection:
         # Remove any context from the top of the context stack, deactivating it.
         self.ctx.pop()
 
-        # Here we use the first row of output in that batch_size = 1
         output = host_outputs[0]
 
-        # Do postprocess
+        # Do postprocess on each row of output in the batch
+        results = []
+        for i in range(len(raw_images)):
+            result_boxes, result_scores, result_classid = self.post_process(
+                output[i * self.len_all_result: (i + 1) * self.len_all_result],
+                batch_origin_h[i], batch_origin_w[i]
+            )
 
-        result_boxes, result_scores, result_classid = self.post_process(
-            output, batch_origin_h[0], batch_origin_w[0]
-        )
+            mask = np.isin(self.categories[result_classid.astype(int)], self.target_categories)
 
-        mask = np.isin(self.categories[result_classid.astype(int)], self.target_categories)
+            result_boxes = result_boxes.astype(int)[mask].tolist()
+            result_scores = result_scores[mask].tolist()
+            result_classid = np.full(len(result_boxes), self.class_id).tolist()
 
-        result_boxes = result_boxes.astype(int)[mask].tolist()
-        result_scores = result_scores[mask].tolist()
-        result_classid = np.full(len(result_boxes), self.class_id).tolist()
+            results.append((result_boxes, result_scores, result_classid))
 
-        return result_boxes, result_scores, result_classid
+        return results
 
     def __call__(self, images: List[np.ndarray]):
 
         output = []
 
-        for image in images:
-            output.append(self.infer(image))
+        for i in range(0, len(images), self.batch_size):
+            output.extend(self.infer_batch(images[i: i + self.batch_size]))
 
         return output
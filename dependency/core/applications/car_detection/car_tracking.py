@@ -5,61 +5,132 @@ import numpy as np
 
 
 class CarTracking:
-    def __init__(self):
-        pass
+    """
+    optical-flow tracker propagating detected boxes over following frames
+
+    each frame is downscaled to at most `max_width` pixels wide and converted to grey once,
+    serving both as the next image of the current step and the previous image of the next step.
+    boxes are seeded with a grid of `grid_size` x `grid_size` points, points of all boxes are tracked
+    by one pyramidal LK call and boxes are shifted by the mean flow of their points with vectorized numpy.
+
+    tracking quality is the ratio of points still tracked since the latest detection,
+    a new detection is needed once it drops below `min_quality` or after `max_track_frames` frames,
+    or after `empty_redetect_frames` frames if there is nothing to track (new objects may have appeared).
+    """
+
+    def __init__(self, max_width: int = 640, grid_size: int = 4, win_size: int = 15, max_level: int = 2,
+                 max_error: float = 20.0, min_points: int = 2, min_quality: float = 0.6, max_track_frames: int = 30,
+                 empty_redetect_frames: int = 5):
+        self.max_width = max_width
+        self.grid_size = grid_size
+        self.win_size = (win_size, win_size)
+        self.max_level = max_level
+        self.max_error = max_error
+        self.min_points = min_points
+        self.min_quality = min_quality
+        self.max_track_frames = max_track_frames
+        self.empty_redetect_frames = empty_redetect_frames
+
+        # downscaled grey previous frame and downscale factor of frames
+        self.prev_grey_frame = None
+        self.scale = 1.0
+        # boxes (n, 4) in original frame coordinates, with probs and class ids
+        self.bbox = np.empty((0, 4), dtype=np.float32)
+        self.prob = np.empty(0)
+        self.class_id = np.empty(0)
+        self.bbox_dtype = np.float32
+        # tracked points (m, 1, 2) in downscaled coordinates and index of box of each point
+        self.points = np.empty((0, 1, 2), dtype=np.float32)
+        self.point_box_index = np.empty(0, dtype=np.int64)
+        self.seeded_points_num = 0
+        self.tracked_frames = 0
 
     def __call__(self, tracking_frame_list: List[np.ndarray], prev_detection_frame: np.ndarray, content_result: tuple):
+        self.reset(prev_detection_frame, content_result)
+        result = [self.get_result()]
+        for present_frame in tracking_frame_list:
+            result.append(self.track(present_frame))
+        return result
+
+    def reset(self, frame: np.ndarray, content_result: tuple):
+        """start tracking from detection result of frame"""
         bbox, prob, class_id = content_result
-        grey_prev_frame = cv2.cvtColor(prev_detection_frame, cv2.COLOR_BGR2GRAY)
-        key_points = self.select_key_points(bbox, grey_prev_frame)
+        bbox = np.asarray(bbox)
+        self.bbox_dtype = bbox.dtype if bbox.size else np.float32
+        self.bbox = bbox.reshape(-1, 4).astype(np.float32)
+        self.prob = np.asarray(prob).reshape(-1)
+        self.class_id = np.asarray(class_id).reshape(-1)
 
-        result = [(bbox.copy(), prob.copy(), class_id.copy())]
-        for present_frame in tracking_frame_list:
-            grey_present_frame = cv2.cvtColor(present_frame, cv2.COLOR_BGR2GRAY)
-            new_points, status, error = cv2.calcOpticalFlowPyrLK(grey_prev_frame, grey_present_frame, key_points, None)
+        self.scale = min(self.max_width / frame.shape[1], 1.0)
+        self.prev_grey_frame = self.prepare_frame(frame)
+        self.points, self.point_box_index = self.seed_points(self.bbox * self.scale)
+        self.seeded_points_num = len(self.points)
+        self.tracked_frames = 0
 
-            if len(key_points) > 0 and len(new_points) > 0:
-                bbox, prob, class_id = self.update_bounding_boxes((bbox, prob, class_id), key_points, new_points, status)
-                key_points = new_points[status == 1].reshape(-1, 1, 2)
+    def track(self, frame: np.ndarray):
+        """propagate boxes to frame, return (bbox, prob, class_id) of frame"""
+        grey_frame = self.prepare_frame(frame)
+        self.tracked_frames += 1
 
-            result.append((bbox.copy(), prob.copy(), class_id.copy()))
+        if len(self.points) > 0:
+            new_points, status, error = cv2.calcOpticalFlowPyrLK(self.prev_grey_frame, grey_frame, self.points, None,
+                                                                 winSize=self.win_size, maxLevel=self.max_level)
+            valid = (status.reshape(-1) == 1) & (error.reshape(-1) < self.max_error)
+            self.update_bounding_boxes(self.points[valid], new_points[valid], self.point_box_index[valid])
 
-            grey_prev_frame = grey_present_frame.copy()
+        self.prev_grey_frame = grey_frame
+        return self.get_result()
 
-        return result
+    def need_detection(self) -> bool:
+        if self.seeded_points_num == 0:
+            return self.tracked_frames >= self.empty_redetect_frames
+        return self.get_quality() < self.min_quality or self.tracked_frames >= self.max_track_frames
+
+    def get_quality(self) -> float:
+        if self.seeded_points_num == 0:
+            return 1.0
+        return len(self.points) / self.seeded_points_num
+
+    def get_result(self):
+        bbox = self.bbox
+        if np.issubdtype(self.bbox_dtype, np.integer):
+            bbox = np.rint(bbox)
+        return bbox.astype(self.bbox_dtype), self.prob.copy(), self.class_id.copy()
+
+    def prepare_frame(self, frame: np.ndarray):
+        if self.scale < 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def seed_points(self, scaled_bbox: np.ndarray):
+        """grid points inside each box (margins of half a cell), and index of box of each point"""
+        steps = (np.arange(self.grid_size, dtype=np.float32) + 0.5) / self.grid_size
+        grid_x, grid_y = np.meshgrid(steps, steps)
+        x1, y1, x2, y2 = (scaled_bbox[:, i:i + 1] for i in range(4))
+        xs = x1 + (x2 - x1) * grid_x.reshape(1, -1)
+        ys = y1 + (y2 - y1) * grid_y.reshape(1, -1)
+        points = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+        point_box_index = np.repeat(np.arange(len(scaled_bbox)), self.grid_size * self.grid_size)
+        return points, point_box_index
+
+    def update_bounding_boxes(self, old_points, new_points, point_box_index):
+        """shift boxes by mean flow of their valid points, drop boxes with less than `min_points` points"""
+        boxes_num = len(self.bbox)
+        movements = (new_points - old_points).reshape(-1, 2)
+        counts = np.bincount(point_box_index, minlength=boxes_num)
+        kept = counts >= self.min_points
+
+        safe_counts = np.maximum(counts, 1)
+        dx = np.bincount(point_box_index, weights=movements[:, 0], minlength=boxes_num) / safe_counts
+        dy = np.bincount(point_box_index, weights=movements[:, 1], minlength=boxes_num) / safe_counts
+        shift = np.stack([dx, dy, dx, dy], axis=1) / self.scale
+
+        # re-index points of kept boxes
+        new_box_index = np.cumsum(kept) - 1
+        point_kept = kept[point_box_index]
+        self.points = new_points[point_kept].reshape(-1, 1, 2)
+        self.point_box_index = new_box_index[point_box_index[point_kept]]
 
-    @staticmethod
-    def select_key_points(bounding_boxes, gray_image, max_corners=10, quality_level=0.01, min_distance=1):
-        points = []
-        for (x1, y1, x2, y2) in bounding_boxes:
-            roi = gray_image[y1:y2, x1:x2]
-            corners = cv2.goodFeaturesToTrack(roi, maxCorners=max_corners, qualityLevel=quality_level,
-                                              minDistance=min_distance)
-            if corners is not None:
-                corners += np.array([x1, y1], dtype=np.float32)
-                points.extend(corners.tolist())
-
-        return np.array(points, dtype=np.float32) if points else np.empty((0, 1, 2), dtype=np.float32)
-
-    @staticmethod
-    def update_bounding_boxes(content_result, old_points, new_points, status):
-        bounding_boxes, probs, class_ids = content_result
-        updated_boxes = []
-        updated_probs = []
-        updated_classes = []
-        point_movements = new_points - old_points
-        for box, prob, class_id in zip(bounding_boxes, probs, class_ids):
-
-            x1, y1, x2, y2 = box
-            points_in_box = ((old_points[:, 0, 0] >= x1) & (old_points[:, 0, 0] < x2) &
-                             (old_points[:, 0, 1] >= y1) & (old_points[:, 0, 1] < y2)).reshape(-1)
-            valid_points_in_box = points_in_box & (status.flatten() == 1)
-            if not np.any(valid_points_in_box):
-                continue
-            average_movement = np.mean(point_movements[valid_points_in_box], axis=0).reshape(-1)
-            dx, dy = average_movement[0], average_movement[1]
-            updated_box = (x1 + int(dx), y1 + int(dy), x2 + int(dx), y2 + int(dy))
-            updated_boxes.append(updated_box)
-            updated_probs.append(prob)
-            updated_classes.append(class_id)
-        return np.asarray(updated_boxes), np.asarray(updated_probs), np.asarray(updated_classes)
+        self.bbox = (self.bbox + shift.astype(np.float32))[kept]
+        self.prob = self.prob[kept]
+        self.class_id = self.class_id[kept]
@@ -61,8 +61,13 @@ class ModelSwitchDetection:
 
     def __init__(self, model_type: str, switch_type: str,
                  decision_interval: int,
-                 *args, **kwargs):
-        
+                 *args, batch_size: int = 8, **kwargs):
+
+        # max frames inferred in one forward pass (1 to infer frame by frame)
+        self.batch_size = max(batch_size, 1)
+        # latency profile covers the batch sizes actually inferred (full batches and single frames)
+        kwargs.setdefault('profile_batch_sizes', sorted({1, self.batch_size}))
+
         if model_type == 'yolo':
             YoloInference = _import_yolo_inference_module()
             self.detector = YoloInference(*args, **kwargs)
@@ -94,10 +99,12 @@ class ModelSwitchDetection:
 
     def __call__(self, images: List[np.ndarray]):
 
-        output = []
+        if self.batch_size == 1:
+            return [self.infer(image) for image in images]
 
-        for image in images:
-            output.append(self.infer(image))
+        output = []
+        for start in range(0, len(images), self.batch_size):
+            output.extend(self.detector.infer_batch(images[start: start + self.batch_size]))
 
         return output
     
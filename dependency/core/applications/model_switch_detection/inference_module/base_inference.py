@@ -1,13 +1,13 @@
 from abc import ABC, abstractmethod
+from typing import List
 import numpy as np
-from .stats_manager import StatsManager, StatsEntry
-import cv2
+from .stats_manager import StatsManager
+from .latency_profile import LatencyProfile
 import time
 
-from core.lib.network import get_merge_address, http_request
-from core.lib.network import NodeInfo, PortInfo
+from core.lib.network import merge_address, http_request
 from core.lib.network import NetworkAPIPath, NetworkAPIMethod
-from core.lib.common import Context
+from core.lib.common import Context, Metrics, VideoOps
 
 class BaseInference(ABC):
     @abstractmethod
@@ -16,12 +16,33 @@ class BaseInference(ABC):
         Load all models, do all the necessary initializations.
         Notice that the models should be a sorted list of pareto optimal models, so that the switcher can switch between them.
         '''
-        self.stats_manager = StatsManager()
+        self.queue_length = None
+        self.queue_fetch_time = 0
+        # per-frame latency of models x resolutions x batch sizes, persisted across restarts
+        self.latency_profile = LatencyProfile(
+            Context.get_file_path('latency_profile.json'),
+            save_interval=Context.get_parameter('LATENCY_PROFILE_SAVE_INTERVAL', '30', direct=False))
+        # resolution and batch size of the latest inference
+        self.latest_config = (None, 1)
+        self.last_inference_latency = 0
+        self.stats_manager = StatsManager(
+            flush_interval=Context.get_parameter('STATS_FLUSH_INTERVAL', '1', direct=False),
+            snapshot_format=Context.get_parameter('STATS_SNAPSHOT_FORMAT', 'csv'),
+            queue_length_hook=self.get_queue,
+            latency_hook=self.record_latency)
         
     @abstractmethod
-    def switch_model(self, index: int):
+    def switch_model(self, index: int, wait: bool = False):
         '''
         Switch the model to the one specified in the arguments.
+        Detectors loading models lazily may switch once the model is loaded, unless wait is True.
+        '''
+        pass
+
+    def update_model_priorities(self, priorities: List[float]):
+        '''
+        Report how likely each model is to be switched to (higher is more likely), called by switchers.
+        Detectors loading models lazily keep the most likely models resident.
         '''
         pass
 
@@ -55,6 +76,86 @@ class BaseInference(ABC):
         '''
         pass
 
+    def infer_batch(self, images: List[np.ndarray], record_stats: bool = True):
+        '''
+        Do the inference on a batch of images in one forward pass.
+        Returns a list of (boxes, scores, labels), one for each image.
+        The per-frame latency of the forward pass is kept in `last_inference_latency`,
+        stats are not recorded if record_stats is False (eg: profiling).
+        Detectors without batched implementation infer the images one by one and always record stats.
+        '''
+        start_time = time.perf_counter()
+        outputs = [self.infer(image) for image in images]
+        self.last_inference_latency = (time.perf_counter() - start_time) / max(len(images), 1)
+        return outputs
+
+    def get_model_key(self, index: int) -> str:
+        '''
+        Get the key of the model in the latency profile, stable across restarts.
+        '''
+        return str(index)
+
+    def profile_latencies(self, resolutions: List[str], batch_sizes: List[int], warmup: int = 2, repeats: int = 5):
+        '''
+        Profile the per-frame latency of models on random frames of the resolutions and batch sizes.
+        Only entries missing from the persisted latency profile are profiled, the others are refined online.
+        '''
+        current_model_index = self.get_current_model_index()
+        for index in range(self.get_models_num()):
+            model_key = self.get_model_key(index)
+            missing_configs = [(resolution, batch_size) for resolution in resolutions for batch_size in batch_sizes
+                               if not self.latency_profile.has(model_key, resolution, batch_size)]
+            if not missing_configs:
+                continue
+
+            self.switch_model(index, wait=True)
+            if self.get_current_model_index() != index:
+                print(f'Model {model_key} is not available, skip profiling it')
+                continue
+            for resolution, batch_size in missing_configs:
+                width, height = VideoOps.text2resolution(resolution)
+                images = [np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)] * batch_size
+                for _ in range(warmup):
+                    self.infer_batch(images, record_stats=False)
+                latencies = []
+                for _ in range(repeats):
+                    self.infer_batch(images, record_stats=False)
+                    latencies.append(self.last_inference_latency)
+                self.latency_profile.update(model_key, resolution, batch_size, float(np.median(latencies)),
+                                            ema=False)
+                print(f'Model {model_key} takes time: {np.median(latencies):.4f}s per frame '
+                      f'({resolution}, batch size {batch_size})')
+
+        if current_model_index is not None and current_model_index != self.get_current_model_index():
+            self.switch_model(current_model_index, wait=True)
+        self.latency_profile.save()
+
+    def record_latency(self, stats_entry):
+        '''
+        Refine the latency profile with a stats entry, called by the stats manager aggregator.
+        '''
+        self.latest_config = (stats_entry.resolution, stats_entry.batch_size)
+        self.latency_profile.update(self.get_model_key(stats_entry.cur_model_index), stats_entry.resolution,
+                                    stats_entry.batch_size, stats_entry.processing_latency)
+        self.latency_profile.save_if_due()
+
+    def get_model_latency(self, index: int, resolution: str = None, batch_size: int = None):
+        '''
+        Get the profiled per-frame latency of the model at the resolution and batch size.
+        Defaults to the configuration of the latest inference. Returns None if the model is never profiled.
+        '''
+        latest_resolution, latest_batch_size = self.latest_config
+        resolution = resolution or latest_resolution
+        if resolution is None:
+            return None
+        return self.latency_profile.get_latency(self.get_model_key(index), resolution, batch_size or latest_batch_size)
+
+    def get_profiled_latencies(self, resolution: str = None, batch_size: int = None):
+        '''
+        Get the profiled per-frame latency of all models, see `get_model_latency`.
+        '''
+        return [self.get_model_latency(index, resolution, batch_size) for index in range(self.get_models_num())]
+
     @abstractmethod
     def get_current_model_index(self):
         '''
@@ -63,49 +164,31 @@ class BaseInference(ABC):
         pass
 
     def get_queue(self):
-        self.local_device = NodeInfo.get_local_device()
+        '''
+        Get the queue length of processor.
+        Read in process when the detector runs in the processor server, otherwise request it (at most once a second).
+        '''
+        queue_length = Metrics.get_value('processor_queue_length')
+        if queue_length is not None:
+            return queue_length
+
+        if time.time() - self.queue_fetch_time < 1:
+            return self.queue_length
         self.processor_port = Context.get_parameter('GUNICORN_PORT')
-        queue_url = get_merge_address('127.0.0.1',
-                                        port=self.processor_port,
-                                        path=NetworkAPIPath.PROCESSOR_QUEUE_LENGTH) 
-        result = http_request(url=queue_url, method=NetworkAPIMethod.PROCESSOR_QUEUE_LENGTH, timeout=5)
-        return result
+        queue_url = merge_address('127.0.0.1',
+                                  port=self.processor_port,
+                                  path=NetworkAPIPath.PROCESSOR_QUEUE_LENGTH)
+        self.queue_length = http_request(url=queue_url, method=NetworkAPIMethod.PROCESSOR_QUEUE_LENGTH, timeout=5)
+        self.queue_fetch_time = time.time()
+        return self.queue_length
 
     @abstractmethod
-    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency):
+    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency, batch_size=1):
         '''
         Prepare the stats for updating.
+        Only the raw record is handed to the stats manager, stats are computed by its aggregator thread.
+        For batched inference, inference_latency is the latency of the batch amortized over its frames.
         '''
-        # prepare the stats entry
-        stats_entry = StatsEntry()
-        stats_entry.timestamp = time.time()
-        stats_entry.queue_length = int(self.get_queue())
-        stats_entry.cur_model_index = self.get_current_model_index()
-        stats_entry.cur_model_accuracy = self.get_models_accuracy()[stats_entry.cur_model_index]
-        stats_entry.processing_latency = inference_latency
-        stats_entry.target_nums = len(boxes)
-        if len(boxes) > 0:
-            stats_entry.avg_confidence = np.mean(scores)
-            stats_entry.std_confidence = np.std(scores)
-        else:
-            stats_entry.avg_confidence = 0
-            stats_entry.std_confidence = 0
-        # 获取图像尺寸
-        image_height, image_width = image.shape[:2]
-        image_area = image_height * image_width
-        
-        # 计算相对尺寸（框面积/图像面积）
-        boxes = np.array(boxes)
-        if len(boxes) > 0:
-            box_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
-            relative_sizes = np.sqrt(box_areas / image_area)
-            stats_entry.avg_size = np.mean(relative_sizes)
-            stats_entry.std_size = np.std(relative_sizes)
-        else:
-            stats_entry.avg_size = 0
-            stats_entry.std_size = 0
-        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        stats_entry.brightness = np.mean(gray_image)
-        stats_entry.contrast = np.std(gray_image)
-        # print(f'Updating stats: {stats_entry}')
-        self.stats_manager.update_stats(stats_entry)
\ No newline at end of file
+        cur_model_index = self.get_current_model_index()
+        self.stats_manager.submit(image, boxes, scores, inference_latency,
+                                  cur_model_index, self.get_models_accuracy()[cur_model_index], batch_size)
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.lib.common import LOGGER, VideoOps
+
+
+class LatencyProfile:
+    '''
+    Per-frame inference latency of each model x input resolution x batch size.
+
+    Entries missing from the persisted table are profiled at startup, then every entry is refined online
+    by ema of the latency of real inferences (fed by the stats manager aggregator, off the inference path),
+    so that it also reflects cpu/gpu contention of the device.
+    The table is keyed by model key (model name rather than index, so it survives reordering of models)
+    and is saved as json at most once every `save_interval` seconds.
+    '''
+
+    def __init__(self, profile_path: str, ema_alpha: float = 0.2, save_interval: float = 30.0):
+        self.profile_path = profile_path
+        self.ema_alpha = ema_alpha
+        self.save_interval = save_interval
+
+        # model key -> resolution -> batch size (str, as json keys) -> per-frame latency
+        self.table = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.save_time = time.time()
+
+        self.load()
+
+    @staticmethod
+    def get_resolution_key(image_shape) -> str:
+        '''
+        Resolution text of image shape (eg: '720p'), 'WxH' for resolutions unknown to the system.
+        '''
+        height, width = image_shape[:2]
+        if (width, height) in VideoOps.resolution_dict_reverse:
+            return VideoOps.resolution2text((width, height))
+        return f'{width}x{height}'
+
+    @staticmethod
+    def get_resolution_pixels(resolution: str) -> int:
+        if resolution in VideoOps.resolution_dict:
+            width, height = VideoOps.text2resolution(resolution)
+        else:
+            width, height = map(int, resolution.split('x'))
+        return width * height
+
+    def load(self):
+        if not os.path.exists(self.profile_path):
+            return
+        try:
+            with open(self.profile_path) as f:
+                self.table = json.load(f)
+            LOGGER.info(f'[Latency Profile] Load latency profile of {len(self.table)} models '
+                        f'from {self.profile_path}')
+        except Exception as e:
+            LOGGER.warning(f'[Latency Profile] Load latency profile failed: {str(e)}')
+            self.table = {}
+
+    def save(self):
+        with self.lock:
+            content = json.dumps(self.table, indent=2)
+            self.dirty = False
+        self.save_time = time.time()
+
+        # write and rename, so that a crash during saving does not corrupt the persisted table
+        temp_path = f'{self.profile_path}.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(content)
+            os.replace(temp_path, self.profile_path)
+        except Exception as e:
+            LOGGER.warning(f'[Latency Profile] Save latency profile failed: {str(e)}')
+
+    def save_if_due(self):
+        if self.dirty and time.time() - self.save_time >= self.save_interval:
+            self.save()
+
+    def has(self, model_key: str, resolution: str, batch_size: int) -> bool:
+        with self.lock:
+            return str(batch_size) in self.table.get(model_key, {}).get(resolution, {})
+
+    def update(self, model_key: str, resolution: str, batch_size: int, latency: float, ema: bool = True):
+        '''
+        Update per-frame latency of the entry, set directly if ema is False or the entry is new.
+        '''
+        with self.lock:
+            entries = self.table.setdefault(model_key, {}).setdefault(resolution, {})
+            batch_key = str(batch_size)
+            if ema and batch_key in entries:
+                entries[batch_key] = self.ema_alpha * latency + (1 - self.ema_alpha) * entries[batch_key]
+            else:
+                entries[batch_key] = float(latency)
+            self.dirty = True
+
+    def get_latency(self, model_key: str, resolution: str, batch_size: int):
+        '''
+        Per-frame latency of the entry, None if the model is never profiled.
+        Unprofiled batch size takes the nearest (in log scale) profiled one of the resolution,
+        unprofiled resolution takes the nearest (in pixels) profiled one scaled by pixels.
+        '''
+        with self.lock:
+            resolutions = self.table.get(model_key)
+            if not resolutions:
+                return None
+
+            if resolution in resolutions:
+                return self.get_nearest_batch_latency(resolutions[resolution], batch_size)
+
+            pixels = self.get_resolution_pixels(resolution)
+            nearest_resolution = min(resolutions,
+                                     key=lambda res: abs(np.log(self.get_resolution_pixels(res) / pixels)))
+            latency = self.get_nearest_batch_latency(resolutions[nearest_resolution], batch_size)
+            return latency * pixels / self.get_resolution_pixels(nearest_resolution)
+
+    @staticmethod
+    def get_nearest_batch_latency(entries: dict, batch_size: int):
+        batch_key = str(batch_size)
+        if batch_key in entries:
+            return entries[batch_key]
+        nearest_batch_key = min(entries, key=lambda key: abs(np.log(int(key) / max(batch_size, 1))))
+        return entries[nearest_batch_key]
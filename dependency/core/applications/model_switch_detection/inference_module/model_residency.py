@@ -0,0 +1,183 @@
+from collections import OrderedDict
+import queue
+import threading
+import time
+
+from core.lib.common import LOGGER
+
+
+class ModelResidencyManager:
+    '''
+    Keep a bounded set of models resident (loaded and warmed up on device), loading the others lazily.
+
+    Residency is bounded by `max_resident` models and optionally by `memory_budget` bytes of model weights.
+    Switchers report how likely each model is to be chosen by priorities; models of the highest priorities
+    are prefetched in background by a single loader thread, so that switching to them takes no loading.
+    When over budget, the resident model of the lowest priority (least recently used among equals) is evicted,
+    the pinned model (the one serving inference) is never evicted.
+    '''
+
+    def __init__(self, models_num: int, load_function, warmup_function=None, size_function=None,
+                 release_function=None, max_resident: int = 2, memory_budget: float = None):
+        self.models_num = models_num
+        # index -> model
+        self.load_function = load_function
+        # model -> None, run dummy inference so that the first real inference is not slowed by lazy initialization
+        self.warmup_function = warmup_function
+        # model -> bytes of model in memory
+        self.size_function = size_function
+        # called after evicting models (eg: release cached device memory)
+        self.release_function = release_function
+        self.max_resident = max(max_resident, 1)
+        self.memory_budget = memory_budget
+
+        # index -> (model, size), ordered from least to most recently used
+        self.models = OrderedDict()
+        self.priorities = [0.0] * models_num
+        self.pinned_index = None
+        self.lock = threading.Lock()
+
+        # loading is serialized, both for synchronous loading and background prefetching
+        self.load_lock = threading.Lock()
+        self.load_requests = queue.Queue()
+        self.pending_indexes = set()
+        threading.Thread(target=self.loop_load, daemon=True).start()
+
+    def get(self, index: int):
+        '''
+        Get the resident model of index (marked as recently used), None if it is not resident.
+        '''
+        with self.lock:
+            if index not in self.models:
+                return None
+            self.models.move_to_end(index)
+            return self.models[index][0]
+
+    def is_resident(self, index: int) -> bool:
+        with self.lock:
+            return index in self.models
+
+    def get_resident_indexes(self):
+        with self.lock:
+            return list(self.models)
+
+    def pin(self, index: int):
+        '''
+        Protect the model serving inference from eviction.
+        '''
+        with self.lock:
+            self.pinned_index = index
+
+    def pin_if_resident(self, index: int) -> bool:
+        '''
+        Pin the model of index only if it is resident, checked and pinned atomically so that it cannot be
+        evicted in between. Returns whether the model is pinned.
+        '''
+        with self.lock:
+            if index not in self.models:
+                return False
+            self.models.move_to_end(index)
+            self.pinned_index = index
+            return True
+
+    def load(self, index: int):
+        '''
+        Load and warm up the model of index if not resident, blocking until it is ready.
+        Returns the model, or None if loading failed.
+        '''
+        with self.load_lock:
+            model = self.get(index)
+            if model is not None:
+                return model
+
+            start_time = time.time()
+            try:
+                model = self.load_function(index)
+                if self.warmup_function:
+                    self.warmup_function(model)
+                size = self.size_function(model) if self.size_function else 0
+            except Exception as e:
+                LOGGER.warning(f'[Model Residency] Load model {index} failed: {str(e)}')
+                return None
+
+            with self.lock:
+                self.models[index] = (model, size)
+                evicted_indexes = self.evict(protected_index=index)
+            LOGGER.info(f'[Model Residency] Model {index} loaded in {time.time() - start_time:.2f}s '
+                        f'({size / 1e6:.1f}MB), resident models: {list(self.models)}')
+
+        if evicted_indexes:
+            LOGGER.info(f'[Model Residency] Evict models {evicted_indexes}')
+            if self.release_function:
+                self.release_function()
+        return model
+
+    def request(self, index: int, callback=None):
+        '''
+        Load the model of index in background, callback is called with the model when it is ready.
+        '''
+        with self.lock:
+            if index in self.pending_indexes and callback is None:
+                return
+            self.pending_indexes.add(index)
+        self.load_requests.put((index, callback))
+
+    def loop_load(self):
+        while True:
+            index, callback = self.load_requests.get()
+            model = self.load(index)
+            with self.lock:
+                self.pending_indexes.discard(index)
+            if callback and model is not None:
+                try:
+                    callback(model)
+                except Exception as e:
+                    LOGGER.warning(f'[Model Residency] Callback of model {index} failed: {str(e)}')
+
+    def update_priorities(self, priorities):
+        '''
+        Update how likely each model is to be chosen and prefetch the most likely models not resident.
+        '''
+        if len(priorities) != self.models_num:
+            return
+        with self.lock:
+            self.priorities = [float(priority) for priority in priorities]
+            resident_indexes = set(self.models) | self.pending_indexes
+
+        for index in self.get_likely_indexes():
+            if index not in resident_indexes:
+                self.request(index)
+
+    def get_likely_indexes(self):
+        '''
+        Indexes of models that should be resident: the pinned model and those of the highest priorities.
+        '''
+        with self.lock:
+            ranking = sorted(range(self.models_num), key=lambda index: self.priorities[index], reverse=True)
+            pinned_index = self.pinned_index
+        likely_indexes = [pinned_index] if pinned_index is not None else []
+        likely_indexes.extend(index for index in ranking if index != pinned_index)
+        return likely_indexes[:self.max_resident]
+
+    def evict(self, protected_index: int):
+        '''
+        Evict models until residency is within budget, called with lock held.
+        The candidates are ordered by priority, then by recency of use.
+        '''
+        evicted_indexes = []
+        while self.is_over_budget():
+            candidates = [index for index in self.models if index not in (protected_index, self.pinned_index)]
+            if not candidates:
+                break
+            # models are ordered from least to most recently used, min keeps the first of equal priorities
+            victim = min(candidates, key=lambda index: self.priorities[index])
+            del self.models[victim]
+            evicted_indexes.append(victim)
+        return evicted_indexes
+
+    def is_over_budget(self) -> bool:
+        if len(self.models) > self.max_resident:
+            return True
+        if self.memory_budget is not None:
+            return sum(size for _, size in self.models.values()) > self.memory_budget
+        return False
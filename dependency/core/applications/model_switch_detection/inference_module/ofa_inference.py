@@ -1,4 +1,6 @@
+import json
 import threading
+import zlib
 from .base_inference import BaseInference
 from typing import List
 import numpy as np
@@ -68,6 +70,11 @@ class OfaInference(BaseInference):
         
         self.current_model_index = None
         self.model_switch_lock = threading.Lock()
+        # reusable RGB buffer (batch, height, width, 3) of batched inference
+        self.batch_buffer = None
+        # resolutions (eg: 720p) and batch sizes of latency profile
+        self.profile_resolutions = kwargs.get('profile_resolutions', ['360p', '480p', '720p', '1080p'])
+        self.profile_batch_sizes = kwargs.get('profile_batch_sizes', [1])
         self._load_supernet()
         self._measure_initial_latencies()
 
@@ -88,29 +95,21 @@ class OfaInference(BaseInference):
         print(f'Switched to model: {self.current_model_index}.')
 
     def _measure_initial_latencies(self):
+        '''
+        Profile latencies of subnets at the resolutions and batch sizes to be inferred,
+        latency of each subnet is its profiled latency of single frame at the first resolution.
+        '''
         print("Measuring initial latencies...")
-        dummy_input = torch.rand(1, 3, 640, 640).to(torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu'))
-        
-        for idx in range(self.subnet_nums):
-            times = []
-            self.switch_model(idx)
-            # 预热
-            for _ in range(5):
-                with torch.no_grad():
-                    self.model(dummy_input)
-            
-            # 测量
-            for _ in range(10):
-                start_time = time.perf_counter()
-                with torch.no_grad():
-                    self.model(dummy_input)
-                times.append(time.perf_counter() - start_time)
-            self.subnet_latency.append(np.mean(times))
-            print(f'Subnet {idx} takes time: {self.subnet_latency[idx]}')
-
-    def switch_model(self, index: int):
+        self.profile_latencies(self.profile_resolutions, self.profile_batch_sizes)
+        self.subnet_latency = [self.latency_profile.get_latency(self.get_model_key(idx), self.profile_resolutions[0], 1)
+                               for idx in range(self.subnet_nums)]
+        for idx, latency in enumerate(self.subnet_latency):
+            print(f'Subnet {idx} takes time: {latency}')
+
+    def switch_model(self, index: int, wait: bool = False):
         '''
         Switch the model to the one specified in the arguments.
+        Subnets share the loaded supernet, so switching is always done in place.
         '''
         with self.model_switch_lock:
             if index >= self.subnet_nums or index < 0:
@@ -131,6 +130,13 @@ class OfaInference(BaseInference):
     
     def get_current_model_index(self):
         return self.current_model_index
+
+    def get_model_key(self, index: int) -> str:
+        '''
+        Get the key of the subnet in the latency profile, identified by its architecture.
+        '''
+        arch = json.dumps(self.subnet_archs[index], sort_keys=True)
+        return f'{self.ofa_det_type}-{zlib.crc32(arch.encode()):08x}'
     
     def get_models_num(self):
         '''
@@ -151,16 +157,63 @@ class OfaInference(BaseInference):
         labels = results['labels'][mask].cpu().numpy().tolist()
         scores = results['scores'][mask].cpu().numpy().tolist()
 
-        # start a new thread to update stats
-        update_stats_thread = threading.Thread(target=self.prepare_update_stats, args=(image, boxes, scores, labels, inference_latency))
-        update_stats_thread.start()
+        # stats are aggregated in background by stats manager
+        self.prepare_update_stats(image, boxes, scores, labels, inference_latency)
         return boxes, scores, labels
     
-    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency):
+    def infer_batch(self, images: List[np.ndarray], record_stats: bool = True):
+        '''
+        Do the inference on a batch of images in one forward pass,
+        the detector resizes and normalizes the batch and runs NMS per image itself.
+        '''
+        if not images:
+            return []
+
+        device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        batch = self.preprocess_batch(images, device)
+        with self.model_switch_lock:
+            start_time = time.perf_counter()
+            with torch.no_grad():
+                batch_results = self.model(batch)
+            # latency per frame, comparable with latency of single image inference
+            inference_latency = (time.perf_counter() - start_time) / len(images)
+            self.last_inference_latency = inference_latency
+
+        outputs = []
+        for image, results in zip(images, batch_results):
+            mask = results['scores'] > 0.3
+            boxes = results['boxes'][mask].cpu().numpy().tolist()
+            labels = results['labels'][mask].cpu().numpy().tolist()
+            scores = results['scores'][mask].cpu().numpy().tolist()
+            if record_stats:
+                self.prepare_update_stats(image, boxes, scores, labels, inference_latency, batch_size=len(images))
+            outputs.append((boxes, scores, labels))
+
+        return outputs
+
+    def preprocess_batch(self, images: List[np.ndarray], device):
+        '''
+        Convert BGR images into RGB float tensors.
+        Images of the same size are converted into a reusable buffer and moved to device as one tensor.
+        '''
+        if any(image.shape != images[0].shape for image in images):
+            return [self.preprocess_image(image)[0].to(device) for image in images]
+
+        height, width = images[0].shape[:2]
+        if self.batch_buffer is None or self.batch_buffer.shape[0] < len(images) \
+                or self.batch_buffer.shape[1:3] != (height, width):
+            self.batch_buffer = np.empty((len(images), height, width, 3), dtype=np.uint8)
+        batch = self.batch_buffer[:len(images)]
+        for index, image in enumerate(images):
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=batch[index])
+
+        return torch.from_numpy(batch).to(device).permute(0, 3, 1, 2).float() / 255
+
+    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency, batch_size=1):
         '''
         Prepare the stats for updating.
         '''
-        super().prepare_update_stats(image, boxes, scores, labels, inference_latency)    
+        super().prepare_update_stats(image, boxes, scores, labels, inference_latency, batch_size)
 
     def preprocess_image(self, raw_bgr_image):
 
@@ -1,6 +1,16 @@
-from dataclasses import dataclass
-from core.lib.common import Context
+from dataclasses import dataclass, fields
+from collections import deque
+import os
 import threading
+import time
+
+import cv2
+import numpy as np
+
+from core.lib.common import Context, LOGGER
+
+from .latency_profile import LatencyProfile
+
 
 @dataclass
 class StatsEntry:
@@ -12,7 +22,7 @@ class StatsEntry:
     cur_model_index: int = 0
     # The accuracy of the model
     cur_model_accuracy: float = 0.0
-    # The processing latency of the inference
+    # The processing latency of the inference (per frame, amortized over the batch)
     processing_latency: int = 0
     # The number of detected targets
     target_nums: int = 0
@@ -28,6 +38,10 @@ class StatsEntry:
     brightness: float = 0.0
     # The contrast of the image
     contrast: float = 0.0
+    # The number of frames inferred together with the image
+    batch_size: int = 1
+    # The resolution of the image (eg: 720p)
+    resolution: str = ''
 
     def __str__(self) -> str:
         return (
@@ -36,7 +50,8 @@ class StatsEntry:
             f"  Queue Length: {self.queue_length}\n"
             f"  Model Index: {self.cur_model_index}\n"
             f"  Model Accuracy: {self.cur_model_accuracy:.2f}\n"
-            f"  Processing Latency: {self.processing_latency:.4f}s\n"
+            f"  Processing Latency: {self.processing_latency:.4f}s (batch size: {self.batch_size}, "
+            f"resolution: {self.resolution})\n"
             f"  Targets: {self.target_nums}\n"
             f"  Confidence: {self.avg_confidence:.2f}±{self.std_confidence:.2f}\n"
             f"  Size: {self.avg_size:.2f}±{self.std_size:.2f}\n"
@@ -44,31 +59,135 @@ class StatsEntry:
         )
     
 class StatsManager:
-    def __init__(self, time_window: int = 30.0):
-        # initialize a deque to store the stats
-        from collections import deque
+    '''
+    Stats of inferences aggregated by a single background thread.
+
+    Inference threads only put raw records (shape and small strided copy of image, detections, latency)
+    into a bounded ring buffer, so that buffered records never hold full frames,
+    the oldest records are dropped if the aggregator falls behind.
+    The aggregator computes stats entries (image stats on the small copy), keeps entries of the latest
+    `time_window` seconds for switchers and appends new entries to the snapshot file every `flush_interval` seconds.
+    Each new entry is also passed to `latency_hook` (eg: refining the latency profile of the detector).
+    '''
+
+    COLUMNS = [field.name for field in fields(StatsEntry)]
+
+    def __init__(self, time_window: float = 30.0, buffer_size: int = 256, flush_interval: float = 1.0,
+                 image_width: int = 160, snapshot_format: str = 'csv', queue_length_hook=None,
+                 latency_hook=None):
         self.stats = deque()
         self.time_window = time_window
         self.lock = threading.Lock()
 
+        # raw records waiting for aggregation, appending and popping of deque are atomic
+        self.records = deque(maxlen=buffer_size)
+        self.image_width = image_width
+        # function returning current queue length of processor (None if unavailable)
+        self.queue_length_hook = queue_length_hook
+        # function taking each new stats entry
+        self.latency_hook = latency_hook
+
+        self.flush_interval = flush_interval
+        self.snapshot_format = snapshot_format
+        self.snapshot_path = Context.get_file_path(f'stats.{snapshot_format}')
+        self.unflushed_stats = []
+        self.flush_count = 0
+
+        threading.Thread(target=self.loop_aggregate, daemon=True).start()
+
+    def submit(self, image: np.ndarray, boxes, scores, inference_latency, model_index, model_accuracy,
+               batch_size: int = 1):
+        '''
+        Put raw record of an inference, called in the inference thread.
+        Only a strided copy of image (about `image_width` pixels wide) is kept, enough for brightness / contrast.
+        '''
+        step = max(image.shape[1] // self.image_width, 1)
+        small_image = np.ascontiguousarray(image[::step, ::step])
+        self.records.append((time.time(), image.shape[:2], small_image, boxes, scores, inference_latency,
+                             model_index, model_accuracy, batch_size))
+
+    def loop_aggregate(self):
+        flush_time = time.time()
+        while True:
+            if self.records:
+                try:
+                    entry = self.build_entry(*self.records.popleft())
+                    self.update_stats(entry)
+                    if self.latency_hook:
+                        self.latency_hook(entry)
+                except Exception as e:
+                    LOGGER.warning(f'[Stats Manager] Build stats entry failed: {str(e)}')
+            else:
+                time.sleep(0.01)
+
+            if time.time() - flush_time >= self.flush_interval:
+                self.flush_snapshot()
+                flush_time = time.time()
+
+    def build_entry(self, timestamp, image_shape, small_image, boxes, scores, inference_latency, model_index,
+                    model_accuracy, batch_size):
+        stats_entry = StatsEntry()
+        stats_entry.timestamp = timestamp
+        queue_length = self.queue_length_hook() if self.queue_length_hook else None
+        stats_entry.queue_length = int(queue_length) if queue_length is not None else 0
+        stats_entry.cur_model_index = model_index
+        stats_entry.cur_model_accuracy = model_accuracy
+        stats_entry.processing_latency = inference_latency
+        stats_entry.batch_size = batch_size
+        stats_entry.resolution = LatencyProfile.get_resolution_key(image_shape)
+        stats_entry.target_nums = len(boxes)
+        if len(boxes) > 0:
+            stats_entry.avg_confidence = float(np.mean(scores))
+            stats_entry.std_confidence = float(np.std(scores))
+
+            # relative size of targets (sqrt of box area / image area)
+            image_height, image_width = image_shape
+            boxes = np.asarray(boxes, dtype=np.float64)
+            box_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            relative_sizes = np.sqrt(box_areas / (image_height * image_width))
+            stats_entry.avg_size = float(np.mean(relative_sizes))
+            stats_entry.std_size = float(np.std(relative_sizes))
+
+        gray_image = cv2.cvtColor(small_image, cv2.COLOR_BGR2GRAY) if small_image.ndim == 3 else small_image
+        stats_entry.brightness = float(np.mean(gray_image))
+        stats_entry.contrast = float(np.std(gray_image))
+        return stats_entry
+
     def update_stats(self, entry: StatsEntry):
         '''
         Update the stats.
-        Called when a new inference is done.
         Remove the outdated stats and append the new stats.
         '''
-        # append the new stats
-        self.stats.append(entry)
-        # remove the outdated stats
-        while self.stats and entry.timestamp - self.stats[0].timestamp > self.time_window:
-            self.stats.popleft()
-
-        result_path = Context.get_file_path('stats.csv')
-        # 现有结果写入一个文件, csv格式
-        with open(result_path, 'w') as f:
-            f.write('timestamp,queue_length,cur_model_index,cur_model_accuracy,processing_latency,target_nums,avg_confidence,std_confidence,avg_size,std_size,brightness,contrast\n')
-            for entry in self.stats:
-                f.write(f'{entry.timestamp},{entry.queue_length},{entry.cur_model_index},{entry.cur_model_accuracy},{entry.processing_latency},{entry.target_nums},{entry.avg_confidence},{entry.std_confidence},{entry.avg_size},{entry.std_size},{entry.brightness},{entry.contrast}\n')
+        with self.lock:
+            self.stats.append(entry)
+            while self.stats and entry.timestamp - self.stats[0].timestamp > self.time_window:
+                self.stats.popleft()
+        self.unflushed_stats.append(entry)
+
+    def flush_snapshot(self):
+        '''
+        Append stats entries since the last flush to the snapshot file.
+        csv entries are appended to one file, parquet entries are written as one part file per flush.
+        '''
+        if not self.unflushed_stats:
+            return
+        entries, self.unflushed_stats = self.unflushed_stats, []
+        rows = [[getattr(entry, column) for column in self.COLUMNS] for entry in entries]
+
+        try:
+            if self.snapshot_format == 'parquet':
+                import pandas as pd
+                base_path, _ = os.path.splitext(self.snapshot_path)
+                pd.DataFrame(rows, columns=self.COLUMNS).to_parquet(f'{base_path}-{self.flush_count:06d}.parquet')
+            else:
+                write_header = not os.path.exists(self.snapshot_path)
+                with open(self.snapshot_path, 'a') as f:
+                    if write_header:
+                        f.write(','.join(self.COLUMNS) + '\n')
+                    f.writelines(','.join(str(value) for value in row) + '\n' for row in rows)
+            self.flush_count += 1
+        except Exception as e:
+            LOGGER.warning(f'[Stats Manager] Write stats snapshot failed: {str(e)}')
 
     def get_latest_stats(self, nums: int = 1):
         '''
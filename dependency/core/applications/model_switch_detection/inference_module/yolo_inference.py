@@ -1,5 +1,6 @@
 import threading
 from .base_inference import BaseInference
+from .model_residency import ModelResidencyManager
 from typing import List
 import numpy as np
 import os
@@ -8,6 +9,7 @@ cur_dir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(f"{cur_dir}/yolov5")
 from models.common import AutoShape
 from models.experimental import attempt_load
+from utils.general import non_max_suppression, scale_boxes, make_divisible
 import torch
 import warnings
 import time
@@ -20,7 +22,7 @@ warnings.filterwarnings("ignore")
 class YoloInference(BaseInference):
     def __init__(self, *args, **kwargs):
         '''
-        Load all models, do all the necessary initializations.
+        Load the initial model, do all the necessary initializations.
         '''
         super().__init__(*args, **kwargs)
         # models should be a sorted list of pareto optimal models, so that the switcher can switch between them.
@@ -31,74 +33,124 @@ class YoloInference(BaseInference):
         self.model_latency = []
         # ema_alpha for model latency updates
         self.ema_alpha = 0.2
-        self.models = []
         # assert 'weights_dir' in kwargs, 'weights_dir not provided'
         self.weights_dir = kwargs['weights_dir']
         # for model_name in self.allowed_yolo_models:
         #     model_path = f"{self.weights_dir}/{model_name}.pt"
         #     assert os.path.exists(model_path), f"Model weights file not found: {model_path}"
         self.current_model_index = None
+        # model index requested by the latest switch, served once the model is resident
+        self.target_model_index = None
         self.model_switch_lock = threading.Lock()
-        self._load_all_models()
+        # at most `max_resident_models` models (and `model_memory_budget` MB of weights if set) are kept loaded
+        memory_budget = kwargs.get('model_memory_budget')
+        self.residency = ModelResidencyManager(len(self.allowed_yolo_models),
+                                               load_function=self._load_model,
+                                               warmup_function=self._warmup_model,
+                                               size_function=self._get_model_size,
+                                               release_function=self._release_memory,
+                                               max_resident=kwargs.get('max_resident_models', 2),
+                                               memory_budget=memory_budget * 1e6 if memory_budget else None)
+        # inference size and reusable letterbox buffer (batch, height, width, 3) of batched inference
+        self.inference_size = kwargs.get('inference_size', 640)
+        self.batch_buffer = None
+        # resolutions (eg: 720p) and batch sizes of latency profile
+        self.profile_resolutions = kwargs.get('profile_resolutions', ['360p', '480p', '720p', '1080p'])
+        self.profile_batch_sizes = kwargs.get('profile_batch_sizes', [1])
+        self._load_initial_models()
         self._measure_initial_latencies()
 
-    def _load_all_models(self):
-        print('Loading all YOLOv5 models...')
-        for model_name in self.allowed_yolo_models:
-            # model_path = f"{self.weights_dir}/{model_name}.pt"
-            relative_model_path = f"{self.weights_dir}/{model_name}.pt"
-            model_path = Context.get_file_path(relative_model_path)
-            try:
-                print(f'Loading model: {model_name}...')
-                model = attempt_load(model_path)
-                model = AutoShape(model)
-                model.eval()
-                if torch.cuda.is_available():
-                    model = model.cuda()
-                self.models.append(model)
-                print(f'Model loaded: {model_name}.')
-            except Exception as e:
-                print(f'Error loading model {model_name}: {str(e)}!')
-            
-        print('All models loaded.')
+    def _load_initial_models(self):
+        '''
+        Load the first model to serve inference, the others are loaded on demand by the residency manager.
+        '''
+        print('Loading initial YOLOv5 model...')
+        model = self.residency.load(0)
+        assert model is not None, f'Initial model {self.allowed_yolo_models[0]} is not loaded'
         with self.model_switch_lock:
             self.current_model_index = 0
+            self.target_model_index = 0
+            self.residency.pin(0)
         print(f'Switched to model: {self.allowed_yolo_models[self.current_model_index]}.')
 
+    def _load_model(self, index: int):
+        model_name = self.allowed_yolo_models[index]
+        relative_model_path = f"{self.weights_dir}/{model_name}.pt"
+        model_path = Context.get_file_path(relative_model_path)
+        print(f'Loading model: {model_name}...')
+        model = attempt_load(model_path)
+        model = AutoShape(model)
+        model.eval()
+        if torch.cuda.is_available():
+            model = model.cuda()
+        print(f'Model loaded: {model_name}.')
+        return model
+
+    def _warmup_model(self, model):
+        dummy_input = np.zeros((self.inference_size, self.inference_size, 3), dtype=np.uint8)
+        with torch.no_grad():
+            model(dummy_input)
+
+    @staticmethod
+    def _get_model_size(model):
+        return sum(tensor.numel() * tensor.element_size() for tensor in [*model.parameters(), *model.buffers()])
+
+    @staticmethod
+    def _release_memory():
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
     def _measure_initial_latencies(self):
+        '''
+        Profile latencies of models at the resolutions and batch sizes to be inferred,
+        latency of each model starts from its profiled latency of single frame at the first resolution.
+        '''
         print("Measuring initial latencies...")
-        dummy_input = np.random.randint(0, 255, (640, 640, 3), dtype=np.uint8)
-        
-        for idx, model in enumerate(self.models):
-            times = []
-            # 预热
-            for _ in range(5):
-                model(dummy_input)
-            
-            # 测量
-            for _ in range(10):
-                start_time = time.perf_counter()
-                with torch.no_grad():
-                    model(dummy_input)
-                times.append(time.perf_counter() - start_time)
-            self.model_latency.append(np.mean(times))
-            print(f'Model {idx} takes time: {self.model_latency[idx]}')
-
-    def switch_model(self, index: int):
+        self.profile_latencies(self.profile_resolutions, self.profile_batch_sizes)
+        self.model_latency = [self.latency_profile.get_latency(self.get_model_key(idx), self.profile_resolutions[0], 1)
+                              for idx in range(len(self.allowed_yolo_models))]
+        for idx, latency in enumerate(self.model_latency):
+            print(f'Model {idx} takes time: {latency}')
+
+    def switch_model(self, index: int, wait: bool = False):
         '''
         Switch the model to the one specified in the arguments.
+        A resident model is switched to at once, otherwise the current model keeps serving inference
+        until the model is loaded in background (or loaded in place if wait is True).
         '''
+        if index >= len(self.allowed_yolo_models) or index < 0:
+            raise ValueError('Invalid model index')
         with self.model_switch_lock:
-            if index >= len(self.models) or index < 0:
-                raise ValueError('Invalid model index')
+            self.target_model_index = index
+
+        if self.residency.is_resident(index):
+            self._activate_model(index)
+        elif wait:
+            if self.residency.load(index) is not None:
+                self._activate_model(index)
+        else:
+            print(f'Model {self.allowed_yolo_models[index]} is not resident, loading in background')
+            self.residency.request(index, callback=lambda model: self._activate_model(index))
+
+    def _activate_model(self, index: int):
+        with self.model_switch_lock:
+            # a later switch supersedes the model loaded for an earlier one
+            if self.target_model_index != index or not self.residency.pin_if_resident(index):
+                return
             self.current_model_index = index
-            print(f'Switched to model: {self.allowed_yolo_models[self.current_model_index]}')
+        print(f'Switched to model: {self.allowed_yolo_models[index]}')
+
+    def update_model_priorities(self, priorities):
+        '''
+        Keep the models most likely to be switched to resident.
+        '''
+        self.residency.update_priorities(priorities)
 
     def get_models_num(self):
         '''
         Get the number of models.
         '''
-        return len(self.models)
+        return len(self.allowed_yolo_models)
     
     def get_models_accuracy(self):
         '''
@@ -120,31 +172,109 @@ class YoloInference(BaseInference):
         '''
         return self.current_model_index
 
+    def get_model_key(self, index: int) -> str:
+        '''
+        Get the key of the model in the latency profile.
+        '''
+        return self.allowed_yolo_models[index]
+
     def infer(self, image: np.ndarray):
         '''
         Do the inference on the image.
         '''
         with self.model_switch_lock:
-            model = self.models[self.current_model_index]
+            # the current model is pinned, so it is always resident
+            model = self.residency.get(self.current_model_index)
             start_time = time.perf_counter()
             with torch.no_grad():
                 results = model(image)
             inference_latency = time.perf_counter() - start_time
-            # use ema to update latency
-            self.model_latency[self.current_model_index] = self.ema_alpha * inference_latency + (1 - self.ema_alpha) * self.model_latency[self.current_model_index]
+            self._update_model_latency(inference_latency)
             boxes, scores, labels = self.process_results(results)
         
-        # start a new thread to update stats
-        update_stats_thread = threading.Thread(target=self.prepare_update_stats, args=(image, boxes, scores, labels, inference_latency))
-        update_stats_thread.start()
+        # stats are aggregated in background by stats manager
+        self.prepare_update_stats(image, boxes, scores, labels, inference_latency)
         
         return boxes, scores, labels
     
-    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency):
+    def infer_batch(self, images: List[np.ndarray], record_stats: bool = True):
+        '''
+        Do the inference on a batch of images in one forward pass:
+        letterbox images into a reusable buffer, run the model on the stacked tensor and do batched NMS.
+        '''
+        if not images:
+            return []
+
+        with self.model_switch_lock:
+            model = self.residency.get(self.current_model_index)
+            param = next(model.parameters())
+            batch, image_shapes, inference_shape = self.letterbox_batch(images, model.stride)
+
+            start_time = time.perf_counter()
+            with torch.no_grad():
+                x = torch.from_numpy(batch).to(param.device).permute(0, 3, 1, 2).type_as(param) / 255
+                predictions = model.model(x)
+                predictions = non_max_suppression(predictions if model.dmb else predictions[0],
+                                                  model.conf, model.iou, model.classes, model.agnostic,
+                                                  model.multi_label, max_det=model.max_det)
+            # latency per frame, comparable with latency of single image inference
+            inference_latency = (time.perf_counter() - start_time) / len(images)
+            self.last_inference_latency = inference_latency
+            if record_stats:
+                self._update_model_latency(inference_latency)
+
+        outputs = []
+        for image, image_shape, prediction in zip(images, image_shapes, predictions):
+            scale_boxes(inference_shape, prediction[:, :4], image_shape)
+            prediction = prediction.cpu().numpy()
+            boxes, scores, labels = prediction[:, :4].tolist(), prediction[:, 4].tolist(), prediction[:, 5].tolist()
+            if record_stats:
+                self.prepare_update_stats(image, boxes, scores, labels, inference_latency, batch_size=len(images))
+            outputs.append((boxes, scores, labels))
+
+        return outputs
+
+    def _update_model_latency(self, inference_latency):
+        '''
+        Use ema to update latency of the current model (set directly if the model is never profiled).
+        '''
+        latency = self.model_latency[self.current_model_index]
+        self.model_latency[self.current_model_index] = inference_latency if latency is None else \
+            self.ema_alpha * inference_latency + (1 - self.ema_alpha) * latency
+
+    def letterbox_batch(self, images: List[np.ndarray], stride):
+        '''
+        Resize images keeping ratio and pad them into the shared inference shape (same as AutoShape).
+        Returns the filled part of the letterbox buffer, original shapes of images and the inference shape.
+        '''
+        image_shapes = [image.shape[:2] for image in images]
+        gains = [self.inference_size / max(shape) for shape in image_shapes]
+        scaled_shapes = np.array([[int(y * gain) for y in shape] for shape, gain in zip(image_shapes, gains)])
+        inference_shape = [make_divisible(x, stride) for x in scaled_shapes.max(0)]
+        height, width = inference_shape
+
+        # buffer is reallocated only if batch grows or inference shape changes
+        if self.batch_buffer is None or self.batch_buffer.shape[0] < len(images) \
+                or self.batch_buffer.shape[1:3] != (height, width):
+            self.batch_buffer = np.empty((len(images), height, width, 3), dtype=np.uint8)
+        batch = self.batch_buffer[:len(images)]
+        batch.fill(114)
+
+        for index, (image, (image_height, image_width)) in enumerate(zip(images, image_shapes)):
+            ratio = min(height / image_height, width / image_width)
+            resized_width, resized_height = round(image_width * ratio), round(image_height * ratio)
+            top, left = round((height - resized_height) / 2 - 0.1), round((width - resized_width) / 2 - 0.1)
+            if (resized_width, resized_height) != (image_width, image_height):
+                image = cv2.resize(image, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+            batch[index, top:top + resized_height, left:left + resized_width] = image[..., :3]
+
+        return batch, image_shapes, inference_shape
+
+    def prepare_update_stats(self, image: np.ndarray, boxes, scores, labels, inference_latency, batch_size=1):
         '''
         Prepare the stats for updating.
         '''
-        super().prepare_update_stats(image, boxes, scores, labels, inference_latency)
+        super().prepare_update_stats(image, boxes, scores, labels, inference_latency, batch_size)
 
         
     def process_results(self, results):
@@ -86,6 +86,7 @@ class LSTMActorCritic(nn.Module):
         
         # 前向传播获取动作概率和状态价值
         action_probs, state_value = self(state)
+        self.latest_action_probs = action_probs.detach().cpu()
         
         print(f"Action probs: {action_probs}")
         
@@ -216,7 +217,7 @@ class ACSwitch(BaseSwitch):
                         stats_dict = self.stats_entry_to_dict(current_stats[0])
                         if stats_dict.get('queue_length', 0) >= self.queue_high_threshold_length:
                             emergency_mode = True
-                            # 选择最轻量的模型（索引0）
+                            # 选择最轻量的模型
                             self.handle_emergency()
                             time.sleep(self.decision_interval)
                             continue
@@ -226,7 +227,9 @@ class ACSwitch(BaseSwitch):
                         current_state = self.preprocess_stats(stats_list)
                         
                         # 如果有上一个动作和状态，计算奖励并进行学习
-                        if self.previous_action is not None and self.previous_state is not None and current_stats and current_stats[0]:
+                        # 所选模型仍在后台加载时，统计数据来自其他模型，不将其奖励计入该动作
+                        if self.previous_action is not None and self.previous_state is not None and current_stats and current_stats[0] \
+                                and current_stats[0].cur_model_index == self.previous_action:
                             # 计算奖励
                             stats_dict = self.stats_entry_to_dict(current_stats[0])
                             reward = self.calculate_reward(stats_dict)
@@ -290,8 +293,11 @@ class ACSwitch(BaseSwitch):
 
     def handle_emergency(self):
         """处理紧急情况，如队列长度超过最大阈值"""
-        # 紧急情况下选择最轻量的模型（索引0）
-        selected_model = 0
+        # 紧急情况下选择当前分辨率和批大小下画像延迟最低的模型，未画像时选择索引0
+        current_stats = self.get_detector_stats()
+        profiled_latencies = self.get_profiled_latencies(current_stats[0] if current_stats else None)
+        profiled_models = [index for index, latency in enumerate(profiled_latencies) if latency is not None]
+        selected_model = min(profiled_models, key=lambda index: profiled_latencies[index]) if profiled_models else 0
         self.switch_model(selected_model)
         self.current_model_index = selected_model
         print(f"EMERGENCY: Queue length exceeded threshold. Selecting lightest model: {selected_model}")
@@ -308,6 +314,7 @@ class ACSwitch(BaseSwitch):
             'cur_model_index': stats.cur_model_index,
             'cur_model_accuracy': stats.cur_model_accuracy,
             'processing_latency': stats.processing_latency,
+            'batch_size': stats.batch_size,
             'target_nums': stats.target_nums,
             'avg_confidence': stats.avg_confidence,
             'std_confidence': stats.std_confidence,
@@ -382,6 +389,8 @@ class ACSwitch(BaseSwitch):
         """选择动作（模型）"""
         with torch.no_grad():
             action_idx, log_prob, state_value = self.network.act(state, exploration_rate=self.exploration_rate)
+        # 动作概率高的模型由检测器预先加载
+        self.detector_instance.update_model_priorities(self.network.latest_action_probs[0].tolist())
         
         # 衰减探索率
         self.exploration_rate = max(self.exploration_rate * self.exploration_decay, 
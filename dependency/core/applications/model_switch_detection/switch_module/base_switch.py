@@ -26,4 +26,13 @@ class BaseSwitch(ABC):
         '''
         Get the stats at intervals for switch decision.
         '''
-        pass
\ No newline at end of file
+        pass
+
+    def get_profiled_latencies(self, stats_entry=None):
+        '''
+        Get the profiled per-frame latency of all models at the resolution and batch size of the stats entry
+        (the latest inference if None), None for models never profiled.
+        '''
+        if stats_entry is None or not stats_entry.resolution:
+            return self.detector_instance.get_profiled_latencies()
+        return self.detector_instance.get_profiled_latencies(stats_entry.resolution, stats_entry.batch_size)
@@ -92,7 +92,9 @@ class CMABSwitch(BaseSwitch):
                 # 获取当前统计数据以计算奖励
                 current_stats = self.get_detector_stats()
                 
-                if current_stats and self.last_selected_arm is not None and self.last_context is not None:
+                # 所选模型仍在后台加载时，统计数据来自其他模型，不将其奖励计入所选的臂
+                if current_stats and self.last_selected_arm is not None and self.last_context is not None \
+                        and current_stats[0].cur_model_index == self.last_selected_arm:
                     # 将StatsEntry转换为字典用于奖励计算
                     stats_dict = self.stats_entry_to_dict(current_stats[0])
                     
@@ -105,9 +107,11 @@ class CMABSwitch(BaseSwitch):
                 # 提取当前上下文特征
                 if current_stats:
                     context = self.extract_features(current_stats[0])
+                    # 每个臂的上下文使用该模型在当前分辨率和批大小下的画像延迟
+                    arm_contexts = self.get_arm_contexts(context, current_stats[0])
                     
                     # 使用Thompson采样选择新臂
-                    selected_arm = self.select_model_thompson_sampling(context)
+                    selected_arm = self.select_model_thompson_sampling(arm_contexts)
                     
                     # 切换到所选模型
                     self.switch_model(selected_arm)
@@ -115,7 +119,7 @@ class CMABSwitch(BaseSwitch):
                     
                     # 更新追踪变量
                     self.last_selected_arm = selected_arm
-                    self.last_context = context
+                    self.last_context = arm_contexts[selected_arm]
                     self.last_switch_time = current_time
                     
                     # 打印当前臂的统计信息
@@ -152,6 +156,20 @@ class CMABSwitch(BaseSwitch):
             
         return features
 
+    def get_arm_contexts(self, context, stats_entry):
+        """
+        为每个臂构造上下文: 延迟特征(feature_1)替换为该模型的画像延迟,
+        未画像的模型沿用当前模型的实测延迟
+        """
+        profiled_latencies = self.get_profiled_latencies(stats_entry)
+        arm_contexts = []
+        for arm in range(self.models_num):
+            arm_context = context.copy()
+            if profiled_latencies[arm] is not None:
+                arm_context[1] = float(profiled_latencies[arm])
+            arm_contexts.append(arm_context)
+        return arm_contexts
+
     def sample_parameter(self, arm):
         """从模型的后验分布中采样参数向量"""
         model_data = self.models[arm]
@@ -173,8 +191,8 @@ class CMABSwitch(BaseSwitch):
             # 如果采样失败，返回均值向量
             return model_data['mu']
 
-    def select_model_thompson_sampling(self, context):
-        """使用Thompson Sampling策略选择模型"""
+    def select_model_thompson_sampling(self, arm_contexts):
+        """使用Thompson Sampling策略选择模型, arm_contexts为每个臂的上下文"""
         # 检查是否是强制探索回合
         self.exploration_counter += 1
         force_exploration = self.exploration_counter >= self.force_exploration_count
@@ -204,11 +222,13 @@ class CMABSwitch(BaseSwitch):
             sampled_params[arm] = theta
             
             # 计算期望奖励
-            expected_reward = np.dot(theta, context)
+            expected_reward = np.dot(theta, arm_contexts[arm])
             expected_rewards[arm] = float(expected_reward)  # 确保是Python浮点数
         
         # 选择期望奖励最高的模型
         selected_arm = max(expected_rewards, key=expected_rewards.get)
+        # 期望奖励高的模型更可能被选择，由检测器预先加载
+        self.detector_instance.update_model_priorities([expected_rewards[arm] for arm in range(self.models_num)])
         
         print(f"Thompson sampling选择模型: {selected_arm} (期望奖励={expected_rewards[selected_arm]:.4f})")
         
@@ -297,6 +317,7 @@ class CMABSwitch(BaseSwitch):
             'cur_model_index': stats_entry.cur_model_index,
             'cur_model_accuracy': stats_entry.cur_model_accuracy,
             'processing_latency': stats_entry.processing_latency,
+            'batch_size': stats_entry.batch_size,
             'target_nums': stats_entry.target_nums,
             'avg_confidence': stats_entry.avg_confidence,
             'std_confidence': stats_entry.std_confidence,
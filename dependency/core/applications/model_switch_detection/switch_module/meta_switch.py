@@ -5,6 +5,21 @@ import numpy as np
 from scipy import linalg
 import numpy as np
 
+
+def get_lighter_model(stats, current_model_index):
+    """
+    降级时选择的模型: 当前分辨率和批大小下画像延迟低于当前模型的模型中索引最高(最准确)的一个,
+    没有延迟画像时退化为相邻的低一级模型
+    """
+    model_latencies = stats.get('model_latencies')
+    if model_latencies and model_latencies[current_model_index] is not None:
+        current_latency = model_latencies[current_model_index]
+        for index in range(current_model_index - 1, -1, -1):
+            if model_latencies[index] is not None and model_latencies[index] < current_latency:
+                return index
+    return current_model_index - 1
+
+
 class DummyStrategy:
     """占位符策略类，将被实际的策略实现替换"""
     
@@ -48,7 +63,7 @@ class QueueLengthStrategy:
             
             # 如果有更轻量级的模型可用，则降级
             if current_model_index > 0:
-                next_model = current_model_index - 1
+                next_model = get_lighter_model(stats, current_model_index)
                 print(f"队列长度({queue_length})超过阈值({self.queue_threshold})。从模型{current_model_index}降级到{next_model}")
                 return next_model
             else:
@@ -164,7 +179,7 @@ class ProbabilisticStrategy:
         elif random_value < upgrade_probability + downgrade_probability:
             # 触发降级
             if current_model_index > 0:
-                next_model = current_model_index - 1
+                next_model = get_lighter_model(stats, current_model_index)
                 print(f"概率策略 - 随机值({random_value:.2f}) < 降级概率({downgrade_probability:.2f})，降级至模型 {next_model}")
                 self.stability_counter = 0  # 重置稳定计数器
                 return next_model
@@ -276,7 +291,7 @@ class DistributionBasedStrategy:
             
             if self.downgrade_counter >= self.stability_threshold:
                 if current_model_index > 0:
-                    next_model = current_model_index - 1
+                    next_model = get_lighter_model(stats, current_model_index)
                     print(f"持续需要降级，切换至模型 {next_model}")
                     self.downgrade_counter = 0
                     return next_model
@@ -406,12 +421,16 @@ class MetaSwitch(BaseSwitch):
                     
                     # 使用选定的策略获取模型建议
                     stats_dict = self.stats_entry_to_dict(current_stats[0])
+                    stats_dict['model_latencies'] = self.get_profiled_latencies(current_stats[0])
                     current_model_idx = stats_dict['cur_model_index']
                     selected_arm = self.strategies[selected_strategy].select_model(stats_dict, current_model_idx)
                     
                     # 切换到所选模型
                     self.switch_model(selected_arm)
                     print(f'MetaSwitch: strategy {selected_strategy} switched model to {selected_arm}')
+                    # 基础策略每次只升降一级，与所选模型相邻的模型更可能被选择
+                    self.detector_instance.update_model_priorities(
+                        [-abs(index - selected_arm) for index in range(self.models_num)])
                     
                     # 更新追踪变量
                     self.last_selected_strategy = selected_strategy
@@ -598,6 +617,7 @@ class MetaSwitch(BaseSwitch):
             'cur_model_index': stats_entry.cur_model_index,
             'cur_model_accuracy': stats_entry.cur_model_accuracy,
             'processing_latency': stats_entry.processing_latency,
+            'batch_size': stats_entry.batch_size,
             'target_nums': stats_entry.target_nums,
             'avg_confidence': stats_entry.avg_confidence,
             'std_confidence': stats_entry.std_confidence,
@@ -0,0 +1,149 @@
+import threading
+import time
+
+from core.lib.common import LOGGER
+from core.lib.network import NodeInfo, PortInfo, merge_address, NetworkAPIPath, NetworkAPIMethod, http_request
+
+
+class TokenBucket:
+    """tokens are refilled at `rate` per second up to `burst`, each admitted task takes one token"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.update_time = time.time()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.update_time) * self.rate)
+        self.update_time = now
+
+    def reserve(self, max_wait: float):
+        """
+        take a token, return seconds to wait before the token is available,
+        or None (no token taken) if the waiting would be longer than max_wait
+        """
+        self.refill(time.time())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        if self.rate <= 0:
+            return None
+
+        wait_time = (1 - self.tokens) / self.rate
+        if wait_time > max_wait:
+            return None
+        # token is reserved in advance, later tasks wait for refilling after it
+        self.tokens -= 1
+        return wait_time
+
+
+class AdmissionController:
+    """
+    admission of tasks to local services with backpressure from processors
+
+    processors advertise queue length and service rate (fetched at most once every `refresh_interval` seconds).
+    a task is shed if the queue of its service holds `max_queue_length` tasks,
+    otherwise it takes a token from the bucket of its source, refilled at an equal share of the service rate
+    among sources active in the latest `active_time` seconds; without token it is deferred up to `max_defer`
+    seconds or shed. tasks that must not be lost (`sheddable` is False) are never shed, only deferred.
+    deferring is left to the caller (eg: re-submitting the task by a timer), admission never blocks.
+
+    congestion of a source (0~1) is the larger of the moving average of its shedding decisions,
+    the queue pressure of its latest service and the congestion reported by downstream controllers,
+    and is returned to the upstream (generator or controller) as signal to reduce its load.
+    """
+
+    def __init__(self, max_queue_length: int = 10, burst: float = 2, max_defer: float = 0.5,
+                 refresh_interval: float = 1, active_time: float = 5, congestion_weight: float = 0.2):
+        self.max_queue_length = max_queue_length
+        self.burst = burst
+        self.max_defer = max_defer
+        self.refresh_interval = refresh_interval
+        self.active_time = active_time
+        self.congestion_weight = congestion_weight
+
+        self.local_device = NodeInfo.get_local_device()
+
+        # service -> (fetch time, load of service or None if unavailable)
+        self.service_loads = {}
+        # (source id, service) -> token bucket
+        self.buckets = {}
+        # service -> {source id: latest admission time}
+        self.active_sources = {}
+        # source id -> [moving average of shedding, queue pressure, downstream congestion, downstream report time]
+        self.congestions = {}
+
+        self.lock = threading.Lock()
+
+    def admit(self, source_id: int, service: str, sheddable: bool = True):
+        """
+        decide whether task of source is sent to local service,
+        return seconds to defer the task before sending (0 to send at once), or None if the task is shed
+        """
+        load = self.get_service_load(service)
+        if load is None:
+            self.record_decision(source_id, True, 0)
+            return 0
+
+        queue_pressure = min(load['queue_length'] / self.max_queue_length, 1) if self.max_queue_length > 0 else 0
+        if queue_pressure >= 1 and sheddable:
+            self.record_decision(source_id, False, queue_pressure)
+            return None
+
+        with self.lock:
+            now = time.time()
+            sources = self.active_sources.setdefault(service, {})
+            sources[source_id] = now
+            for inactive_source in [sid for sid, admit_time in sources.items() if now - admit_time > self.active_time]:
+                del sources[inactive_source]
+
+            bucket = self.buckets.setdefault((source_id, service), TokenBucket(0, self.burst))
+            bucket.refill(now)
+            bucket.rate = load['service_rate'] / len(sources)
+            # service rate is unknown before processor finishes its first task
+            wait_time = bucket.reserve(self.max_defer if sheddable else float('inf')) if bucket.rate > 0 else 0
+
+        self.record_decision(source_id, wait_time is not None, queue_pressure)
+        return wait_time
+
+    def get_service_load(self, service: str):
+        with self.lock:
+            fetch_time, load = self.service_loads.get(service, (0, None))
+        if time.time() - fetch_time < self.refresh_interval:
+            return load
+
+        load = None
+        service_port = PortInfo.get_service_port(service)
+        if service_port:
+            load = http_request(merge_address(NodeInfo.hostname2ip(self.local_device),
+                                              port=service_port,
+                                              path=NetworkAPIPath.PROCESSOR_LOAD),
+                                method=NetworkAPIMethod.PROCESSOR_LOAD,
+                                timeout=1)
+        if load is None:
+            LOGGER.debug(f'[Admission Control] Load of service {service} is unavailable, admit tasks directly.')
+
+        with self.lock:
+            self.service_loads[service] = (time.time(), load)
+        return load
+
+    def record_decision(self, source_id: int, admitted: bool, queue_pressure: float):
+        with self.lock:
+            congestion = self.congestions.setdefault(source_id, [0, 0, 0, 0])
+            congestion[0] += self.congestion_weight * ((0 if admitted else 1) - congestion[0])
+            congestion[1] = queue_pressure
+
+    def report_congestion(self, source_id: int, level: float):
+        """congestion of source reported by downstream controller"""
+        with self.lock:
+            congestion = self.congestions.setdefault(source_id, [0, 0, 0, 0])
+            congestion[2] = level
+            congestion[3] = time.time()
+
+    def get_congestion(self, source_id: int) -> float:
+        with self.lock:
+            shed_level, queue_pressure, downstream_level, report_time = self.congestions.get(source_id, [0, 0, 0, 0])
+        if time.time() - report_time > self.active_time:
+            downstream_level = 0
+        return max(shed_level, queue_pressure, downstream_level)
@@ -1,21 +1,27 @@
 import os
+import threading
 
-from core.lib.estimation import TimeEstimator
+from core.lib.estimation import TimeEstimator, BandwidthEstimator, Tracer
 from core.lib.network import http_request
 from core.lib.common import LOGGER
 from core.lib.common import Context
 from core.lib.common import SystemConstant
+from core.lib.common import FileOps
+from core.lib.common import Metrics
 from core.lib.content import Task
 from core.lib.network import merge_address
 from core.lib.network import NodeInfo, PortInfo
 from core.lib.network import NetworkAPIPath, NetworkAPIMethod
+from core.lib.network import TaskEnvelopeNegotiator
 
 from .task_coordinator import TaskCoordinator
+from .admission_control import AdmissionController
 
 
 class Controller:
     def __init__(self):
-        self.task_coordinator = TaskCoordinator()
+        # join table of parallel branches ('redis' shared by all controllers or 'memory' in this controller)
+        self.task_coordinator = TaskCoordinator.create(Context.get_parameter('TASK_COORDINATOR', 'redis'))
 
         self.is_display = Context.get_parameter('DISPLAY', direct=False)
 
@@ -29,18 +35,45 @@ class Controller:
 
         self.local_device = NodeInfo.get_local_device()
 
+        # spool directory shared with co-located processors (hand over file path instead of file content)
+        self.local_handoff_dir = Context.get_parameter('LOCAL_HANDOFF_DIR')
+
+        # passive bandwidth estimation of links to local device from timed task transfers
+        self.bandwidth_estimator = BandwidthEstimator(
+            window_size=Context.get_parameter('BANDWIDTH_WINDOW', '20', direct=False))
+
+        # admission control of tasks to local services with backpressure from processors
+        if Context.get_parameter('ADMISSION_CONTROL', 'False', direct=False):
+            self.admission_controller = AdmissionController(
+                max_queue_length=Context.get_parameter('ADMISSION_MAX_QUEUE_LENGTH', '10', direct=False),
+                burst=Context.get_parameter('ADMISSION_BURST', '2', direct=False),
+                max_defer=Context.get_parameter('ADMISSION_MAX_DEFER', '0.5', direct=False),
+            )
+        else:
+            self.admission_controller = None
+
+        Metrics.counter('controller_tasks_total', 'Tasks submitted to controller per action', ('action',))
+        Metrics.counter('dropped_tasks_total', 'Tasks dropped by component per reason', ('component', 'reason'))
+        Metrics.counter('task_sent_bytes_total', 'Bytes of task files uploaded per receiver device', ('receiver',))
+
     def send_task_to_other_device(self, cur_task: Task, device: str = ''):
         self.record_transmit_ts(cur_task=cur_task, is_end=False)
         controller_address = merge_address(NodeInfo.hostname2ip(device),
                                            port=self.controller_port,
                                            path=NetworkAPIPath.CONTROLLER_TASK)
 
-        http_request(url=controller_address,
-                     method=NetworkAPIMethod.CONTROLLER_TASK,
-                     data={'data': cur_task.serialize()},
-                     files={'file': (cur_task.get_file_path(),
-                                     open(cur_task.get_file_path(), 'rb'),
-                                     'multipart/form-data')})
+        Metrics.inc('task_sent_bytes_total', os.path.getsize(cur_task.get_file_path()), receiver=device)
+        with Tracer.span('controller/upload', cur_task, device=device):
+            response = http_request(url=controller_address,
+                                    method=NetworkAPIMethod.CONTROLLER_TASK,
+                                    **TaskEnvelopeNegotiator.build_task_payload(
+                                        controller_address, cur_task,
+                                        files={'file': (cur_task.get_file_path(),
+                                                        open(cur_task.get_file_path(), 'rb'),
+                                                        'multipart/form-data')}))
+        # pass congestion of downstream controller on to upstream
+        if self.admission_controller and response:
+            self.admission_controller.report_congestion(cur_task.get_source_id(), response.get('congestion', 0))
 
         LOGGER.info(f'[To Device {device}] source: {cur_task.get_source_id()}  '
                     f'task: {cur_task.get_task_id()} current service: {cur_task.get_flow_index()}')
@@ -53,26 +86,58 @@ class Controller:
             LOGGER.warning(f'[Service Not Exist] Service {service} does not exist in {self.local_device} '
                            f'(has service: {self.service_ports_dict.keys()})')
 
-        service_address = merge_address(NodeInfo.hostname2ip(self.local_device),
-                                        port=self.service_ports_dict[service],
-                                        path=NetworkAPIPath.PROCESSOR_PROCESS)
-
         if not os.path.exists(cur_task.get_file_path()):
             LOGGER.warning(f'[Task File Lost] source: {cur_task.get_source_id()}  '
                            f'task: {cur_task.get_task_id()} file: {cur_task.get_file_path()}')
             return
 
-        http_request(url=service_address,
-                     method=NetworkAPIMethod.PROCESSOR_PROCESS,
-                     data={'data': cur_task.serialize()},
-                     files={'file': (cur_task.get_file_path(),
-                                     open(cur_task.get_file_path(), 'rb'),
-                                     'multipart/form-data')}
-                     )
+        with Tracer.span('controller/dispatch', cur_task, service=service):
+            self.dispatch_task_to_service(cur_task, service)
 
         LOGGER.info(f'[To Service {service}] source: {cur_task.get_source_id()}  '
                     f'task: {cur_task.get_task_id()} current service: {cur_task.get_flow_index()}')
 
+    def dispatch_task_to_service(self, cur_task: Task, service: str):
+        handoff_path = self.prepare_local_handoff(cur_task)
+        if handoff_path:
+            service_address = merge_address(NodeInfo.hostname2ip(self.local_device),
+                                            port=self.service_ports_dict[service],
+                                            path=NetworkAPIPath.PROCESSOR_PROCESS_LOCAL)
+            http_request(url=service_address,
+                         method=NetworkAPIMethod.PROCESSOR_PROCESS_LOCAL,
+                         **TaskEnvelopeNegotiator.build_task_payload(
+                             service_address, cur_task, extra_data={'file_path': handoff_path}))
+        else:
+            service_address = merge_address(NodeInfo.hostname2ip(self.local_device),
+                                            port=self.service_ports_dict[service],
+                                            path=NetworkAPIPath.PROCESSOR_PROCESS)
+            http_request(url=service_address,
+                         method=NetworkAPIMethod.PROCESSOR_PROCESS,
+                         **TaskEnvelopeNegotiator.build_task_payload(
+                             service_address, cur_task,
+                             files={'file': (cur_task.get_file_path(),
+                                             open(cur_task.get_file_path(), 'rb'),
+                                             'multipart/form-data')})
+                         )
+
+    def prepare_local_handoff(self, cur_task: Task):
+        """
+        link task file into the spool directory shared with local processors,
+        return the spool path or None if local handoff is disabled or not possible
+        """
+        if not self.local_handoff_dir:
+            return None
+
+        file_path = cur_task.get_file_path()
+        handoff_path = os.path.join(self.local_handoff_dir,
+                                    f'{cur_task.get_task_uuid()}_{os.path.basename(file_path)}')
+        if not FileOps.link_file(file_path, handoff_path):
+            LOGGER.warning(f'[Local Handoff] Link file {file_path} into {self.local_handoff_dir} failed, '
+                           f'fall back to uploading file.')
+            return None
+
+        return handoff_path
+
     def send_task_to_distributor(self, cur_task: Task):
         self.record_transmit_ts(cur_task=cur_task, is_end=False)
         if not os.path.exists(cur_task.get_file_path()):
@@ -80,11 +145,16 @@ class Controller:
                            f'task: {cur_task.get_task_id()} file: {cur_task.get_file_path()}')
             return
         file_content = open(cur_task.get_file_path(), 'rb') if self.is_display else b''
+        if self.is_display:
+            Metrics.inc('task_sent_bytes_total', os.path.getsize(cur_task.get_file_path()),
+                        receiver=self.distributor_hostname)
 
-        http_request(url=self.distribute_address,
-                     method=NetworkAPIMethod.DISTRIBUTOR_DISTRIBUTE,
-                     files={'file': (cur_task.get_file_path(), file_content, 'multipart/form-data')},
-                     data={'data': cur_task.serialize()})
+        with Tracer.span('controller/upload', cur_task, device=self.distributor_hostname):
+            http_request(url=self.distribute_address,
+                         method=NetworkAPIMethod.DISTRIBUTOR_DISTRIBUTE,
+                         **TaskEnvelopeNegotiator.build_task_payload(
+                             self.distribute_address, cur_task,
+                             files={'file': (cur_task.get_file_path(), file_content, 'multipart/form-data')}))
 
         LOGGER.info(f'[To Distributor] source: {cur_task.get_source_id()}  task: {cur_task.get_task_id()} '
                     f'current service: {cur_task.get_flow_index()}')
@@ -110,10 +180,26 @@ class Controller:
         elif dst_device != self.local_device:
             self.send_task_to_other_device(cur_task, dst_device)
             action = 'transmit'
+        elif self.admission_controller:
+            wait_time = self.admit_task(cur_task, service_name)
+            if wait_time is None:
+                LOGGER.warning(f'[Admission Shed] source: {cur_task.get_source_id()}  '
+                               f'task: {cur_task.get_task_id()} is shed from overloaded service {service_name}')
+                action = 'shed'
+                Metrics.inc('dropped_tasks_total', component='controller', reason='admission')
+            elif wait_time > 0:
+                # deferred task is sent by a timer, not holding the thread handling tasks
+                threading.Timer(wait_time, self.send_task_to_service, args=(cur_task, service_name)).start()
+                action = 'execute'
+            else:
+                self.send_task_to_service(cur_task, service_name)
+                action = 'execute'
         else:
             self.send_task_to_service(cur_task, service_name)
             action = 'execute'
 
+        if service_name != 'start':
+            Metrics.inc('controller_tasks_total', action=action)
         return action
 
     def process_return(self, cur_task):
@@ -137,7 +223,7 @@ class Controller:
                 if parallel_count != required_parallel_task_count:
                     actions.append('wait')
                     continue
-                # retrieve parallel nodes in redis
+                # retrieve parallel nodes from join table
                 tasks = self.task_coordinator.retrieve_task_data(new_task.get_root_uuid(),
                                                                  joint_service_name,
                                                                  required_parallel_task_count)
@@ -171,6 +257,59 @@ class Controller:
             LOGGER.info(f'[Source {cur_task.get_source_id()} / Task {cur_task.get_task_id()}] '
                         f'record transmit time of stage {cur_task.get_flow_index()}: {duration:.3f}s')
 
+        return duration
+
+    def record_bandwidth_sample(self, cur_task: Task, data_size: int, duration: float):
+        """take transfer of task file from device of past stage as a bandwidth sample of the link"""
+        try:
+            sender = self.get_sender_device(cur_task)
+        except Exception as e:
+            LOGGER.warning(f'Sender device of task is unknown: {str(e)}')
+            return
+        self.bandwidth_estimator.add_sample(sender, self.local_device, data_size, duration)
+
+    def admit_task(self, cur_task: Task, service: str):
+        """
+        seconds to defer task before sending it to service, None if it is shed;
+        tasks joined with parallel branches later are never shed, or the join would wait for them forever
+        """
+        with Tracer.span('controller/admission', cur_task, service=service):
+            return self.admission_controller.admit(cur_task.get_source_id(), service,
+                                                   sheddable=not self.has_pending_join(cur_task))
+
+    @staticmethod
+    def has_pending_join(cur_task: Task) -> bool:
+        """whether any stage after current stage of task joins parallel branches"""
+        dag = cur_task.get_dag()
+        visited = set()
+        pending = list(dag.get_next_nodes(cur_task.get_flow_index()))
+        while pending:
+            service_name = pending.pop()
+            if service_name in visited:
+                continue
+            visited.add(service_name)
+            if len(dag.get_prev_nodes(service_name)) > 1:
+                return True
+            pending.extend(dag.get_next_nodes(service_name))
+        return False
+
+    def get_congestion(self, source_id: int):
+        """congestion level (0~1) of source on this device and its downstream devices"""
+        return self.admission_controller.get_congestion(source_id) if self.admission_controller else 0
+
+    def get_bandwidth_estimate(self, sender: str = None):
+        """estimation of link from sender to local device, or estimations of all links if sender is None"""
+        if sender is None:
+            return self.bandwidth_estimator.get_all_estimates()
+        return self.bandwidth_estimator.get_estimate(sender, self.local_device)
+
+    @staticmethod
+    def get_sender_device(cur_task: Task):
+        past_flow_index = cur_task.get_past_flow_index()
+        if not past_flow_index:
+            return cur_task.get_source_device()
+        return cur_task.get_dag().get_node(past_flow_index).service.get_execute_device()
+
     @staticmethod
     def record_execute_ts(cur_task: Task, is_end: bool = False):
         assert cur_task, 'Current task of controller is NOT set!'
@@ -186,6 +325,8 @@ class Controller:
             LOGGER.info(f'[Source {cur_task.get_source_id()} / Task {cur_task.get_task_id()}] '
                         f'record execute time of stage {cur_task.get_flow_index()}: {duration:.3f}s')
 
+        return duration
+
     def record_ts(self, task: Task, is_end: bool = False, action: str = ''):
         if action == 'transmit':
             self.record_transmit_ts(cur_task=task, is_end=is_end)
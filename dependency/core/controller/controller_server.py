@@ -1,12 +1,15 @@
+import time
+
 from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form
 
 from fastapi.routing import APIRoute
 from starlette.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from core.lib.network import NetworkAPIPath, NetworkAPIMethod
-from core.lib.common import FileOps
+from core.lib.network import NetworkAPIPath, NetworkAPIMethod, TaskEnvelopeNegotiator
+from core.lib.common import FileOps, Metrics
 from core.lib.common import Context
 from core.lib.content import Task
+from core.lib.estimation import Tracer
 
 from .controller import Controller
 
@@ -26,28 +29,61 @@ class ControllerServer:
                      response_class=JSONResponse,
                      methods=[NetworkAPIMethod.CONTROLLER_RETURN]
                      ),
+            APIRoute(NetworkAPIPath.CONTROLLER_BANDWIDTH,
+                     self.query_bandwidth,
+                     response_class=JSONResponse,
+                     methods=[NetworkAPIMethod.CONTROLLER_BANDWIDTH]
+                     ),
         ], log_level='trace', timeout=6000)
 
         self.app.add_middleware(
             CORSMiddleware, allow_origins=["*"], allow_credentials=True,
             allow_methods=["*"], allow_headers=["*"],
         )
+        TaskEnvelopeNegotiator.install(self.app)
+        Metrics.install(self.app)
+        Metrics.gauge('tasks_in_flight', 'Tasks being handled by component', ('component',))
 
         self.is_delete_temp_files = Context.get_parameter('DELETE_TEMP_FILES', direct=False)
 
-    async def submit_task(self, backtask: BackgroundTasks, file: UploadFile = File(...), data: str = Form(...)):
+    async def submit_task(self, backtask: BackgroundTasks, file: UploadFile = File(...),
+                          data: str = Form(None), envelope: UploadFile = File(None)):
         file_data = await file.read()
-        backtask.add_task(self.submit_task_background, data, file_data)
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
+        cur_task = Task.deserialize(data)
+        backtask.add_task(self.submit_task_background, cur_task, file_data)
+        # congestion signal for the sender to reduce its load
+        return {'congestion': self.controller.get_congestion(cur_task.get_source_id())}
 
-    async def process_return(self, backtask: BackgroundTasks,  data: str = Form(...)):
+    async def process_return(self, backtask: BackgroundTasks,
+                             data: str = Form(None), envelope: UploadFile = File(None)):
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
         backtask.add_task(self.process_return_background, data)
 
-    def submit_task_background(self, data, file_data):
+    async def query_bandwidth(self, sender: str = None):
+        """
+        passive bandwidth estimation of link from sender device to this device,
+        {} if the link has no transfer yet; estimations of all links if sender is not given
+        """
+        estimate = self.controller.get_bandwidth_estimate(sender)
+        return {} if estimate is None else estimate
+
+    def submit_task_background(self, cur_task, file_data):
         """deal with tasks submitted by the generator or other controllers"""
-        cur_task = Task.deserialize(data)
+        Metrics.update('tasks_in_flight', 1, component='controller')
+        try:
+            self.handle_submitted_task(cur_task, file_data)
+        finally:
+            Metrics.update('tasks_in_flight', -1, component='controller')
+
+    def handle_submitted_task(self, cur_task, file_data):
         FileOps.save_data_file(cur_task, file_data)
         # record end time of transmitting
-        self.controller.record_transmit_ts(cur_task, is_end=True)
+        duration = self.controller.record_transmit_ts(cur_task, is_end=True)
+        self.controller.record_bandwidth_sample(cur_task, len(file_data), duration)
+        receive_time = time.time()
+        Tracer.record_span('controller/transmit', receive_time - duration, receive_time, cur_task,
+                           size=len(file_data))
 
         action = self.controller.submit_task(cur_task)
 
@@ -58,9 +94,18 @@ class ControllerServer:
 
     def process_return_background(self, data):
         """deal with tasks returned by the processor"""
+        Metrics.update('tasks_in_flight', 1, component='controller')
+        try:
+            self.handle_returned_task(data)
+        finally:
+            Metrics.update('tasks_in_flight', -1, component='controller')
+
+    def handle_returned_task(self, data):
         cur_task = Task.deserialize(data)
         # record end time of executing
-        self.controller.record_execute_ts(cur_task, is_end=True)
+        duration = self.controller.record_execute_ts(cur_task, is_end=True)
+        return_time = time.time()
+        Tracer.record_span('controller/execute', return_time - duration, return_time, cur_task)
 
         actions = self.controller.process_return(cur_task)
 
@@ -1,4 +1,11 @@
-import redis
+import threading
+import time
+import zlib
+
+try:
+    import redis
+except ImportError:
+    redis = None
 
 from core.lib.content import Task
 from core.lib.common import LOGGER, Context, SystemConstant
@@ -6,7 +13,68 @@ from core.lib.network import NodeInfo, PortInfo
 
 
 class TaskCoordinator:
+    """
+    join of parallel branches of a dag: tasks of branches arriving at a joint service are stored
+    until all branches arrive, then retrieved together to be merged
+    """
+
+    BACKENDS = ('redis', 'memory')
+
+    @staticmethod
+    def create(backend: str = 'redis') -> 'TaskCoordinator':
+        """
+        redis: join table shared by controllers of all devices in redis on cloud node
+        memory: join table in controller process, only valid if all branches of a joint service
+                return to the same controller (eg: single cloud deployment)
+        """
+        if backend == 'redis':
+            return RedisTaskCoordinator()
+        elif backend == 'memory':
+            return MemoryTaskCoordinator()
+        raise ValueError(f'Task coordinator backend "{backend}" not supported, '
+                         f'only {TaskCoordinator.BACKENDS} are supported.')
+
+    def store_task_data(self, task: Task, joint_service_name: str):
+        """store task of a branch, return number of branch tasks stored for the joint service"""
+        raise NotImplementedError
+
+    def retrieve_task_data(self, root_uuid: str, joint_service_name: str, required_count: int):
+        """remove and return stored branch tasks if all required branches arrived, otherwise None"""
+        raise NotImplementedError
+
+    @staticmethod
+    def check_joint_tasks(tasks, required_count, storage_key):
+        if not tasks:
+            LOGGER.warning(f"Conditions not met for {storage_key}, required count: {required_count}")
+            return None
+
+        cur_task_services = set([task.get_flow_index() for task in tasks])
+        past_task_services = set([task.get_past_flow_index() for task in tasks])
+
+        # check if joint service merged from same parallel branch (e.g., [a->c, a->c, b->c])
+        if len(past_task_services) != required_count:
+            LOGGER.warning(f"Same branch exists for parallel services: require {required_count} "
+                           f"get {len(past_task_services)}, past services: {past_task_services}, "
+                           f"current joint service: {list(cur_task_services)[0]}")
+            return None
+
+        # check if joint service of parallel branches are different (e.g., [a->c, b->d])
+        if len(cur_task_services) != 1:
+            LOGGER.warning(f"Joint service for parallel branches conflict:"
+                           f" require 1 get {len(cur_task_services)}, "
+                           f"past services: {past_task_services}, "
+                           f"current joint service: {list(cur_task_services)[0]}")
+            return None
+
+        LOGGER.debug(f"Retrieve {len(tasks)} tasks from {storage_key}, "
+                     f"past services:{past_task_services}, current joint service:{list(cur_task_services)[0]}")
+        return tasks
+
+
+class RedisTaskCoordinator(TaskCoordinator):
     def __init__(self):
+        assert redis is not None, 'Redis task coordinator requires redis'
+
         self.max_connections = Context.get_parameter('MAX_REDIS_CONNECTIONS', '10', direct=False)
         self.storage_timeout = Context.get_parameter('REDIS_STORAGE_TIMEOUT', '3600', direct=False)
         self.pool = redis.ConnectionPool(host=NodeInfo.hostname2ip(NodeInfo.get_cloud_node()),
@@ -46,19 +114,19 @@ class TaskCoordinator:
                 lua_script = """
                             local key = KEYS[1]
                             local required = tonumber(ARGV[1])
-        
+
                             -- check current task count
                             local count = redis.call('HLEN', key)
                             if count < required then
                                 return nil
                             end
-        
+
                             -- retrieve all task data
                             local all_data = redis.call('HGETALL', key)
-        
+
                             -- clear storage
                             redis.call('DEL', key)
-        
+
                             return all_data
                             """
 
@@ -69,35 +137,72 @@ class TaskCoordinator:
                     required_count
                 )
 
-                if not result:
-                    LOGGER.warning(f"Conditions not met for {storage_key}, required count: {required_count}")
-                    return None
-
                 parsed_tasks = [
                     Task.deserialize(result[i + 1])
                     for i in range(0, len(result), 2)
-                ]
-
-                cur_task_services = set([task.get_flow_index() for task in parsed_tasks])
-                past_task_services = set([task.get_past_flow_index() for task in parsed_tasks])
-
-                # check if joint service merged from same parallel branch (e.g., [a->c, a->c, b->c])
-                if len(past_task_services) != required_count:
-                    LOGGER.warning(f"Same branch exists for parallel services: require {required_count} "
-                                   f"get {len(past_task_services)}, past services: {past_task_services}, "
-                                   f"current joint service: {list(cur_task_services)[0]}")
-                    return None
-
-                # check if joint service of parallel branches are different (e.g., [a->c, b->d])
-                if len(cur_task_services) != 1:
-                    LOGGER.warning(f"Joint service for parallel branches conflict:"
-                                   f" require 1 get {len(cur_task_services)}, "
-                                   f"past services: {past_task_services}, "
-                                   f"current joint service: {list(cur_task_services)[0]}")
-                    return None
-
-                LOGGER.debug(f"Retrieve {len(parsed_tasks)} tasks from {storage_key}, "
-                             f"past services:{past_task_services}, current joint service:{list(cur_task_services)[0]}")
-                return parsed_tasks
+                ] if result else None
+
+                return self.check_joint_tasks(parsed_tasks, required_count, storage_key)
         except Exception as e:
             LOGGER.warning(f'Redis operation failed in retrieve tasks: {str(e)}')
+
+
+class MemoryTaskCoordinator(TaskCoordinator):
+    """
+    in-process join table keeping task objects (no serialization, no network round-trip)
+
+    slots are keyed by (root uuid, joint service) and spread over `lock_stripes` tables each with its own lock,
+    so that joins of different tasks rarely contend. slots not completed within `storage_timeout` seconds
+    (eg: a branch is lost) are evicted when storing into their table.
+    """
+
+    def __init__(self):
+        self.storage_timeout = Context.get_parameter('JOIN_STORAGE_TIMEOUT', '3600', direct=False)
+        self.lock_stripes = Context.get_parameter('JOIN_LOCK_STRIPES', '16', direct=False)
+        self.eviction_interval = min(self.storage_timeout, 60)
+
+        # (root uuid, joint service) -> [update time, {task uuid: task}]
+        self.tables = [{} for _ in range(self.lock_stripes)]
+        self.locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self.eviction_times = [time.time()] * self.lock_stripes
+
+    def get_stripe(self, root_uuid: str, joint_service_name: str) -> int:
+        return zlib.crc32(f'{root_uuid}:{joint_service_name}'.encode()) % self.lock_stripes
+
+    def store_task_data(self, task, joint_service_name):
+        slot_key = (task.get_root_uuid(), joint_service_name)
+        stripe = self.get_stripe(*slot_key)
+        now = time.time()
+        with self.locks[stripe]:
+            table = self.tables[stripe]
+            if now - self.eviction_times[stripe] > self.eviction_interval:
+                self.evict_expired_slots(table, now)
+                self.eviction_times[stripe] = now
+
+            slot = table.setdefault(slot_key, [now, {}])
+            slot[0] = now
+            slot[1][task.get_task_uuid()] = task
+            count = len(slot[1])
+
+        LOGGER.debug(f'Store "source {task.get_source_id()} task {task.get_task_id()} '
+                     f'current_service {task.get_flow_index()}" into {slot_key}, current count: {count}')
+        return count
+
+    def retrieve_task_data(self, root_uuid, joint_service_name, required_count):
+        slot_key = (root_uuid, joint_service_name)
+        stripe = self.get_stripe(*slot_key)
+        with self.locks[stripe]:
+            table = self.tables[stripe]
+            slot = table.get(slot_key)
+            if slot is None or len(slot[1]) < required_count:
+                tasks = None
+            else:
+                tasks = list(table.pop(slot_key)[1].values())
+
+        return self.check_joint_tasks(tasks, required_count, slot_key)
+
+    def evict_expired_slots(self, table: dict, now: float):
+        expired_keys = [key for key, (update_time, _) in table.items() if now - update_time > self.storage_timeout]
+        for key in expired_keys:
+            _, tasks = table.pop(key)
+            LOGGER.warning(f'Evict expired join slot {key} with {len(tasks)} tasks')
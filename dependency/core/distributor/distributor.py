@@ -1,11 +1,14 @@
-import os
-import sqlite3
+import json
+import time
 from datetime import datetime
 
 from core.lib.content import Task
-from core.lib.estimation import TimeEstimator
-from core.lib.common import LOGGER, FileNameConstant, FileOps, SystemConstant
+from core.lib.estimation import TimeEstimator, Tracer
+from core.lib.common import LOGGER, FileNameConstant, Context, SystemConstant, VideoOps
 from core.lib.network import http_request, NodeInfo, merge_address, NetworkAPIMethod, NetworkAPIPath, PortInfo
+from core.lib.network import TaskEnvelopeNegotiator
+
+from .result_store import ResultStore
 
 
 class Distributor:
@@ -18,45 +21,46 @@ class Distributor:
                                                path=NetworkAPIPath.SCHEDULER_SCENARIO)
 
         self.record_path = FileNameConstant.DISTRIBUTOR_RECORD.value
+        self.result_store = ResultStore(
+            self.record_path,
+            batch_size=Context.get_parameter('RECORD_BATCH_SIZE', '64', direct=False),
+            flush_interval=Context.get_parameter('RECORD_FLUSH_INTERVAL', '0.05', direct=False),
+            retention=Context.get_parameter('RECORD_RETENTION', '0', direct=False),
+            maintain_interval=Context.get_parameter('RECORD_MAINTAIN_INTERVAL', '600', direct=False),
+        )
+
+        # thumbnail of task file for result visualization (0 to keep frame size, negative to disable thumbnails)
+        self.thumbnail_width = Context.get_parameter('THUMBNAIL_WIDTH', '480', direct=False)
+        self.thumbnail_quality = Context.get_parameter('THUMBNAIL_QUALITY', '80', direct=False)
 
     def distribute_data(self, cur_task: Task):
         assert cur_task, 'Current task is None'
 
         LOGGER.info(f'[Distribute Data] source: {cur_task.get_source_id()}  task: {cur_task.get_task_id()}')
 
-        self.save_task_record(cur_task)
+        with Tracer.span('distributor/store', cur_task):
+            self.save_task_record(cur_task)
         self.send_scenario_to_scheduler(cur_task)
 
+    def save_thumbnail(self, cur_task: Task):
+        """decode first frame of task file once, so that backend fetches a small image instead of the video"""
+        if self.thumbnail_width < 0:
+            return
+
+        file_path = cur_task.get_file_path()
+        try:
+            VideoOps.save_thumbnail(file_path, VideoOps.get_thumbnail_path(file_path),
+                                    max_width=self.thumbnail_width, quality=self.thumbnail_quality)
+        except Exception as e:
+            LOGGER.warning(f'[Thumbnail] Save thumbnail of {file_path} failed: {str(e)}')
+
     def save_task_record(self, cur_task: Task):
         self.record_total_end_ts(cur_task)
         task_source_id = cur_task.get_source_id()
         task_task_id = cur_task.get_task_id()
         task_ctime = datetime.now().timestamp()
 
-        conn = sqlite3.connect(self.record_path)
-        c = conn.cursor()
-
-        create_table_sql = '''
-            CREATE TABLE IF NOT EXISTS records (
-                source_id INTEGER,
-                task_id INTEGER,
-                ctime REAL,
-                json TEXT,
-                is_visited BOOL,
-                PRIMARY KEY (source_id, task_id)
-            );
-        '''
-        c.execute(create_table_sql)
-
-        try:
-            c.execute('INSERT INTO records VALUES (?, ?, ?, ?, ?)',
-                      (task_source_id, task_task_id, task_ctime, cur_task.serialize(), False))
-            conn.commit()
-        except sqlite3.IntegrityError:
-            LOGGER.warning(f'[Task Name Conflict] source_id: {task_source_id}, task_id: {task_task_id} '
-                           f'has already existed in database.')
-        finally:
-            conn.close()
+        self.result_store.add_record(task_source_id, task_task_id, task_ctime, cur_task.serialize())
 
     @staticmethod
     def record_total_end_ts(cur_task):
@@ -70,102 +74,70 @@ class Distributor:
         LOGGER.info(f'[Send Scenario] source: {cur_task.get_source_id()}  task: {cur_task.get_task_id()}')
         http_request(url=self.scheduler_address,
                      method=NetworkAPIMethod.SCHEDULER_SCENARIO,
-                     data={'data': cur_task.serialize()})
+                     **TaskEnvelopeNegotiator.build_task_payload(self.scheduler_address, cur_task))
 
     @staticmethod
     def record_transmit_ts(cur_task):
         assert cur_task, 'Current task is None'
 
         duration = TimeEstimator.record_dag_ts(cur_task, is_end=True, sub_tag='transmit')
+        end_time = time.time()
+        Tracer.record_span('distributor/transmit', end_time - duration, end_time, cur_task)
 
         cur_task.save_transmit_time(duration)
         LOGGER.info(f'[Source {cur_task.get_source_id()} / Task {cur_task.get_task_id()}] '
                     f'record transmit time of stage {cur_task.get_flow_index()}: {duration:.3f}s')
 
     def query_result(self, time_ticket, size):
-        if self.is_database_empty():
-            return {
-                'result': [],
-                'time_ticket': time_ticket,
-                'size': 0
-            }
-
-        conn = sqlite3.connect(self.record_path)
-        c = conn.cursor()
-
-        # query unvisited records
-        query_sql = f'''
-            SELECT source_id, task_id, ctime, json 
-            FROM records 
-            WHERE ctime > {time_ticket} AND is_visited = 0
-            ORDER BY ctime ASC;
-        '''
-        c.execute(query_sql)
-        results = c.fetchall()
-
-        n = len(results)
-        flat_ids = []
-        for row in results:
-            flat_ids.append(row[0])
-            flat_ids.append(row[1])
-        ctime_results = [row[2] for row in results]
-        json_results = [row[3] for row in results]
-
-        if n > 0:
-            # mark visited records
-            update_sql = f'''
-                UPDATE records
-                SET is_visited = 1
-                WHERE (source_id, task_id) IN (VALUES {','.join(['(?,?)'] * n)});
-            '''
-            c.execute(update_sql, flat_ids)
-            conn.commit()
-
-            conn.close()
+        results = self.result_store.query_unvisited(time_ticket, size)
 
+        json_results = [row[3] for row in results]
         # prepare response
-        if len(ctime_results) > 0:
-            new_time_ticket = ctime_results[-1]
-        else:
-            new_time_ticket = time_ticket
+        new_time_ticket = results[-1][2] if results else time_ticket
         LOGGER.debug(f'last file time: {new_time_ticket}')
-        if size > 0:
-            json_results = json_results[:size]
 
         return {'result': json_results,
                 'time_ticket': new_time_ticket,
                 'size': len(json_results)
                 }
 
+    def query_result_after(self, cursor, fields=None, size=0):
+        """query results after the server-side cursor, keeping only the given fields of tasks if fields are set"""
+        results, new_cursor = self.result_store.query_after(cursor, size)
+
+        json_results = [self.project_record(row[2], fields) for row in results]
+
+        return {'result': json_results,
+                'cursor': new_cursor,
+                'size': len(json_results)
+                }
+
+    def acknowledge_result(self, cursor):
+        self.result_store.acknowledge(cursor)
+
+    def get_result_write_seq(self):
+        return self.result_store.write_seq
+
+    def wait_result(self, write_seq, timeout):
+        return self.result_store.wait_records(write_seq, timeout)
+
+    @staticmethod
+    def project_record(record, fields=None):
+        if not fields:
+            return record
+        task_dict = json.loads(record)
+        return json.dumps({key: task_dict[key] for key in Task.IDENTITY_FIELDS + tuple(fields) if key in task_dict})
+
     def query_all_result(self):
-        if self.is_database_empty():
-            return {
-                'result': [],
-                'size': 0
-            }
-        conn = sqlite3.connect(self.record_path)
-        c = conn.cursor()
-
-        # query records, ordered by create time
-        query_sql = f'''
-            SELECT json 
-            FROM records 
-            ORDER BY source_id ASC, task_id ASC;
-        '''
-        c.execute(query_sql)
-        results = c.fetchall()
-
-        json_results = [row[0] for row in results]
-
-        conn.close()
+        json_results = self.result_store.query_all()
 
         return {'result': json_results,
                 'size': len(json_results)
                 }
 
     def clear_database(self):
-        FileOps.remove_file(self.record_path)
+        self.result_store.clear()
         LOGGER.info('[Distributor] Database Cleared')
 
     def is_database_empty(self):
-        return not os.path.exists(self.record_path)
+        return self.result_store.is_empty()
@@ -1,13 +1,16 @@
+import json
 import os
 
 from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form
 from fastapi.routing import APIRoute
-from starlette.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, FileResponse, StreamingResponse
 from starlette.requests import Request
 from fastapi.middleware.cors import CORSMiddleware
 
-from core.lib.network import NetworkAPIPath, NetworkAPIMethod
-from core.lib.common import FileOps
+from core.lib.network import NetworkAPIPath, NetworkAPIMethod, TaskEnvelopeNegotiator
+from core.lib.common import FileOps, Context, VideoOps, Metrics
+from core.lib.estimation import Tracer
 from core.lib.content import Task
 from .distributor import Distributor
 
@@ -15,6 +18,7 @@ from .distributor import Distributor
 class DistributorServer:
     def __init__(self):
         self.distributor = Distributor()
+        self.stream_heartbeat = Context.get_parameter('RESULT_STREAM_HEARTBEAT', '5', direct=False)
 
         self.app = FastAPI(routes=[
             APIRoute(NetworkAPIPath.DISTRIBUTOR_DISTRIBUTE,
@@ -27,6 +31,12 @@ class DistributorServer:
                      response_class=JSONResponse,
                      methods=[NetworkAPIMethod.DISTRIBUTOR_RESULT]
                      ),
+            # stream results continuously as json lines
+            APIRoute(NetworkAPIPath.DISTRIBUTOR_RESULT_STREAM,
+                     self.stream_result,
+                     response_class=StreamingResponse,
+                     methods=[NetworkAPIMethod.DISTRIBUTOR_RESULT_STREAM]
+                     ),
             APIRoute(NetworkAPIPath.DISTRIBUTOR_FILE,
                      self.download_file,
                      response_class=JSONResponse,
@@ -56,16 +66,28 @@ class DistributorServer:
             CORSMiddleware, allow_origins=["*"], allow_credentials=True,
             allow_methods=["*"], allow_headers=["*"],
         )
+        TaskEnvelopeNegotiator.install(self.app)
+        Metrics.install(self.app)
+        Metrics.counter('distributor_tasks_total', 'Tasks finished and recorded by distributor', ('source_id',))
+        Metrics.gauge('distributor_write_queue_length', 'Records waiting for group commit').set_function(
+            self.distributor.result_store.write_queue.qsize)
 
-    async def distribute_data(self, backtask: BackgroundTasks, file: UploadFile = File(...), data: str = Form(...)):
+    async def distribute_data(self, backtask: BackgroundTasks, file: UploadFile = File(...),
+                              data: str = Form(None), envelope: UploadFile = File(None)):
         file_data = await file.read()
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
         backtask.add_task(self.distribute_data_background, data, file_data)
 
     def distribute_data_background(self, data, file_data):
         cur_task = Task.deserialize(data)
         FileOps.save_data_file(cur_task, file_data)
         self.distributor.record_transmit_ts(cur_task)
+        # thumbnail is ready before the record is visible to backend
+        if file_data:
+            with Tracer.span('distributor/thumbnail', cur_task):
+                self.distributor.save_thumbnail(cur_task)
         self.distributor.distribute_data(cur_task)
+        Metrics.inc('distributor_tasks_total', source_id=cur_task.get_source_id())
 
     async def query_result(self, request: Request):
         data = await request.json()
@@ -73,15 +95,61 @@ class DistributorServer:
         time_ticket = data['time_ticket']
         return self.distributor.query_result(time_ticket, size)
 
+    async def stream_result(self, request: Request):
+        """
+        stream results after the cursor as json lines of {'result', 'cursor', 'size'}
+        request json:
+            cursor: rowid of the last received record (0 to start), records up to it are marked visited
+            fields: task fields kept in results (all fields if empty)
+            size: maximum results in one line (unlimited if 0)
+        the next line is produced only after the last one is sent, so a slow client throttles the query,
+        a line without results (size 0, current cursor) is sent as heartbeat if no result comes in heartbeat interval.
+        records of sent lines are marked visited, so that a fresh subscription (cursor 0) does not replay them,
+        a client reconnecting with its last received cursor gets again the results lost in transit
+        """
+        data = await request.json()
+        cursor = data.get('cursor', 0)
+        fields = data.get('fields')
+        size = data.get('size', 0)
+        await run_in_threadpool(self.distributor.acknowledge_result, cursor)
+
+        async def result_lines():
+            nonlocal cursor
+            acknowledged_cursor = cursor
+            while True:
+                # the generator resumes only after the last line is sent
+                if cursor > acknowledged_cursor:
+                    await run_in_threadpool(self.distributor.acknowledge_result, cursor)
+                    acknowledged_cursor = cursor
+                write_seq = self.distributor.get_result_write_seq()
+                response = await run_in_threadpool(self.distributor.query_result_after, cursor, fields, size)
+                cursor = response['cursor']
+                if response['size']:
+                    yield json.dumps(response) + '\n'
+                    continue
+                if not await run_in_threadpool(self.distributor.wait_result, write_seq, self.stream_heartbeat):
+                    yield json.dumps(response) + '\n'
+
+        return StreamingResponse(result_lines(), media_type='application/x-ndjson')
+
     async def download_file(self, request: Request, backtask: BackgroundTasks):
+        """
+        download task file (removed after downloading)
+        request json:
+            file: path of task file
+            thumbnail: download thumbnail image (jpeg) of the file instead if it exists
+        """
         data = await request.json()
         file_path = data['file']
+        thumbnail_path = VideoOps.get_thumbnail_path(file_path)
+        backtask.add_task(FileOps.remove_file, file_path)
+        backtask.add_task(FileOps.remove_file, thumbnail_path)
+
+        if data.get('thumbnail', False) and os.path.exists(thumbnail_path):
+            return FileResponse(path=thumbnail_path, filename=thumbnail_path, media_type='image/jpeg')
         if not os.path.exists(file_path):
             return b''
-        return FileResponse(
-            path=file_path,
-            filename=file_path,
-            background=backtask.add_task(FileOps.remove_file, file_path))
+        return FileResponse(path=file_path, filename=file_path)
 
     async def query_all_result(self):
         return self.distributor.query_all_result()
@@ -0,0 +1,206 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from core.lib.common import LOGGER, FileOps
+
+
+class ResultStore:
+    """
+    Result records of finished tasks kept in SQLite.
+
+    One long-lived connection in WAL mode is shared by the writer thread and queries.
+    Records are put into a write queue and inserted by the writer thread in group commits,
+    records older than `retention` seconds are deleted and the database is vacuumed periodically.
+    """
+
+    def __init__(self, record_path: str, batch_size: int = 64, flush_interval: float = 0.05,
+                 retention: float = 0, maintain_interval: float = 600):
+        self.record_path = record_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.maintain_interval = maintain_interval
+
+        self.lock = threading.RLock()
+        self.records_written = threading.Condition()
+        self.write_seq = 0
+        # increased on clearing, records added before clearing are discarded by the writer
+        self.clear_seq = 0
+        self.conn = None
+        self.write_queue = queue.Queue()
+        self.last_maintain_time = time.time()
+
+        self.open()
+        threading.Thread(target=self.loop_write, daemon=True).start()
+
+    def open(self):
+        with self.lock:
+            self.conn = sqlite3.connect(self.record_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL;')
+            self.conn.execute('PRAGMA synchronous=NORMAL;')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS records (
+                    source_id INTEGER,
+                    task_id INTEGER,
+                    ctime REAL,
+                    json TEXT,
+                    is_visited BOOL,
+                    PRIMARY KEY (source_id, task_id)
+                );
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS records_ctime_visited ON records (ctime, is_visited);')
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+    def add_record(self, source_id: int, task_id: int, ctime: float, record: str):
+        # records are tagged with the clear sequence when added
+        self.write_queue.put((self.clear_seq, (source_id, task_id, ctime, record, False)))
+
+    def loop_write(self):
+        while True:
+            try:
+                records = [self.write_queue.get(timeout=self.maintain_interval)]
+            except queue.Empty:
+                records = []
+
+            # group records arriving within flush interval into one commit
+            deadline = time.time() + self.flush_interval
+            while records and len(records) < self.batch_size:
+                remaining_time = deadline - time.time()
+                if remaining_time <= 0:
+                    break
+                try:
+                    records.append(self.write_queue.get(timeout=remaining_time))
+                except queue.Empty:
+                    break
+
+            try:
+                if records:
+                    self.write_records(records)
+                if time.time() - self.last_maintain_time >= self.maintain_interval:
+                    self.maintain()
+            except Exception as e:
+                LOGGER.warning(f'[Result Store] Write records failed: {str(e)}')
+                LOGGER.exception(e)
+
+    def write_records(self, records):
+        """write records of (clear sequence, row), records added before the database was cleared are discarded"""
+        with self.lock:
+            records = [row for clear_seq, row in records if clear_seq == self.clear_seq]
+            if not records:
+                return
+            cursor = self.conn.executemany('INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?)', records)
+            self.conn.commit()
+        with self.records_written:
+            self.write_seq += 1
+            self.records_written.notify_all()
+        if cursor.rowcount < len(records):
+            LOGGER.warning(f'[Task Name Conflict] {len(records) - cursor.rowcount} of {len(records)} records '
+                           f'have already existed in database.')
+
+    def maintain(self):
+        """delete expired records and vacuum database"""
+        self.last_maintain_time = time.time()
+        if not self.retention:
+            return
+        with self.lock:
+            cursor = self.conn.execute('DELETE FROM records WHERE ctime < ?;', (time.time() - self.retention,))
+            self.conn.commit()
+            if cursor.rowcount > 0:
+                self.conn.execute('VACUUM;')
+        LOGGER.info(f'[Result Store] Remove {cursor.rowcount} expired records')
+
+    def query_unvisited(self, time_ticket: float, size: int = 0):
+        """query records created after time_ticket and not visited yet (at most size records if size > 0)"""
+        query_sql = '''
+            SELECT source_id, task_id, ctime, json
+            FROM records
+            WHERE ctime > ? AND is_visited = 0
+            ORDER BY ctime ASC
+        '''
+        params = [time_ticket]
+        if size > 0:
+            query_sql += ' LIMIT ?'
+            params.append(size)
+
+        with self.lock:
+            results = self.conn.execute(query_sql, params).fetchall()
+            if results:
+                # mark visited records
+                self.conn.executemany('UPDATE records SET is_visited = 1 WHERE source_id = ? AND task_id = ?;',
+                                      [(row[0], row[1]) for row in results])
+                self.conn.commit()
+
+        return results
+
+    def query_after(self, cursor: int, size: int = 0):
+        """
+        query records inserted after cursor (rowid of the last record received by the client)
+        a fresh subscription (cursor 0) only gets records not visited yet, a resumed one gets all records
+        after its cursor, so that records lost in transit are delivered again
+        return rows of (rowid, ctime, json) and the new cursor
+        """
+        with self.lock:
+            max_rowid = self.conn.execute('SELECT MAX(rowid) FROM records;').fetchone()[0]
+            # rowid restarts after database cleared
+            if max_rowid is None or cursor > max_rowid:
+                cursor = 0
+            query_sql = f'''
+                SELECT rowid, ctime, json
+                FROM records
+                WHERE rowid > ?{' AND is_visited = 0' if cursor == 0 else ''}
+                ORDER BY rowid ASC
+            '''
+            params = [cursor]
+            if size > 0:
+                query_sql += ' LIMIT ?'
+                params.append(size)
+
+            results = self.conn.execute(query_sql, params).fetchall()
+            if results:
+                cursor = results[-1][0]
+
+        return results, cursor
+
+    def acknowledge(self, cursor: int):
+        """mark records up to cursor (acknowledged as received by the client) visited"""
+        if cursor <= 0:
+            return
+        with self.lock:
+            self.conn.execute('UPDATE records SET is_visited = 1 WHERE rowid <= ? AND is_visited = 0;', (cursor,))
+            self.conn.commit()
+
+    def wait_records(self, write_seq: int, timeout: float):
+        """block until records are written after write_seq was read, or timeout"""
+        with self.records_written:
+            return self.records_written.wait_for(lambda: self.write_seq != write_seq, timeout=timeout)
+
+    def query_all(self):
+        with self.lock:
+            results = self.conn.execute('SELECT json FROM records ORDER BY source_id ASC, task_id ASC;').fetchall()
+        return [row[0] for row in results]
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM records LIMIT 1;').fetchone() is None
+
+    def clear(self):
+        with self.lock:
+            # discard records waiting for writing, so that they do not reappear in the new database
+            while True:
+                try:
+                    self.write_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.clear_seq += 1
+            self.close()
+            for suffix in ('', '-wal', '-shm'):
+                FileOps.remove_file(f'{self.record_path}{suffix}')
+            self.open()
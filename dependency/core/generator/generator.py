@@ -1,12 +1,12 @@
 import json
 
-from core.lib.common import Context, LOGGER, SystemConstant
+from core.lib.common import Context, LOGGER, SystemConstant, VideoOps
 from core.lib.content import Task
 from core.lib.network import merge_address
 from core.lib.network import NodeInfo, PortInfo
 from core.lib.network import NetworkAPIPath, NetworkAPIMethod
-from core.lib.network import http_request
-from core.lib.estimation import TimeEstimator
+from core.lib.network import http_request, TaskEnvelopeNegotiator
+from core.lib.estimation import TimeEstimator, Tracer
 
 
 class Generator:
@@ -35,6 +35,15 @@ class Generator:
         self.schedule_address = merge_address(NodeInfo.hostname2ip(self.scheduler_hostname),
                                               port=self.scheduler_port, path=NetworkAPIPath.SCHEDULER_SCHEDULE)
 
+        """congestion control"""
+        # congestion level (0~1) signaled by controller, fps is reduced in proportion above threshold
+        # and resolution is lowered by one level above resolution threshold
+        self.congestion = 0
+        self.congestion_threshold = Context.get_parameter('CONGESTION_THRESHOLD', '0.3', direct=False)
+        self.congestion_resolution_threshold = Context.get_parameter('CONGESTION_RESOLUTION_THRESHOLD', '0.6',
+                                                                     direct=False)
+        self.min_fps = Context.get_parameter('CONGESTION_MIN_FPS', '1', direct=False)
+
         """hook functions"""
         self.before_schedule_operation = Context.get_algorithm('GEN_BSO')
         self.after_schedule_operation = Context.get_algorithm('GEN_ASO')
@@ -48,6 +57,18 @@ class Generator:
                                 data={'data': json.dumps(params)})
         self.after_schedule_operation(self, response)
 
+    def apply_congestion_control(self):
+        """reduce fps and resolution of current configuration when controller signals congestion"""
+        if self.congestion < self.congestion_threshold:
+            return
+
+        if 'fps' in self.meta_data:
+            self.meta_data['fps'] = max(self.min_fps, int(int(self.meta_data['fps']) * (1 - self.congestion)))
+        if 'resolution' in self.meta_data and self.congestion >= self.congestion_resolution_threshold:
+            self.meta_data['resolution'] = VideoOps.lower_resolution(self.meta_data['resolution'])
+        LOGGER.info(f'[Congestion Control] source: {self.source_id}  congestion: {self.congestion:.2f}  '
+                    f'fps: {self.meta_data.get("fps")}  resolution: {self.meta_data.get("resolution")}')
+
     @staticmethod
     def record_total_start_ts(cur_task: Task):
         TimeEstimator.record_task_ts(cur_task,
@@ -72,7 +93,8 @@ class Generator:
                     hash_data=hash_codes,
                     file_path=compressed_path)
 
-    def submit_task_to_controller(self, cur_task):
+    def submit_task_to_controller(self, cur_task, file_data=None):
+        """submit task with its file, or with file_data as file content if file_data (bytes) is given"""
         assert cur_task, 'Task is empty when submit to controller!'
 
         self.before_submit_task_operation(self, cur_task)
@@ -82,14 +104,20 @@ class Generator:
         controller_address = merge_address(controller_ip,
                                            port=self.controller_port,
                                            path=NetworkAPIPath.CONTROLLER_TASK)
+        if file_data is None:
+            with open(cur_task.get_file_path(), 'rb') as f:
+                file_data = f.read()
         self.record_transmit_start_ts(cur_task)
-        http_request(url=controller_address,
-                     method=NetworkAPIMethod.CONTROLLER_TASK,
-                     data={'data': cur_task.serialize()},
-                     files={'file': (cur_task.get_file_path(),
-                                     open(cur_task.get_file_path(), 'rb'),
-                                     'multipart/form-data')}
-                     )
+        with Tracer.span('generator/serialize', cur_task):
+            payload = TaskEnvelopeNegotiator.build_task_payload(
+                controller_address, cur_task,
+                files={'file': (cur_task.get_file_path(), file_data, 'multipart/form-data')})
+        with Tracer.span('generator/upload', cur_task, size=len(file_data)):
+            response = http_request(url=controller_address,
+                                    method=NetworkAPIMethod.CONTROLLER_TASK,
+                                    **payload)
+        if response:
+            self.congestion = response.get('congestion', 0)
         LOGGER.info(f'[To Controller {dst_device}] source: {cur_task.get_source_id()}  '
                     f'task: {cur_task.get_task_id()}  '
                     f'file: {cur_task.get_file_path()}')
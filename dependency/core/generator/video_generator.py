@@ -16,9 +16,9 @@ class VideoGenerator(Generator):
         self.frame_compress = Context.get_algorithm('GEN_COMPRESS')
         self.getter_filter = Context.get_algorithm('GEN_GETTER_FILTER')
 
-    def submit_task_to_controller(self, cur_task):
+    def submit_task_to_controller(self, cur_task, file_data=None):
         self.record_total_start_ts(cur_task)
-        super().submit_task_to_controller(cur_task)
+        super().submit_task_to_controller(cur_task, file_data=file_data)
 
     def run(self):
         # initialize with default schedule policy
@@ -31,3 +31,4 @@ class VideoGenerator(Generator):
             self.data_getter(self)
 
             self.request_schedule_policy()
+            self.apply_congestion_control()
@@ -1,7 +1,8 @@
 import abc
-import threading
 import copy
 import os
+import queue
+import threading
 import time
 
 from .base_getter import BaseDataGetter
@@ -18,10 +19,15 @@ class RtspVideoGetter(BaseDataGetter, abc.ABC):
     simulate real video source, without accuracy information
     """
 
-    def __init__(self):
+    def __init__(self, encode_workers=2, encode_queue_size=4):
         self.data_source_capture = None
         self.frame_buffer = []
         self.file_suffix = 'mp4'
+        # persistent workers processing and compressing frame buffers into tasks,
+        # buffers waiting for workers are bounded so that they do not pile up when encoding falls behind
+        self.encode_queue = queue.Queue(maxsize=encode_queue_size)
+        for _ in range(encode_workers):
+            threading.Thread(target=self.loop_encode, daemon=True).start()
         # Backoff for reconnect attempts (seconds)
         self._reconnect_backoff = 0.5
 
@@ -91,11 +97,26 @@ class RtspVideoGetter(BaseDataGetter, abc.ABC):
             for frame in frame_buffer
         ]
         file_name = NameMaintainer.get_task_data_file_name(source_id, new_task_id, file_suffix=self.file_suffix)
-        self.compress_frames(system, frame_buffer, file_name)
+        # in-memory compress returns encoded bytes instead of writing file
+        file_data = self.compress_frames(system, frame_buffer, file_name)
+        if not isinstance(file_data, bytes):
+            file_data = None
 
         new_task = system.generate_task(new_task_id, task_dag, meta_data, file_name, None)
-        system.submit_task_to_controller(new_task)
-        FileOps.remove_file(file_name)
+        system.submit_task_to_controller(new_task, file_data=file_data)
+        if file_data is None:
+            FileOps.remove_file(file_name)
+
+    def loop_encode(self):
+        while True:
+            self.generate_and_send_new_task_safely(*self.encode_queue.get())
+
+    def generate_and_send_new_task_safely(self, *args):
+        try:
+            self.generate_and_send_new_task(*args)
+        except Exception as e:
+            LOGGER.warning(f'Generate new task failed: {str(e)}')
+            LOGGER.exception(e)
 
     def __call__(self, system):
         while len(self.frame_buffer) < system.meta_data['buffer_size']:
@@ -104,12 +125,17 @@ class RtspVideoGetter(BaseDataGetter, abc.ABC):
                 self.frame_buffer.append(frame)
 
         # generate tasks in parallel to avoid getting stuck with video compression
+        # frames are not modified afterward, so the buffer is handed over without copy
+        # real-time stream is not blocked by encoding: the segment is dropped if workers are saturated
         new_task_id = Counter.get_count('task_id')
-        threading.Thread(target=self.generate_and_send_new_task,
-                         args=(system,
-                               copy.deepcopy(self.frame_buffer),
-                               new_task_id,
-                               copy.deepcopy(system.task_dag),
-                               copy.deepcopy(system.meta_data),)).start()
+        try:
+            self.encode_queue.put_nowait((system,
+                                          self.frame_buffer,
+                                          new_task_id,
+                                          copy.deepcopy(system.task_dag),
+                                          copy.deepcopy(system.meta_data)))
+        except queue.Full:
+            LOGGER.warning(f'[Frame Buffer] (source {system.source_id} / task {new_task_id}) '
+                           f'encoding falls behind, drop segment of {len(self.frame_buffer)} frames')
 
         self.frame_buffer = []
@@ -1,25 +1,27 @@
 import abc
 
-from core.lib.common import ClassFactory, ClassType, NameMaintainer
+from core.lib.common import ClassFactory, ClassType
 from .base_compress import BaseCompress
+from .video_encoder import VideoEncoderPool
 
 __all__ = ('SimpleCompress',)
 
 
 @ClassFactory.register(ClassType.GEN_COMPRESS, alias='simple')
 class SimpleCompress(BaseCompress, abc.ABC):
-    def __init__(self):
-        pass
+    def __init__(self, encoder='opencv', in_memory=False, fps=30, **encoder_params):
+        """
+        encoder: encoder backend ('opencv' / 'ffmpeg'), extra encoder_params (eg: codec, preset, crf) go to backend
+        in_memory: return encoded bytes instead of writing into file_name
+        """
+        self.encoder_pool = VideoEncoderPool(encoder, **encoder_params)
+        self.in_memory = in_memory
+        self.fps = fps
 
     def __call__(self, system, frame_buffer, file_name):
         assert frame_buffer, 'frame buffer is empty!'
 
-        import cv2
-        buffer_path = file_name
+        if self.in_memory:
+            return self.encoder_pool.encode(frame_buffer, file_name, system.meta_data['encoding'], self.fps)
 
-        fourcc = cv2.VideoWriter_fourcc(*system.meta_data['encoding'])
-        height, width, _ = frame_buffer[0].shape
-        out = cv2.VideoWriter(buffer_path, fourcc, 30, (width, height))
-        for frame in frame_buffer:
-            out.write(frame)
-        out.release()
+        self.encoder_pool.encode_to_file(frame_buffer, file_name, system.meta_data['encoding'], self.fps)
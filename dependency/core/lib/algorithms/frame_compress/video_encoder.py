@@ -0,0 +1,122 @@
+import os
+import subprocess
+import threading
+
+from core.lib.common import LOGGER, FileOps
+
+
+class VideoEncoder:
+    """
+    encoder backend encoding a list of frames into video segment
+    one encoder instance is kept by one worker across segments
+    """
+
+    def encode(self, frames, file_name, encoding, fps):
+        """encode frames into bytes of video segment"""
+        raise NotImplementedError
+
+    def encode_to_file(self, frames, file_name, encoding, fps):
+        """encode frames into video file of file_name"""
+        data = self.encode(frames, file_name, encoding, fps)
+        with open(file_name, 'wb') as f:
+            f.write(data)
+
+
+class OpenCVEncoder(VideoEncoder):
+    """
+    encode with cv2.VideoWriter
+    segments are written into memory-backed directory (/dev/shm) if available before read back into memory
+    """
+    memory_dir = '/dev/shm'
+
+    def __init__(self):
+        import cv2
+        self.writer = cv2.VideoWriter()
+        self.tmp_dir = self.memory_dir if os.path.isdir(self.memory_dir) else '.'
+
+    def encode(self, frames, file_name, encoding, fps):
+        tmp_path = os.path.join(self.tmp_dir, f'encode_{threading.get_ident()}_{os.path.basename(file_name)}')
+        self.encode_to_file(frames, tmp_path, encoding, fps)
+
+        with open(tmp_path, 'rb') as f:
+            data = f.read()
+        FileOps.remove_file(tmp_path)
+        return data
+
+    def encode_to_file(self, frames, file_name, encoding, fps):
+        import cv2
+
+        height, width, _ = frames[0].shape
+        self.writer.open(file_name, cv2.VideoWriter_fourcc(*encoding), fps, (width, height))
+        for frame in frames:
+            self.writer.write(frame)
+        self.writer.release()
+
+
+class FFmpegEncoder(VideoEncoder):
+    """
+    encode by piping raw frames into ffmpeg subprocess, and reading the segment from its stdout
+    codec can be hardware encoders supported by ffmpeg (eg: h264_nvenc, h264_v4l2m2m)
+    one ffmpeg process is started per segment (each segment is a standalone mp4), only the settings are kept
+    """
+
+    def __init__(self, codec='libx264', preset='veryfast', crf=23, ffmpeg_path='ffmpeg'):
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.ffmpeg_path = ffmpeg_path
+
+    def build_command(self, width, height, fps):
+        command = [self.ffmpeg_path, '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps),
+                   '-i', 'pipe:0',
+                   '-c:v', self.codec, '-pix_fmt', 'yuv420p']
+        if self.preset:
+            command += ['-preset', str(self.preset)]
+        if self.crf is not None:
+            command += ['-crf', str(self.crf)]
+        # fragmented mp4 can be written into a non-seekable pipe
+        command += ['-movflags', 'frag_keyframe+empty_moov', '-f', 'mp4', 'pipe:1']
+        return command
+
+    def encode(self, frames, file_name, encoding, fps):
+        import numpy as np
+
+        height, width, _ = frames[0].shape
+        process = subprocess.Popen(self.build_command(width, height, fps),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # communicate feeds stdin while draining stdout and stderr, so neither full pipe blocks ffmpeg
+        output, stderr = process.communicate(memoryview(np.stack(frames)).cast('B'))
+
+        if process.returncode != 0:
+            LOGGER.warning(f'[FFmpeg Encoder] encoding failed with code {process.returncode}: '
+                           f'{stderr.decode(errors="ignore")}')
+            raise RuntimeError(f'ffmpeg exits with code {process.returncode}')
+        return output
+
+
+class VideoEncoderPool:
+    """keep one encoder instance for each thread, used for all segments encoded in that thread"""
+
+    backends = {
+        'opencv': OpenCVEncoder,
+        'ffmpeg': FFmpegEncoder,
+    }
+
+    def __init__(self, backend='opencv', **encoder_params):
+        assert backend in self.backends, f'Invalid encoder backend "{backend}"!'
+        self.backend = backend
+        self.encoder_params = encoder_params
+        self.local = threading.local()
+
+    def get_encoder(self) -> VideoEncoder:
+        if getattr(self.local, 'encoder', None) is None:
+            self.local.encoder = self.backends[self.backend](**self.encoder_params)
+        return self.local.encoder
+
+    def encode(self, frames, file_name, encoding, fps):
+        return self.get_encoder().encode(frames, file_name, encoding, fps)
+
+    def encode_to_file(self, frames, file_name, encoding, fps):
+        self.get_encoder().encode_to_file(frames, file_name, encoding, fps)
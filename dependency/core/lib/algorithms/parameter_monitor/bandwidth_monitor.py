@@ -1,16 +1,26 @@
 import abc
 import threading
+import time
 from func_timeout import func_set_timeout as timeout
 
 from .base_monitor import BaseMonitor
 
-from core.lib.common import ClassFactory, ClassType, LOGGER
+from core.lib.common import ClassFactory, ClassType, LOGGER, Context, SystemConstant
+from core.lib.network import PortInfo, merge_address, NetworkAPIPath, NetworkAPIMethod, http_request
 
 __all__ = ('BandwidthMonitor',)
 
 
 @ClassFactory.register(ClassType.MON_PRAM, alias='bandwidth')
 class BandwidthMonitor(BaseMonitor, abc.ABC):
+    """
+    bandwidth from edge device to cloud
+
+    bandwidth is passively estimated by cloud controller from timed task transfers of the link,
+    an iperf3 probe is only run when the link has been idle for BANDWIDTH_IDLE_TIME seconds,
+    and at most once every BANDWIDTH_PROBE_INTERVAL seconds (the latest value is reported in between)
+    """
+
     def __init__(self, system):
         super().__init__(system)
         self.name = 'bandwidth'
@@ -24,6 +34,18 @@ class BandwidthMonitor(BaseMonitor, abc.ABC):
             self.iperf3_port = system.iperf3_port
             self.iperf3_server_ip = system.iperf3_server_ip
 
+            self.local_device = system.local_device
+            self.estimation_address = merge_address(self.iperf3_server_ip,
+                                                    port=PortInfo.get_component_port(
+                                                        SystemConstant.CONTROLLER.value),
+                                                    path=NetworkAPIPath.CONTROLLER_BANDWIDTH)
+            self.idle_time = Context.get_parameter('BANDWIDTH_IDLE_TIME', '30', direct=False)
+            self.probe_interval = Context.get_parameter('BANDWIDTH_PROBE_INTERVAL', '60', direct=False)
+            self.probe_duration = Context.get_parameter('BANDWIDTH_PROBE_DURATION', '1', direct=False)
+
+            self.last_probe_time = 0
+            self.last_bandwidth = 0
+
     def run_iperf_server(self):
         for port in self.iperf3_ports:
             threading.Thread(target=self.iperf_server, args=(port,)).start()
@@ -46,17 +68,38 @@ class BandwidthMonitor(BaseMonitor, abc.ABC):
                 LOGGER.warning(result.error)
 
     def get_parameter_value(self):
-        import iperf3
         if self.is_server:
             return 0
 
-        @timeout(2)
+        bandwidth = self.get_passive_bandwidth()
+        if bandwidth is not None:
+            self.last_bandwidth = bandwidth
+        elif time.time() - self.last_probe_time >= self.probe_interval:
+            self.last_probe_time = time.time()
+            self.last_bandwidth = self.probe_bandwidth()
+
+        return self.last_bandwidth
+
+    def get_passive_bandwidth(self):
+        """passive estimation of link to cloud, None if the link is idle"""
+        estimate = http_request(self.estimation_address,
+                                method=NetworkAPIMethod.CONTROLLER_BANDWIDTH,
+                                params={'sender': self.local_device},
+                                timeout=1)
+        if not estimate or estimate['idle_time'] > self.idle_time:
+            return None
+        return estimate['bandwidth']
+
+    def probe_bandwidth(self):
+        import iperf3
+
+        @timeout(self.probe_duration + 1)
         def fetch_bandwidth_by_iperf3():
             result = client.run()
             return result
 
         client = iperf3.Client()
-        client.duration = 1
+        client.duration = self.probe_duration
         client.server_hostname = self.iperf3_server_ip
         client.port = self.iperf3_port
         client.protocol = 'tcp'
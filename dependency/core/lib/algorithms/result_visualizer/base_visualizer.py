@@ -4,6 +4,9 @@ from core.lib.content import Task
 
 
 class BaseVisualizer(metaclass=abc.ABCMeta):
+    # task fields needed for visualization (None for all fields)
+    required_fields = None
+
     def __init__(self, **kwargs):
         self.variables = kwargs.get('variables', [])
 
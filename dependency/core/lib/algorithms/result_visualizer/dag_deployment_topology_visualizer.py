@@ -9,6 +9,8 @@ __all__ = ('DAGDeploymentTopologyVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='dag_deployment')
 class DAGDeploymentTopologyVisualizer(TopologyVisualizer, abc.ABC):
+    required_fields = ('dag',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -10,6 +10,8 @@ __all__ = ('DAGOffloadingTopologyVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='dag_offloading')
 class DAGOffloadingTopologyVisualizer(TopologyVisualizer, abc.ABC):
+    required_fields = ('dag',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -9,6 +9,8 @@ __all__ = ('EndToEndDelayVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='e2e_delay')
 class EndToEndDelayVisualizer(CurveVisualizer, abc.ABC):
+    required_fields = ('dag', 'cur_flow_index')
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -1,6 +1,6 @@
 import abc
 
-from core.lib.common import ClassFactory, ClassType, EncodeOps, LOGGER
+from core.lib.common import ClassFactory, ClassType
 from core.lib.content import Task
 
 from .image_visualizer import ImageVisualizer
@@ -14,17 +14,4 @@ class FrameVisualizer(ImageVisualizer, abc.ABC):
         super().__init__(**kwargs)
 
     def __call__(self, task: Task):
-        file_path = task.get_file_path()
-
-        try:
-            image = self.get_first_frame_from_video(file_path)
-            base64_data = EncodeOps.encode_image(image)
-        except Exception as e:
-            import cv2
-            base64_data = EncodeOps.encode_image(
-                cv2.imread(self.default_visualization_image)
-            )
-            LOGGER.warning(f'Video visualization fetch failed: {str(e)}')
-            LOGGER.exception(e)
-
-        return {'image': base64_data}
+        return {'image': self.visualize_first_frame(task)}
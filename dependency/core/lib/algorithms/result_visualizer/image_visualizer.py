@@ -1,5 +1,7 @@
 import abc
+import os
 
+from core.lib.common import EncodeOps, LOGGER, LRUCache, VideoOps
 from core.lib.content import Task
 
 from .base_visualizer import BaseVisualizer
@@ -8,9 +10,69 @@ from .base_visualizer import BaseVisualizer
 class ImageVisualizer(BaseVisualizer, abc.ABC):
     default_visualization_image = 'default_visualization.png'
 
+    # metadata is needed to scale boxes onto thumbnails
+    required_fields = ('file_path', 'meta_data')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # encoded images of latest tasks
+        self.image_cache = LRUCache(kwargs.get('image_cache_size', 32))
+        self.default_image_data = None
+
     def __call__(self, task: Task):
         raise NotImplementedError
 
+    def visualize_first_frame(self, task: Task, draw=None):
+        """
+        base64 image of the first frame of task, drawn by draw(frame, scale) if given,
+        the default visualization image if failed
+        """
+        cache_key = task.get_root_uuid()
+        base64_data = self.image_cache.get(cache_key)
+        if base64_data is not None:
+            return base64_data
+
+        try:
+            frame, scale = self.get_first_frame(task)
+            if draw:
+                frame = draw(frame, scale)
+            base64_data = EncodeOps.encode_image(frame)
+        except Exception as e:
+            LOGGER.warning(f'Video visualization fetch failed: {str(e)}')
+            LOGGER.exception(e)
+            return self.get_default_image_data()
+
+        self.image_cache.put(cache_key, base64_data)
+        return base64_data
+
+    def get_default_image_data(self):
+        if self.default_image_data is None:
+            import cv2
+            self.default_image_data = EncodeOps.encode_image(cv2.imread(self.default_visualization_image))
+        return self.default_image_data
+
+    def get_first_frame(self, task: Task):
+        """
+        first frame of task and its scale to the frame in task file,
+        read from the thumbnail made by distributor if it is fetched, otherwise decoded from the video
+        """
+        thumbnail_path = VideoOps.get_thumbnail_path(task.get_file_path())
+        if os.path.exists(thumbnail_path):
+            import cv2
+            frame = cv2.imread(thumbnail_path)
+            if frame is None:
+                raise ValueError(f'Failed to read thumbnail {thumbnail_path}.')
+            frame_width, _ = VideoOps.text2resolution(task.get_metadata()['resolution'])
+            return frame, frame.shape[1] / frame_width
+
+        return self.get_first_frame_from_video(task.get_file_path()), 1
+
+    @staticmethod
+    def scale_bboxes(bboxes, scale):
+        if scale == 1:
+            return bboxes
+        return [[coordinate * scale for coordinate in box] for box in bboxes]
+
     @staticmethod
     def get_first_frame_from_video(video_path):
         """
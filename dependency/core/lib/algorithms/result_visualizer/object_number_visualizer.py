@@ -10,6 +10,8 @@ __all__ = ('ObjectNumberVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='obj_num')
 class ObjectNumberVisualizer(CurveVisualizer, abc.ABC):
+    required_fields = ('scenario_data',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
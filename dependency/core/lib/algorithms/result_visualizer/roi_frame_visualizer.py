@@ -1,6 +1,6 @@
 import abc
 
-from core.lib.common import ClassFactory, ClassType, EncodeOps, LOGGER
+from core.lib.common import ClassFactory, ClassType
 from core.lib.content import Task
 
 from .image_visualizer import ImageVisualizer
@@ -10,6 +10,8 @@ __all__ = ('ROIFrameVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='roi_frame')
 class ROIFrameVisualizer(ImageVisualizer, abc.ABC):
+    required_fields = ('dag', 'file_path', 'meta_data')
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.roi_service = kwargs.get('roi_service', None)
@@ -22,19 +24,8 @@ class ROIFrameVisualizer(ImageVisualizer, abc.ABC):
                 content = task.get_first_content()
         except Exception as e:
             content = task.get_first_content()
-        file_path = task.get_file_path()
 
-        try:
-            image = self.get_first_frame_from_video(file_path)
-            image = self.draw_bboxes(image, content[0][0])
+        def draw(image, scale):
+            return self.draw_bboxes(image, self.scale_bboxes(content[0][0], scale))
 
-            base64_data = EncodeOps.encode_image(image)
-        except Exception as e:
-            import cv2
-            base64_data = EncodeOps.encode_image(
-                cv2.imread(self.default_visualization_image)
-            )
-            LOGGER.warning(f'Video visualization fetch failed: {str(e)}')
-            LOGGER.exception(e)
-
-        return {'image': base64_data}
+        return {'image': self.visualize_first_frame(task, draw)}
@@ -1,6 +1,6 @@
 import abc
 
-from core.lib.common import ClassFactory, ClassType, EncodeOps, LOGGER
+from core.lib.common import ClassFactory, ClassType
 from core.lib.content import Task
 
 from .image_visualizer import ImageVisualizer
@@ -10,6 +10,8 @@ __all__ = ('ROILabelFrameVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='roi_label_frame')
 class ROILabelFrameVisualizer(ImageVisualizer, abc.ABC):
+    required_fields = ('dag', 'file_path', 'meta_data')
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.roi_service = kwargs.get('roi_service', None)
@@ -32,19 +34,8 @@ class ROILabelFrameVisualizer(ImageVisualizer, abc.ABC):
         except Exception as e:
             label_content = task.get_last_content()
 
-        file_path = task.get_file_path()
-
-        try:
-            image = self.get_first_frame_from_video(file_path)
-            image = self.draw_bboxes_and_labels(image, roi_content[0][0], label_content[0][0])
+        def draw(image, scale):
+            return self.draw_bboxes_and_labels(image, self.scale_bboxes(roi_content[0][0], scale),
+                                               label_content[0][0])
 
-            base64_data = EncodeOps.encode_image(image)
-        except Exception as e:
-            import cv2
-            base64_data = EncodeOps.encode_image(
-                cv2.imread(self.default_visualization_image)
-            )
-            LOGGER.warning(f'Video visualization fetch failed: {str(e)}')
-            LOGGER.exception(e)
-
-        return {'image': base64_data}
+        return {'image': self.visualize_first_frame(task, draw)}
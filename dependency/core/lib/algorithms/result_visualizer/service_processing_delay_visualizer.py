@@ -9,6 +9,8 @@ __all__ = ('ServiceProcessingDelayVisualizer',)
 
 @ClassFactory.register(ClassType.RESULT_VISUALIZER, alias='service_processing_delay')
 class ServiceProcessingDelayVisualizer(CurveVisualizer, abc.ABC):
+    required_fields = ('dag',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -161,7 +161,7 @@ class CASVAAgent(BaseAgent, abc.ABC):
 
     def calculate_drl_reward(self, evaluation_info):
 
-        acc_list = []
+        acc_batch = []
         transmit_delay_list = []
         buffer_size_list = []
 
@@ -186,9 +186,9 @@ class CASVAAgent(BaseAgent, abc.ABC):
 
             if not self.acc_estimator:
                 self.create_acc_estimator(service_name=dag.get_next_nodes('start')[0])
-            acc = self.acc_estimator.calculate_accuracy(hash_data, content, resolution_ratio, fps_ratio)
-            acc_list.append(acc)
+            acc_batch.append((hash_data, content, resolution_ratio, fps_ratio))
 
+        acc_list = self.acc_estimator.calculate_accuracy_batch(acc_batch) if acc_batch else []
         final_acc = np.mean(acc_list)
         final_transmit_delay = np.mean(transmit_delay_list)
         final_buffer_size = np.mean(buffer_size_list)
@@ -1,53 +1,56 @@
+from collections import deque
+
 import numpy as np
-from core.lib.common import LOGGER
+from core.lib.common import LOGGER, RingBuffer
 
 
 class StateBuffer:
-    def __init__(self, window_size):
-        self.resources = []
-        self.scenarios = []
-        self.decisions = []
-        self.tasks = []
+    """
+    latest states of resource / scenario / decision kept in ring buffers, and tasks for evaluation
+
+    states are updated by the scheduler server (single writer) and read by the agent thread (single reader)
+    """
 
+    def __init__(self, window_size, max_tasks=1000):
         self.window_size = window_size
-        self.max_size = window_size*2
+        self.max_size = window_size * 2
+
+        self.resources = RingBuffer(self.max_size)
+        self.scenarios = RingBuffer(self.max_size)
+        self.decisions = RingBuffer(self.max_size)
+        # oldest tasks are dropped if the agent does not take them in time
+        self.tasks = deque(maxlen=max_tasks)
 
     def add_resource_buffer(self, resource):
-        self.resources.append(resource)
-        while len(self.resources) > self.max_size:
-            self.resources.pop(0)
+        self.resources.put(resource)
 
     def add_scenario_buffer(self, scenario):
-        self.scenarios.append(scenario)
-        while len(self.scenarios) > self.max_size:
-            self.scenarios.pop(0)
+        self.scenarios.put(scenario)
 
     def add_decision_buffer(self, decision):
-        self.decisions.append(decision)
-        while len(self.decisions) > self.max_size:
-            self.decisions.pop(0)
+        self.decisions.put(decision)
 
     def add_task_buffer(self, task):
         self.tasks.append(task)
 
     def get_resource_buffer(self):
-        return np.array(self.resources.copy())
+        return self.resources.get()
 
     def get_scenario_buffer(self):
-        return np.array(self.scenarios.copy())
+        return self.scenarios.get()
 
     def get_decision_buffer(self):
-        return np.array(self.decisions.copy())
+        return self.decisions.get()
 
     def get_task_buffer(self):
-        return np.array(self.tasks.copy())
+        return np.array(list(self.tasks))
 
     def get_state_buffer(self):
 
-        resources = self.resources.copy()
-        scenarios = self.scenarios.copy()
-        decisions = self.decisions.copy()
-        tasks = self.tasks.copy()
+        resources = self.resources.get()
+        scenarios = self.scenarios.get()
+        decisions = self.decisions.get()
+        tasks = self.take_tasks()
 
         if len(tasks) == 0:
             evaluation_info = None
@@ -62,9 +65,9 @@ class StateBuffer:
             LOGGER.debug(f'[Scenario Buffer] length: {len(scenarios)}, content: {scenarios}')
             LOGGER.debug(f'[Decision Buffer] length: {len(decisions)}, content: {decisions}')
 
-            resources = np.array(self.resample_buffer(resources, self.window_size))
-            scenarios = np.array(self.resample_buffer(scenarios, self.window_size))
-            decisions = np.array(self.resample_buffer(decisions, self.window_size))
+            resources = self.resample_buffer(resources, self.window_size)
+            scenarios = self.resample_buffer(scenarios, self.window_size)
+            decisions = self.resample_buffer(decisions, self.window_size)
 
             LOGGER.debug(f'[Resample Resource Buffer] length: {len(resources)}, content: {resources}')
             LOGGER.debug(f'[Resample Scenario Buffer] length: {len(scenarios)}, content: {scenarios}')
@@ -73,32 +76,20 @@ class StateBuffer:
             state = np.vstack((resources.T, scenarios.T, decisions.T))
             LOGGER.debug(f'[State Buffer] content: {state}')
 
-        self.clear_state_buffer()
         return state, evaluation_info
 
+    def take_tasks(self):
+        """take out buffered tasks, tasks added meanwhile are kept for the next time"""
+        tasks = []
+        while True:
+            try:
+                tasks.append(self.tasks.popleft())
+            except IndexError:
+                return tasks
+
     def clear_state_buffer(self):
-        # self.resources.clear()
-        # self.scenarios.clear()
-        # self.decisions.clear()
         self.tasks.clear()
 
     @staticmethod
     def resample_buffer(buffer, size):
-        buffer_length = len(buffer)
-        assert buffer_length != 0, 'Resample buffer size is 0!'
-
-        if buffer_length > size:
-            indices = np.linspace(0, buffer_length - 1, num=size, dtype=int)
-            resized_buffer = [buffer[idx] for idx in indices]
-        elif buffer_length < size:
-            resized_buffer = []
-            repeat_factor = size // buffer_length
-            extra_slots = size % buffer_length
-            for i in range(buffer_length):
-                resized_buffer.extend([buffer[i]] * repeat_factor)
-                if extra_slots > 0:
-                    resized_buffer.append(buffer[i])
-                    extra_slots -= 1
-        else:
-            resized_buffer = buffer[:]
-        return resized_buffer
+        return RingBuffer.resample(np.asarray(buffer), size)
@@ -132,7 +132,7 @@ class HEIAgent(BaseAgent, abc.ABC):
 
     def calculate_drl_reward(self, evaluation_info):
         delay_bias_list = []
-        acc_list = []
+        acc_batch = []
 
         for task in evaluation_info:
             delay = task.calculate_total_time()
@@ -151,13 +151,13 @@ class HEIAgent(BaseAgent, abc.ABC):
 
             if not self.acc_estimator:
                 self.create_acc_estimator(service_name=dag.get_next_nodes('start')[0])
-            acc = self.acc_estimator.calculate_accuracy(hash_data, content, resolution_ratio, fps_ratio)
-            acc_list.append(acc)
+            acc_batch.append((hash_data, content, resolution_ratio, fps_ratio))
 
             single_task_delay = delay / meta_data['buffer_size']
             single_task_constraint = 1 / meta_data['fps']
             delay_bias_list.append(single_task_constraint * self.relaxed_coefficient - single_task_delay)
 
+        acc_list = self.acc_estimator.calculate_accuracy_batch(acc_batch) if acc_batch else []
         final_delay = np.mean(delay_bias_list)
         final_acc = np.mean(acc_list)
         LOGGER.info(f'[Reward Computing] delay:{final_delay} acc:{final_acc}')
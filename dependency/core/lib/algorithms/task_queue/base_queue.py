@@ -2,13 +2,22 @@ import abc
 
 
 class BaseQueue(metaclass=abc.ABCMeta):
-    def get(self):
+    def get(self, block=False, timeout=None):
+        """
+        get a task from queue, return None if no task is available
+        :param block: whether to wait for a task when queue is empty
+        :param timeout: maximum seconds to wait in blocking mode (None for waiting forever)
+        """
         raise NotImplementedError
 
     def size(self):
         raise NotImplementedError
 
     def put(self, task):
+        """
+        put a task into queue
+        :return: tasks dropped from queue to make room for the new task
+        """
         raise NotImplementedError
 
     def empty(self):
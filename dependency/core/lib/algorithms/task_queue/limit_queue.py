@@ -1,8 +1,8 @@
 import abc
 import threading
-from queue import Queue
+from collections import deque
 
-from core.lib.common import ClassFactory, ClassType
+from core.lib.common import ClassFactory, ClassType, LOGGER
 from core.lib.content import Task
 from .base_queue import BaseQueue
 
@@ -11,26 +11,37 @@ __all__ = ('LimitQueue',)
 
 @ClassFactory.register(ClassType.PRO_QUEUE, alias='limit')
 class LimitQueue(BaseQueue, abc.ABC):
+    """bounded queue keeping the latest `max_size` tasks, the oldest tasks are dropped when it is full"""
+
     def __init__(self, max_size):
-        self._queue = Queue()
+        self._queue = deque()
         self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
         self.max_size = max_size
 
-    def get(self):
-        with self.lock:
-            if self._queue.empty():
+    def get(self, block=False, timeout=None):
+        with self.not_empty:
+            if block:
+                self.not_empty.wait_for(lambda: len(self._queue) > 0, timeout=timeout)
+            if not self._queue:
                 return None
-            return self._queue.get()
+            return self._queue.popleft()
+
+    def put(self, task: Task) -> list:
+        with self.not_empty:
+            dropped_tasks = []
+            while self._queue and len(self._queue) >= self.max_size:
+                dropped_tasks.append(self._queue.popleft())
+            self._queue.append(task)
+            self.not_empty.notify()
 
-    def put(self, task: Task) -> None:
-        with self.lock:
-            if self.size() > self.max_size:
-                for _ in range(self.size()//2):
-                    self._queue.get()
-                self._queue.put(task)
+        for dropped_task in dropped_tasks:
+            LOGGER.warning(f'[Task Queue] Queue is full, drop task: source {dropped_task.get_source_id()} / '
+                           f'task {dropped_task.get_task_id()}')
+        return dropped_tasks
 
     def size(self) -> int:
-        return self._queue.qsize()
+        return len(self._queue)
 
     def empty(self) -> bool:
-        return self._queue.empty()
+        return len(self._queue) == 0
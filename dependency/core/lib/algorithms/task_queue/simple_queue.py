@@ -1,6 +1,6 @@
 import abc
 import threading
-from queue import Queue
+from collections import deque
 
 from core.lib.common import ClassFactory, ClassType
 from core.lib.content import Task
@@ -12,21 +12,26 @@ __all__ = ('SimpleQueue',)
 @ClassFactory.register(ClassType.PRO_QUEUE, alias='simple')
 class SimpleQueue(BaseQueue, abc.ABC):
     def __init__(self):
-        self._queue = Queue()
+        self._queue = deque()
         self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
 
-    def get(self):
-        with self.lock:
-            if self._queue.empty():
+    def get(self, block=False, timeout=None):
+        with self.not_empty:
+            if block:
+                self.not_empty.wait_for(lambda: len(self._queue) > 0, timeout=timeout)
+            if not self._queue:
                 return None
-            return self._queue.get()
+            return self._queue.popleft()
 
-    def put(self, task: Task) -> None:
-        with self.lock:
-            self._queue.put(task)
+    def put(self, task: Task) -> list:
+        with self.not_empty:
+            self._queue.append(task)
+            self.not_empty.notify()
+        return []
 
     def size(self) -> int:
-        return self._queue.qsize()
+        return len(self._queue)
 
     def empty(self) -> bool:
-        return self._queue.empty()
+        return len(self._queue) == 0
@@ -14,3 +14,6 @@ from .error import *
 from .kube import KubeConfig
 from .name import NameMaintainer
 from .counter import Counter
+from .ring_buffer import RingBuffer
+from .lru_cache import LRUCache
+from .metrics import Metrics
@@ -27,6 +27,19 @@ class FileOps:
         else:
             os.remove(file_path)
 
+    @staticmethod
+    def link_file(src_path, dst_path):
+        """hard link src_path to dst_path, return False if the two paths are not on one file system"""
+        dir_path = os.path.dirname(dst_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        FileOps.remove_file(dst_path)
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            return False
+        return True
+
     @staticmethod
     def create_directory(dir_path):
         if not os.path.exists(dir_path):
@@ -0,0 +1,286 @@
+import bisect
+import threading
+import time
+
+from .context import Context
+
+
+class MetricFamily:
+    """
+    base of metrics with labels, sharded per thread so that updating takes no lock:
+    each thread only writes its own shard, shards are merged when metrics are exported
+    """
+
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, description: str, label_names: tuple = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+        self.shards = []
+        self.local = threading.local()
+
+    def get_shard(self) -> dict:
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {}
+            # list appending is atomic, shards of exited threads are kept for merging
+            self.shards.append(shard)
+        return shard
+
+    def get_key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label_name, '')) for label_name in self.label_names)
+
+    def format_labels(self, key: tuple, extra_labels: dict = None) -> str:
+        labels = list(zip(self.label_names, key))
+        if extra_labels:
+            labels.extend(extra_labels.items())
+        if not labels:
+            return ''
+        labels = ','.join(f'{name}="{self.escape_label_value(value)}"' for name, value in labels)
+        return f'{{{labels}}}'
+
+    @staticmethod
+    def escape_label_value(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def collect(self) -> dict:
+        """label key -> merged value of all shards"""
+        raise NotImplementedError
+
+    def export(self) -> list:
+        """lines of prometheus text exposition format"""
+        raise NotImplementedError
+
+
+class MetricCounter(MetricFamily):
+    """monotonically increasing value (eg: requests, bytes, dropped tasks)"""
+
+    TYPE = 'counter'
+
+    def inc(self, value: float = 1, **labels):
+        shard = self.get_shard()
+        key = self.get_key(labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def collect(self) -> dict:
+        values = {}
+        for shard in list(self.shards):
+            for key, value in shard.copy().items():
+                values[key] = values.get(key, 0) + value
+        return values
+
+    def export(self) -> list:
+        return [f'{self.name}{self.format_labels(key)} {value}' for key, value in self.collect().items()]
+
+
+class MetricGauge(MetricCounter):
+    """
+    value going up and down, either changed by inc/dec (eg: tasks in flight)
+    or read from a function when exported (eg: queue length)
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, description: str, label_names: tuple = ()):
+        super().__init__(name, description, label_names)
+        # label key -> function returning current value
+        self.functions = {}
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+    def set_function(self, function, **labels):
+        self.functions[self.get_key(labels)] = function
+
+    def collect(self) -> dict:
+        values = super().collect()
+        for key, function in list(self.functions.items()):
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return values
+
+
+class MetricHistogram(MetricFamily):
+    """distribution of observed values (eg: latency in seconds) over fixed buckets"""
+
+    TYPE = 'histogram'
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, description: str, label_names: tuple = (), buckets: tuple = None):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+
+    def observe(self, value: float, **labels):
+        shard = self.get_shard()
+        key = self.get_key(labels)
+        # per-bucket (not cumulative) counts with the last one for +Inf, followed by sum
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def collect(self) -> dict:
+        values = {}
+        for shard in list(self.shards):
+            for key, state in shard.copy().items():
+                merged_state = values.setdefault(key, [0] * (len(self.buckets) + 2))
+                for index, value in enumerate(list(state)):
+                    merged_state[index] += value
+        return values
+
+    def export(self) -> list:
+        lines = []
+        for key, state in self.collect().items():
+            cumulative_count = 0
+            for bound, count in zip((*self.buckets, '+Inf'), state[:-1]):
+                cumulative_count += count
+                lines.append(f'{self.name}_bucket{self.format_labels(key, {"le": bound})} {cumulative_count}')
+            lines.append(f'{self.name}_sum{self.format_labels(key)} {state[-1]}')
+            lines.append(f'{self.name}_count{self.format_labels(key)} {cumulative_count}')
+        return lines
+
+
+class Metrics:
+    """
+    registry of runtime metrics of a component, exported in prometheus text format
+
+    metrics are registered by name on first use and shared within the process,
+    component servers mount the export route and per-route request metrics by `Metrics.install(app)`.
+    updating metrics is skipped altogether if METRICS_ENABLED is false.
+    """
+
+    PREFIX = 'dayu_'
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    enabled = Context.get_parameter('METRICS_ENABLED', 'True', direct=False)
+
+    __metrics = {}
+    __lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        raise RuntimeError("Metrics is a utility class and cannot be instantiated.")
+
+    @classmethod
+    def __register(cls, metric_class, name: str, description: str, label_names: tuple, **kwargs):
+        name = cls.PREFIX + name
+        metric = cls.__metrics.get(name)
+        if metric is None:
+            with cls.__lock:
+                metric = cls.__metrics.get(name)
+                if metric is None:
+                    metric = cls.__metrics[name] = metric_class(name, description, label_names, **kwargs)
+        assert type(metric) is metric_class, f'Metric {name} is registered as {metric.TYPE}'
+        return metric
+
+    @classmethod
+    def counter(cls, name: str, description: str = '', label_names: tuple = ()) -> MetricCounter:
+        return cls.__register(MetricCounter, name, description, label_names)
+
+    @classmethod
+    def gauge(cls, name: str, description: str = '', label_names: tuple = ()) -> MetricGauge:
+        return cls.__register(MetricGauge, name, description, label_names)
+
+    @classmethod
+    def histogram(cls, name: str, description: str = '', label_names: tuple = (),
+                  buckets: tuple = None) -> MetricHistogram:
+        return cls.__register(MetricHistogram, name, description, label_names, buckets=buckets)
+
+    @classmethod
+    def inc(cls, name: str, value: float = 1, **labels):
+        if cls.enabled:
+            cls.counter(name, label_names=tuple(labels)).inc(value, **labels)
+
+    @classmethod
+    def update(cls, name: str, delta: float, **labels):
+        if cls.enabled:
+            cls.gauge(name, label_names=tuple(labels)).inc(delta, **labels)
+
+    @classmethod
+    def observe(cls, name: str, value: float, **labels):
+        if cls.enabled:
+            cls.histogram(name, label_names=tuple(labels)).observe(value, **labels)
+
+    @classmethod
+    def timer(cls, name: str, **labels):
+        """context manager observing seconds of the enclosed code into histogram"""
+        return MetricTimer(name, labels)
+
+    @classmethod
+    def get_value(cls, name: str, default=None, **labels):
+        """current value of counter or gauge registered in this process (eg: read by in-process hooks)"""
+        metric = cls.__metrics.get(cls.PREFIX + name)
+        if metric is None or isinstance(metric, MetricHistogram):
+            return default
+        return metric.collect().get(metric.get_key(labels), default)
+
+    @classmethod
+    def export(cls) -> str:
+        lines = []
+        for name, metric in sorted(list(cls.__metrics.items())):
+            lines.append(f'# HELP {name} {metric.description or name}')
+            lines.append(f'# TYPE {name} {metric.TYPE}')
+            lines.extend(metric.export())
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def install(cls, app, path: str = '/metrics') -> None:
+        """mount export route and request rate/latency/bytes metrics per route on app"""
+        from starlette.responses import Response
+
+        async def export_metrics():
+            return Response(content=cls.export(), media_type=cls.CONTENT_TYPE)
+
+        app.add_api_route(path, export_metrics, methods=['GET'], include_in_schema=False)
+
+        if not cls.enabled:
+            return
+
+        request_count = cls.counter('http_requests_total', 'Requests handled per route',
+                               ('route', 'method', 'status'))
+        request_duration = cls.histogram('http_request_duration_seconds', 'Latency of requests per route',
+                                         ('route', 'method'))
+        received_bytes = cls.counter('http_received_bytes_total', 'Bytes of request bodies per route',
+                                     ('route', 'method'))
+        sent_bytes = cls.counter('http_sent_bytes_total', 'Bytes of response bodies per route',
+                                 ('route', 'method'))
+
+        @app.middleware('http')
+        async def record_request_metrics(request, call_next):
+            start_time = time.perf_counter()
+            response = await call_next(request)
+            duration = time.perf_counter() - start_time
+
+            route = request.scope.get('route')
+            route_path = getattr(route, 'path', 'unmatched')
+            if route_path == path:
+                return response
+            method = request.method
+
+            request_count.inc(route=route_path, method=method, status=response.status_code)
+            request_duration.observe(duration, route=route_path, method=method)
+            received_bytes.inc(int(request.headers.get('content-length', 0) or 0), route=route_path, method=method)
+            sent_bytes.inc(int(response.headers.get('content-length', 0) or 0), route=route_path, method=method)
+            return response
+
+
+class MetricTimer:
+    __slots__ = ('name', 'labels', 'start_time')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start_time = 0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Metrics.observe(self.name, time.perf_counter() - self.start_time, **self.labels)
+        return False
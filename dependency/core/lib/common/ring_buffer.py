@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    fixed-capacity buffer of the latest `size` entries kept in a preallocated numpy array
+
+    one writer thread and one reader thread can use it without lock:
+    the writer fills a slot before publishing it by increasing `count`,
+    the reader copies the latest entries and retries if the writer wrapped onto them during copying.
+    the array has `slack` extra slots so that the writer rarely catches up with the reader.
+    """
+
+    def __init__(self, size: int, slack: int = None):
+        self.size = size
+        # at least one extra slot, the slot being written is never part of the latest entries
+        self.slack = size if slack is None else max(slack, 1)
+        self.capacity = size + self.slack
+
+        # allocated on first put, when the shape of entries is known
+        self.data = None
+        self.count = 0
+
+    def put(self, entry):
+        entry = np.asarray(entry, dtype=np.float64)
+        if self.data is None:
+            self.data = np.zeros((self.capacity, *entry.shape), dtype=np.float64)
+        self.data[self.count % self.capacity] = entry
+        self.count += 1
+
+    def get(self) -> np.ndarray:
+        """copy of the latest entries (at most `size`) in order of putting"""
+        while True:
+            count = self.count
+            length = min(count, self.size)
+            if length == 0:
+                return np.zeros((0,), dtype=np.float64)
+
+            indices = np.arange(count - length, count) % self.capacity
+            entries = self.data[indices]
+            # writer has not started overwriting the copied slots
+            # (the slot of entry count + slack may be being written while count is still count + slack - 1)
+            if self.count - count < self.slack:
+                return entries
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    @staticmethod
+    def resample(buffer: np.ndarray, size: int) -> np.ndarray:
+        """
+        resample entries to `size` along the first axis:
+        evenly pick entries if longer, repeat each entry (earlier entries once more) if shorter
+        """
+        buffer_length = len(buffer)
+        assert buffer_length != 0, 'Resample buffer size is 0!'
+
+        if buffer_length > size:
+            return buffer[np.linspace(0, buffer_length - 1, num=size, dtype=int)]
+        elif buffer_length < size:
+            repeats = np.full(buffer_length, size // buffer_length)
+            repeats[:size % buffer_length] += 1
+            return np.repeat(buffer, repeats, axis=0)
+        return buffer.copy()
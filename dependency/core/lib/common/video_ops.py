@@ -22,3 +22,33 @@ class VideoOps:
     def resolution2text(cls, resolution: tuple):
         assert resolution in cls.resolution_dict_reverse, f'Invalid resolution "{resolution}"!'
         return cls.resolution_dict_reverse[resolution]
+
+    @classmethod
+    def lower_resolution(cls, text: str):
+        """next lower resolution of text resolution, itself if it is the lowest"""
+        if text not in cls.resolution_dict:
+            return text
+        resolutions = sorted(cls.resolution_dict, key=lambda res: cls.resolution_dict[res][1])
+        return resolutions[max(resolutions.index(text) - 1, 0)]
+
+    @staticmethod
+    def get_thumbnail_path(file_path: str):
+        return f'{file_path}.thumb.jpg'
+
+    @staticmethod
+    def save_thumbnail(video_path: str, thumbnail_path: str, max_width: int = 480, quality: int = 80):
+        """save first frame of video as jpeg, downscaled to at most max_width (keep size if max_width is 0)"""
+        import cv2
+
+        cap = cv2.VideoCapture(video_path)
+        success, frame = cap.read()
+        cap.release()
+        if not success:
+            raise ValueError(f'Failed to read the first frame from video {video_path}.')
+
+        height, width = frame.shape[:2]
+        if 0 < max_width < width:
+            frame = cv2.resize(frame, (max_width, round(height * max_width / width)), interpolation=cv2.INTER_AREA)
+
+        if not cv2.imwrite(thumbnail_path, frame, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+            raise ValueError(f'Failed to write thumbnail {thumbnail_path}.')
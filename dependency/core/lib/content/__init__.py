@@ -1,3 +1,4 @@
 from .task import Task
 from .service import Service
 from .dag import DAG
+from .task_envelope import TaskEnvelope
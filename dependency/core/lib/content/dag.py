@@ -1,4 +1,3 @@
-import copy
 import json
 from typing import List
 
@@ -29,6 +28,11 @@ class Node:
     def add_prev_node(self, prev_node: Service):
         self.prev_nodes.append(prev_node.get_service_name())
 
+    def fork(self, fork_service: bool = False):
+        """new node sharing topology (prev/next nodes are not modified after dag is built) and service"""
+        return Node(self.service.fork() if fork_service else self.service,
+                    prev_nodes=self.prev_nodes, next_nodes=self.next_nodes)
+
     def to_dict(self):
         return {
             "service": Service.to_dict(self.service),
@@ -66,7 +70,17 @@ class DAG:
         return self.nodes[service_name]
 
     def set_node_service(self, service_name: str, service: Service):
-        self.get_node(service_name).service = copy.deepcopy(service)
+        self.get_node(service_name).service = service.fork()
+
+    def fork(self, mutable_nodes=()):
+        """
+        copy-on-write copy of dag: topology and services are shared with the original dag,
+        only services of `mutable_nodes` (which will be modified in the new dag) are copied
+        """
+        dag = DAG()
+        dag.nodes = {service_name: node.fork(fork_service=service_name in mutable_nodes)
+                     for service_name, node in self.nodes.items()}
+        return dag
 
     def get_next_nodes(self, service_name: str) -> List[Service]:
         if service_name not in self.nodes:
@@ -1,3 +1,4 @@
+import copy
 import json
 
 
@@ -61,6 +62,10 @@ class Service:
     def set_content_data(self, content):
         self.__content = content
 
+    def fork(self):
+        """shallow copy of service, content data is shared as it is replaced instead of modified in place"""
+        return copy.copy(self)
+
     def to_dict(self):
         return {
             'service_name': self.get_service_name(),
@@ -4,12 +4,17 @@ import uuid
 
 from .service import Service
 from .dag import DAG
+from .task_envelope import TaskEnvelope
 
 from core.lib.solver import LCASolver, IntermediateNodeSolver, PathSolver
-from core.lib.common import NameMaintainer
+from core.lib.common import NameMaintainer, Metrics
 
 
 class Task:
+    # fields of task dict required to rebuild a task (kept in any projection of task dict)
+    IDENTITY_FIELDS = ('source_id', 'task_id', 'source_device', 'all_edge_devices',
+                       'task_uuid', 'parent_uuid', 'root_uuid')
+
     def __init__(self,
                  source_id: int,
                  task_id: int,
@@ -391,12 +396,31 @@ class Task:
         return dag
 
     def fork_task(self, new_flow_index: str = None) -> 'Task':
-        new_task = copy.deepcopy(self)
+        """
+        fork task with structural sharing instead of deep copy:
+        dag topology, raw metadata and content of other stages are shared with the original task,
+        only the service of the new current stage and the per-task mutable records are copied
+        """
+        flow_index = new_flow_index or self.__cur_flow_index
+        new_task = Task(source_id=self.__source_id,
+                        task_id=self.__task_id,
+                        source_device=self.__source_device,
+                        all_edge_devices=self.__all_edge_devices,
+                        dag=self.__dag_flow.fork(mutable_nodes=(flow_index,)) if self.__dag_flow else None,
+                        flow_index=self.__cur_flow_index,
+                        past_flow_index=self.__past_flow_index,
+                        metadata=copy.copy(self.__metadata),
+                        raw_metadata=self.__raw_metadata,
+                        scenario=copy.copy(self.__scenario_data),
+                        temp=copy.copy(self.__tmp_data),
+                        hash_data=copy.copy(self.hash_data),
+                        file_path=self.__file_path,
+                        task_uuid=str(uuid.uuid4()),
+                        parent_uuid=self.__task_uuid,
+                        root_uuid=self.__root_uuid)
         if new_flow_index and new_flow_index != self.__cur_flow_index:
             new_task.set_past_flow_index(self.__cur_flow_index)
             new_task.set_flow_index(new_flow_index)
-        new_task.set_task_uuid(str(uuid.uuid4()))
-        new_task.set_parent_uuid(self.__task_uuid)
         return new_task
 
     def merge_task(self, other_task: 'Task'):
@@ -458,10 +482,29 @@ class Task:
 
         return task
 
-    def serialize(self):
-        return json.dumps(self.to_dict())
+    def serialize(self, binary: bool = False):
+        """
+        serialize task into json text, or into binary envelope (bytes) if binary is set;
+        numpy arrays in content are kept as raw blobs in binary envelope and converted to lists in json
+        """
+        with Metrics.timer('task_serialize_seconds', encoding='binary' if binary else 'json'):
+            if binary:
+                return TaskEnvelope.encode(self.to_dict())
+            return json.dumps(self.to_dict(), default=self._json_default)
+
+    @staticmethod
+    def _json_default(obj):
+        import numpy as np
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
 
     @classmethod
-    def deserialize(cls, data: str):
-        data = json.loads(data)
-        return cls.from_dict(data)
+    def deserialize(cls, data):
+        """deserialize task from json text or binary envelope"""
+        is_envelope = TaskEnvelope.is_envelope(data)
+        with Metrics.timer('task_deserialize_seconds', encoding='binary' if is_envelope else 'json'):
+            data = TaskEnvelope.decode(data) if is_envelope else json.loads(data)
+            return cls.from_dict(data)
@@ -0,0 +1,67 @@
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TaskEnvelope:
+    """
+    Compact binary envelope of task dict as an alternative of json text on the hot path:
+        MAGIC (4 bytes) | VERSION (1 byte) | msgpack payload
+    numpy arrays in task content are packed as raw blobs (msgpack ext type) instead of nested lists.
+    Binary envelope is only available when msgpack is installed, otherwise json is used.
+    """
+
+    MAGIC = b'DYTE'
+    VERSION = 1
+
+    NDARRAY_EXT_CODE = 1
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return msgpack is not None
+
+    @classmethod
+    def is_envelope(cls, data) -> bool:
+        return isinstance(data, (bytes, bytearray)) and data[:len(cls.MAGIC)] == cls.MAGIC
+
+    @classmethod
+    def encode(cls, task_dict: dict) -> bytes:
+        assert cls.is_available(), 'Binary task envelope requires msgpack'
+        payload = msgpack.packb(task_dict, default=cls._encode_ext, use_bin_type=True)
+        return cls.MAGIC + bytes([cls.VERSION]) + payload
+
+    @classmethod
+    def decode(cls, data: bytes) -> dict:
+        assert cls.is_available(), 'Binary task envelope requires msgpack'
+        if not cls.is_envelope(data):
+            raise ValueError('Data is not a binary task envelope')
+        version = data[len(cls.MAGIC)]
+        if version > cls.VERSION:
+            raise ValueError(f'Unsupported task envelope version {version} (supported up to {cls.VERSION})')
+        payload = memoryview(data)[len(cls.MAGIC) + 1:]
+        return msgpack.unpackb(payload, ext_hook=cls._decode_ext, raw=False, strict_map_key=False)
+
+    @classmethod
+    def _encode_ext(cls, obj):
+        import numpy as np
+        if isinstance(obj, np.ndarray):
+            obj = np.ascontiguousarray(obj)
+            header = msgpack.packb([obj.dtype.str, list(obj.shape)])
+            return msgpack.ExtType(cls.NDARRAY_EXT_CODE, header + obj.tobytes())
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, tuple):
+            return list(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} can not be packed into task envelope')
+
+    @classmethod
+    def _decode_ext(cls, code, data):
+        import numpy as np
+        if code != cls.NDARRAY_EXT_CODE:
+            return msgpack.ExtType(code, data)
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(data)
+        dtype, shape = unpacker.unpack()
+        offset = unpacker.tell()
+        return np.frombuffer(data, dtype=np.dtype(dtype), offset=offset).reshape(shape).copy()
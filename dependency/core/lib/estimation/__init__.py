@@ -2,3 +2,5 @@ from .time_estimation import Timer, TimeEstimator
 from .accuracy_estimation import AccEstimator
 from .overhead_estimation import OverheadEstimator
 
+from .bandwidth_estimation import BandwidthEstimator
+from .tracing import Tracer
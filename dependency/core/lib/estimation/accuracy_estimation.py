@@ -3,31 +3,70 @@ import numpy as np
 
 class AccEstimator:
     def __init__(self, ground_truth_file: str):
+        # ground truth boxes of all frames in one array, boxes of frame i are gt_boxes[gt_offsets[i]:gt_offsets[i+1]]
+        self.gt_boxes, self.gt_offsets = self.load_ground_truth(ground_truth_file)
 
+    @staticmethod
+    def load_ground_truth(ground_truth_file: str):
+        boxes_list = []
+        offsets = [0]
         with open(ground_truth_file, 'r') as gt_f:
-            self.data_gt = gt_f.readlines()
+            for line in gt_f:
+                info = line.split()
+                # skip empty lines (eg: trailing newline at the end of file)
+                if not info:
+                    continue
+                index = len(boxes_list)
+                assert int(info[0]) == index, f'frame index {index} is not equal to ground truth index {info[0]}'
+                boxes = np.array(info[1:], dtype=np.float32).reshape(-1, 4)
+                boxes_list.append(boxes)
+                offsets.append(offsets[-1] + len(boxes))
+
+        gt_boxes = np.concatenate(boxes_list) if boxes_list else np.zeros((0, 4), dtype=np.float32)
+        return gt_boxes, np.array(offsets, dtype=np.int64)
 
     def calculate_accuracy(self, frame_hash_codes, predictions, resolution_ratio, fps_ratio):
-        acc_list = []
-        gt_frames_index_list = self.find_gt_frames_index(fps_ratio, frame_hash_codes)
-
-        # no object in scene
-        if not gt_frames_index_list:
-            return 1
-
-        # no prediction
-        if not predictions:
-            return 0
+        return self.calculate_accuracy_batch([(frame_hash_codes, predictions, resolution_ratio, fps_ratio)])[0]
 
-        for prediction, gt_frames_index in zip(predictions, gt_frames_index_list):
-            prediction_normal = [{'bbox': box, 'prob': prob, 'class': 1} for box, prob in
-                                 zip(prediction[0], prediction[1])]
-            for gt_frame_index in gt_frames_index:
-                frame_gt = self.get_frame_ground_truth(gt_frame_index, resolution_ratio)
-                acc = self.calculate_map(prediction_normal, frame_gt)
-                acc_list.append(acc)
-
-        return np.mean(acc_list) if acc_list else 0
+    def calculate_accuracy_batch(self, batch):
+        """
+        score several tasks in one call
+        batch: list of (frame_hash_codes, predictions, resolution_ratio, fps_ratio)
+        each predicted frame is paired with its ground truth frames, aps of the pairs of all tasks
+        are computed in one vectorized pass and averaged per task
+        """
+        accuracies = [0.0] * len(batch)
+        pair_task_index, pair_pred_boxes, pair_pred_scores, pair_gt_boxes = [], [], [], []
+        for task_index, (frame_hash_codes, predictions, resolution_ratio, fps_ratio) in enumerate(batch):
+            gt_frames_index_list = self.find_gt_frames_index(fps_ratio, frame_hash_codes)
+
+            # no object in scene
+            if not gt_frames_index_list:
+                accuracies[task_index] = 1
+                continue
+
+            # no prediction
+            if not predictions:
+                continue
+
+            for prediction, gt_frames_index in zip(predictions, gt_frames_index_list):
+                pred_boxes = np.asarray(prediction[0], dtype=np.float32).reshape(-1, 4)
+                pred_scores = np.asarray(prediction[1], dtype=np.float32).reshape(-1)
+                for gt_frame_index in gt_frames_index:
+                    pair_task_index.append(task_index)
+                    pair_pred_boxes.append(pred_boxes)
+                    pair_pred_scores.append(pred_scores)
+                    pair_gt_boxes.append(self.get_frame_boxes(gt_frame_index, resolution_ratio))
+
+        if pair_task_index:
+            aps = self.calculate_ap_of_box_pairs(pair_pred_boxes, pair_pred_scores, pair_gt_boxes)
+            pair_task_index = np.asarray(pair_task_index)
+            ap_sums = np.bincount(pair_task_index, weights=aps, minlength=len(batch))
+            pair_counts = np.bincount(pair_task_index, minlength=len(batch))
+            for task_index in np.flatnonzero(pair_counts):
+                accuracies[task_index] = ap_sums[task_index] / pair_counts[task_index]
+
+        return accuracies
 
     def find_gt_frames_index(self, fps_ratio, frame_hash_codes):
         gt_frames_index_list = []
@@ -48,27 +87,18 @@ class AccEstimator:
 
         return gt_frames_index_list
 
-    def get_frame_ground_truth(self, index, resolution_ratio):
-        if index >= len(self.data_gt):
-            return []
-
-        info = self.data_gt[index].strip()
-
-        info = info.split(' ')
-        assert int(info[0]) == index, f'frame index {index} is not equal to ground truth index {info[0]}'
+    def get_frame_boxes(self, index, resolution_ratio):
+        """ground truth boxes (n, 4) of frame scaled by resolution ratio"""
+        if index >= len(self.gt_offsets) - 1:
+            return np.zeros((0, 4), dtype=np.float32)
 
-        info = info[1:]
+        boxes = self.gt_boxes[self.gt_offsets[index]:self.gt_offsets[index + 1]]
+        ratio = np.array([resolution_ratio[0], resolution_ratio[1], resolution_ratio[0], resolution_ratio[1]],
+                         dtype=np.float32)
+        return boxes * ratio
 
-        bbox_gt = [float(b) for b in info]
-        boxes_gt = np.array(bbox_gt, dtype=np.float32).reshape(-1, 4)
-        frame_gt = []
-        for box in boxes_gt.tolist():
-            box[0] *= resolution_ratio[0]
-            box[1] *= resolution_ratio[1]
-            box[2] *= resolution_ratio[0]
-            box[3] *= resolution_ratio[1]
-            frame_gt.append({'bbox': box, 'class': 1})
-        return frame_gt
+    def get_frame_ground_truth(self, index, resolution_ratio):
+        return [{'bbox': box, 'class': 1} for box in self.get_frame_boxes(index, resolution_ratio).tolist()]
 
     def search_frame_index(self, hash_data):
         # closest_frame_index = self.hash_table.get_nns_by_vector(np.array(hash_data, dtype=int), 1)[0]
@@ -77,30 +107,116 @@ class AccEstimator:
 
     @staticmethod
     def calculate_iou(boxA, boxB):
-        xA = max(boxA[0], boxB[0])
-        yA = max(boxA[1], boxB[1])
-        xB = min(boxA[2], boxB[2])
-        yB = min(boxA[3], boxB[3])
+        return float(AccEstimator.calculate_iou_matrix(np.asarray([boxA], dtype=np.float64),
+                                                       np.asarray([boxB], dtype=np.float64))[0, 0])
 
-        interArea = max(0, xB - xA + 1) * max(0, yB - yA + 1)
+    @staticmethod
+    def calculate_iou_matrix(boxes_a, boxes_b):
+        """iou between each box of boxes_a (n, 4) and each box of boxes_b (m, 4), return (n, m)"""
+        x_a = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+        y_a = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+        x_b = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+        y_b = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
 
-        boxAArea = (boxA[2] - boxA[0] + 1) * (boxA[3] - boxA[1] + 1)
-        boxBArea = (boxB[2] - boxB[0] + 1) * (boxB[3] - boxB[1] + 1)
+        inter_area = np.maximum(0, x_b - x_a + 1) * np.maximum(0, y_b - y_a + 1)
 
-        iou = interArea / float(boxAArea + boxBArea - interArea)
+        area_a = (boxes_a[:, 2] - boxes_a[:, 0] + 1) * (boxes_a[:, 3] - boxes_a[:, 1] + 1)
+        area_b = (boxes_b[:, 2] - boxes_b[:, 0] + 1) * (boxes_b[:, 3] - boxes_b[:, 1] + 1)
 
-        return iou
+        return inter_area / (area_a[:, None] + area_b[None, :] - inter_area)
 
     @staticmethod
     def compute_ap(recalls, precisions):
         recalls = np.concatenate(([0.0], recalls, [1.0]))
         precisions = np.concatenate(([0.0], precisions, [0.0]))
-        for i in range(precisions.size - 1, 0, -1):
-            precisions[i - 1] = np.maximum(precisions[i - 1], precisions[i])
+        precisions = np.maximum.accumulate(precisions[::-1])[::-1]
         indices = np.where(recalls[1:] != recalls[:-1])[0] + 1
         ap = np.sum((recalls[indices] - recalls[indices - 1]) * precisions[indices])
         return ap
 
+    @staticmethod
+    def calculate_ap_of_boxes(pred_boxes, pred_scores, gt_boxes, iou_threshold=0.5):
+        """average precision of predicted boxes (n, 4) with scores (n,) against ground truth boxes (m, 4)"""
+
+        # no object in scene
+        if len(gt_boxes) == 0:
+            return 1
+
+        # no prediction
+        if len(pred_boxes) == 0:
+            return 0
+
+        order = np.argsort(-pred_scores, kind='stable')
+        ious = AccEstimator.calculate_iou_matrix(pred_boxes[order].astype(np.float64),
+                                                 gt_boxes.astype(np.float64))
+
+        # greedy matching in order of confidence, each ground truth is matched at most once
+        tp = np.zeros(len(order))
+        gt_available = np.ones(len(gt_boxes), dtype=bool)
+        for i, pred_ious in enumerate(ious):
+            candidate_ious = np.where(gt_available, pred_ious, 0)
+            max_gt_idx = int(np.argmax(candidate_ious))
+            if candidate_ious[max_gt_idx] >= iou_threshold:
+                tp[i] = 1
+                gt_available[max_gt_idx] = False
+
+        tp_cumsum = np.cumsum(tp)
+        fp_cumsum = np.cumsum(1 - tp)
+        recalls = tp_cumsum / len(gt_boxes)
+        precisions = tp_cumsum / (tp_cumsum + fp_cumsum)
+
+        return AccEstimator.compute_ap(recalls, precisions)
+
+    @staticmethod
+    def calculate_ap_of_box_pairs(pred_boxes_list, pred_scores_list, gt_boxes_list, iou_threshold=0.5):
+        """
+        average precision of each pair of predicted boxes with scores against ground truth boxes,
+        same as calculate_ap_of_boxes on each pair, computed at once on pairs padded to the same box numbers
+        """
+        pairs_num = len(pred_boxes_list)
+        pred_nums = np.array([len(boxes) for boxes in pred_boxes_list])
+        gt_nums = np.array([len(boxes) for boxes in gt_boxes_list])
+        max_pred_num, max_gt_num = max(pred_nums.max(), 1), max(gt_nums.max(), 1)
+
+        # predictions of each pair sorted by confidence, padded slots are invalid
+        pred_boxes = np.zeros((pairs_num, max_pred_num, 4), dtype=np.float64)
+        gt_boxes = np.zeros((pairs_num, max_gt_num, 4), dtype=np.float64)
+        for i, (boxes, scores, gts) in enumerate(zip(pred_boxes_list, pred_scores_list, gt_boxes_list)):
+            pred_boxes[i, :len(boxes)] = boxes[np.argsort(-scores, kind='stable')]
+            gt_boxes[i, :len(gts)] = gts
+        pred_valid = np.arange(max_pred_num)[None, :] < pred_nums[:, None]
+        gt_valid = np.arange(max_gt_num)[None, :] < gt_nums[:, None]
+
+        x_a = np.maximum(pred_boxes[:, :, None, 0], gt_boxes[:, None, :, 0])
+        y_a = np.maximum(pred_boxes[:, :, None, 1], gt_boxes[:, None, :, 1])
+        x_b = np.minimum(pred_boxes[:, :, None, 2], gt_boxes[:, None, :, 2])
+        y_b = np.minimum(pred_boxes[:, :, None, 3], gt_boxes[:, None, :, 3])
+        inter_area = np.maximum(0, x_b - x_a + 1) * np.maximum(0, y_b - y_a + 1)
+        area_pred = (pred_boxes[:, :, 2] - pred_boxes[:, :, 0] + 1) * (pred_boxes[:, :, 3] - pred_boxes[:, :, 1] + 1)
+        area_gt = (gt_boxes[:, :, 2] - gt_boxes[:, :, 0] + 1) * (gt_boxes[:, :, 3] - gt_boxes[:, :, 1] + 1)
+        ious = inter_area / (area_pred[:, :, None] + area_gt[:, None, :] - inter_area)
+
+        # greedy matching in order of confidence for all pairs at once, each ground truth is matched at most once
+        tp = np.zeros((pairs_num, max_pred_num))
+        gt_available = gt_valid.copy()
+        pair_indexes = np.arange(pairs_num)
+        for i in range(max_pred_num):
+            candidate_ious = np.where(gt_available, ious[:, i], 0)
+            max_gt_idx = np.argmax(candidate_ious, axis=1)
+            matched = pred_valid[:, i] & (candidate_ious[pair_indexes, max_gt_idx] >= iou_threshold)
+            tp[matched, i] = 1
+            gt_available[pair_indexes[matched], max_gt_idx[matched]] = False
+
+        # ap is the sum of interpolated precisions at each true positive, each raising recall by 1 / gt_num
+        precisions = np.where(pred_valid, np.cumsum(tp, axis=1) / np.arange(1, max_pred_num + 1), 0)
+        interpolated_precisions = np.maximum.accumulate(precisions[:, ::-1], axis=1)[:, ::-1]
+        aps = (tp * interpolated_precisions).sum(axis=1) / np.maximum(gt_nums, 1)
+
+        # no object in scene / no prediction
+        aps[pred_nums == 0] = 0
+        aps[gt_nums == 0] = 1
+        return aps
+
     @staticmethod
     def calculate_map(predictions, ground_truths, iou_threshold=0.5):
         """
@@ -118,40 +234,13 @@ class AccEstimator:
 
         aps = []
         for class_id in set([gt['class'] for gt in ground_truths]):
-            # Filter predictions and ground truths by class
             preds = [p for p in predictions if p['class'] == class_id]
             gts = [gt for gt in ground_truths if gt['class'] == class_id]
 
-            # Sort predictions by confidence
-            preds.sort(key=lambda x: x['prob'], reverse=True)
-
-            tp = np.zeros(len(preds))
-            fp = np.zeros(len(preds))
-            used_gts = set()
-
-            for i, pred in enumerate(preds):
-                max_iou = 0
-                max_gt_idx = -1
-                for j, gt in enumerate(gts):
-                    iou = AccEstimator.calculate_iou(pred['bbox'], gt['bbox'])
-                    if iou > max_iou and j not in used_gts:
-                        max_iou = iou
-                        max_gt_idx = j
-
-                if max_iou >= iou_threshold:
-                    tp[i] = 1
-                    used_gts.add(max_gt_idx)
-                else:
-                    fp[i] = 1
-
-            # Calculate precision and recall
-            fp_cumsum = np.cumsum(fp)
-            tp_cumsum = np.cumsum(tp)
-            recalls = tp_cumsum / len(gts)
-            precisions = tp_cumsum / (tp_cumsum + fp_cumsum)
-
-            ap = AccEstimator.compute_ap(recalls, precisions)
-            aps.append(ap)
+            pred_boxes = np.array([p['bbox'] for p in preds], dtype=np.float64).reshape(-1, 4)
+            pred_scores = np.array([p['prob'] for p in preds], dtype=np.float64)
+            gt_boxes = np.array([gt['bbox'] for gt in gts], dtype=np.float64).reshape(-1, 4)
+            aps.append(AccEstimator.calculate_ap_of_boxes(pred_boxes, pred_scores, gt_boxes, iou_threshold))
 
         # Mean AP
         mAP = np.mean(aps)
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BandwidthEstimator:
+    """
+    passive estimation of link bandwidth from timed transfers of real tasks
+
+    each link (sender device -> receiver device) keeps its latest `window_size` samples of (data size, duration).
+    transfer duration is modeled as `latency + data_size / bandwidth`, fitted by least squares over the window
+    when data sizes differ enough; otherwise bandwidth is the ratio of total size and total duration.
+    """
+
+    def __init__(self, window_size: int = 20, min_size_spread: float = 0.2):
+        self.window_size = window_size
+        # relative spread of data sizes required for fitting latency
+        self.min_size_spread = min_size_spread
+
+        # (sender, receiver) -> deque of (timestamp, data size in bytes, duration in seconds)
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add_sample(self, sender: str, receiver: str, data_size: int, duration: float, timestamp: float = None):
+        if not sender or not receiver or sender == receiver:
+            return
+        if data_size <= 0 or duration <= 0:
+            return
+
+        with self.lock:
+            self.samples.setdefault((sender, receiver), deque(maxlen=self.window_size)).append(
+                (timestamp or time.time(), data_size, duration))
+
+    def get_idle_time(self, sender: str, receiver: str):
+        """seconds since the latest sample of link, None if link has no sample"""
+        with self.lock:
+            samples = self.samples.get((sender, receiver))
+            if not samples:
+                return None
+            return time.time() - samples[-1][0]
+
+    def get_estimate(self, sender: str, receiver: str):
+        """
+        estimation of link as dict (None if link has no sample):
+        bandwidth (Mbps), latency (s), samples (number of samples), idle_time (s)
+        """
+        with self.lock:
+            samples = self.samples.get((sender, receiver))
+            if not samples:
+                return None
+            samples = np.array(samples, dtype=np.float64)
+
+        bandwidth, latency = self.fit_samples(samples[:, 1], samples[:, 2])
+        return {'bandwidth': bandwidth,
+                'latency': latency,
+                'samples': len(samples),
+                'idle_time': time.time() - float(samples[-1, 0])}
+
+    def get_all_estimates(self):
+        with self.lock:
+            links = list(self.samples.keys())
+        return [{'sender': sender, 'receiver': receiver, **self.get_estimate(sender, receiver)}
+                for sender, receiver in links]
+
+    def fit_samples(self, data_sizes: np.ndarray, durations: np.ndarray):
+        """return (bandwidth in Mbps, latency in seconds) of samples"""
+        if len(data_sizes) >= 3 and np.std(data_sizes) > self.min_size_spread * np.mean(data_sizes):
+            slope, intercept = np.polyfit(data_sizes, durations, 1)
+            if slope > 0 and intercept >= 0:
+                return float(8 / slope / 1e6), float(intercept)
+
+        # latency is not separable from sizes, take it as zero
+        return float(np.sum(data_sizes) * 8 / np.sum(durations) / 1e6), 0.0
@@ -0,0 +1,145 @@
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+from core.lib.common import Context, LOGGER
+
+
+class Span:
+    """span of one hop of a task, recorded when exiting the context"""
+    __slots__ = ('name', 'task', 'attributes', 'start_time')
+
+    def __init__(self, name, task, attributes):
+        self.name = name
+        self.task = task
+        self.attributes = attributes
+        self.start_time = 0
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Tracer.add_span(self.name, self.start_time, time.time(), self.task, self.attributes)
+        return False
+
+
+class NoopSpan:
+    """span of unsampled task"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class Tracer:
+    """
+    sampled span tracing of task hops (queue wait, decode, infer, serialize, upload, ...)
+
+    span names are '<component>/<hop>' (eg: processor/queue_wait).
+    tasks are sampled by hash of root uuid, so a sampled task is traced at every hop of every component.
+    spans are buffered in process and appended by a background thread every TRACE_FLUSH_INTERVAL seconds
+    to TRACE_DIR/trace-<device>-<pid>.json in Chrome trace event format (JSON array format,
+    loadable by chrome://tracing or Perfetto), one complete event per line with task identity in 'args'.
+    """
+
+    enabled = Context.get_parameter('TRACE_ENABLED', 'False', direct=False)
+    sample_rate = Context.get_parameter('TRACE_SAMPLE_RATE', '0.1', direct=False)
+    trace_dir = Context.get_parameter('TRACE_DIR', 'trace')
+    flush_interval = Context.get_parameter('TRACE_FLUSH_INTERVAL', '1', direct=False)
+    # spans beyond buffer size are dropped (oldest first) if flushing falls behind
+    buffer_size = Context.get_parameter('TRACE_BUFFER_SIZE', '10000', direct=False)
+
+    __buffer = deque(maxlen=buffer_size)
+    __flush_thread = None
+    __trace_file = None
+    __lock = threading.Lock()
+    __noop_span = NoopSpan()
+
+    @classmethod
+    def is_sampled(cls, task) -> bool:
+        if not cls.enabled or task is None:
+            return False
+        return zlib.crc32(task.get_root_uuid().encode()) % 10000 < cls.sample_rate * 10000
+
+    @classmethod
+    def span(cls, name: str, task, **attributes):
+        """context manager tracing the enclosed code as a span of task"""
+        if not cls.is_sampled(task):
+            return cls.__noop_span
+        return Span(name, task, attributes)
+
+    @classmethod
+    def record_span(cls, name: str, start_time: float, end_time: float, task, **attributes):
+        """trace a span of task measured elsewhere"""
+        if cls.is_sampled(task):
+            cls.add_span(name, start_time, end_time, task, attributes)
+
+    @classmethod
+    def add_span(cls, name, start_time, end_time, task, attributes):
+        cls.__buffer.append({
+            'name': name,
+            'cat': name.split('/')[0],
+            'ph': 'X',
+            'ts': int(start_time * 1e6),
+            'dur': int(max(end_time - start_time, 0) * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {'trace_id': task.get_root_uuid(),
+                     'source_id': task.get_source_id(),
+                     'task_id': task.get_task_id(),
+                     'service': task.get_flow_index(),
+                     **attributes},
+        })
+        if cls.__flush_thread is None:
+            cls.__start_flush_thread()
+
+    @classmethod
+    def flush(cls):
+        events = []
+        while cls.__buffer:
+            events.append(cls.__buffer.popleft())
+        if not events:
+            return
+
+        with cls.__lock:
+            try:
+                if cls.__trace_file is None:
+                    cls.__trace_file = cls.__open_trace_file()
+                cls.__trace_file.write(''.join(json.dumps(event) + ',\n' for event in events))
+                cls.__trace_file.flush()
+            except Exception as e:
+                LOGGER.warning(f'[Tracer] Export {len(events)} spans failed: {str(e)}')
+
+    @classmethod
+    def __open_trace_file(cls):
+        os.makedirs(cls.trace_dir, exist_ok=True)
+        device = Context.get_parameter('NODE_NAME', 'local')
+        trace_file = open(os.path.join(cls.trace_dir, f'trace-{device}-{os.getpid()}.json'), 'a')
+        if trace_file.tell() == 0:
+            # closing bracket of json array is optional in trace event format, so events are appended freely
+            trace_file.write('[\n')
+        trace_file.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                                     'args': {'name': f'{device} ({os.getpid()})'}}) + ',\n')
+        return trace_file
+
+    @classmethod
+    def __start_flush_thread(cls):
+        with cls.__lock:
+            if cls.__flush_thread is not None:
+                return
+            cls.__flush_thread = threading.Thread(target=cls.__loop_flush, daemon=True)
+            cls.__flush_thread.start()
+        atexit.register(cls.flush)
+
+    @classmethod
+    def __loop_flush(cls):
+        while True:
+            time.sleep(cls.flush_interval)
+            cls.flush()
@@ -1,13 +1,20 @@
 class NetworkAPIPath:
+    METRICS = '/metrics'
+
     CONTROLLER_TASK = '/submit_task'
     CONTROLLER_RETURN = '/process_return_task'
+    CONTROLLER_BANDWIDTH = '/bandwidth'
 
     PROCESSOR_PROCESS = '/predict'
+    PROCESSOR_PROCESS_LOCAL = '/predict_local'
     PROCESSOR_PROCESS_RETURN = '/predict_and_return'
     PROCESSOR_QUEUE_LENGTH = '/queue_length'
+    PROCESSOR_LOOP_TIME = '/loop_time'
+    PROCESSOR_LOAD = '/load'
 
     DISTRIBUTOR_DISTRIBUTE = '/distribute'
     DISTRIBUTOR_RESULT = '/result'
+    DISTRIBUTOR_RESULT_STREAM = '/result_stream'
     DISTRIBUTOR_FILE = '/file'
     DISTRIBUTOR_ALL_RESULT = '/all_result'
     DISTRIBUTOR_CLEAR_DATABASE = '/clear_database'
@@ -61,15 +68,22 @@ class NetworkAPIPath:
 
 
 class NetworkAPIMethod:
+    METRICS = 'GET'
+
     CONTROLLER_TASK = 'POST'
     CONTROLLER_RETURN = 'POST'
+    CONTROLLER_BANDWIDTH = 'GET'
 
     PROCESSOR_PROCESS = 'POST'
+    PROCESSOR_PROCESS_LOCAL = 'POST'
     PROCESSOR_PROCESS_RETURN = 'POST'
     PROCESSOR_QUEUE_LENGTH = 'GET'
+    PROCESSOR_LOOP_TIME = 'GET'
+    PROCESSOR_LOAD = 'GET'
 
     DISTRIBUTOR_DISTRIBUTE = 'POST'
     DISTRIBUTOR_RESULT = 'GET'
+    DISTRIBUTOR_RESULT_STREAM = 'GET'
     DISTRIBUTOR_FILE = 'GET'
     DISTRIBUTOR_ALL_RESULT = 'GET'
     DISTRIBUTOR_CLEAR_DATABASE = 'POST'
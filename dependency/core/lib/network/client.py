@@ -1,5 +1,89 @@
-from core.lib.common import LOGGER
+import threading
+from urllib.parse import urlparse
+
+from core.lib.common import LOGGER, Context, Metrics
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .envelope import TaskEnvelopeNegotiator
+
+
+class HttpSessionPool:
+    """
+    Module-level pooled session shared by all requests of a component,
+    so that repeated requests to the same host reuse keep-alive connections.
+
+    Pool size and retry policy are configured through environment parameters:
+        HTTP_POOL_CONNECTIONS: number of hosts to keep connection pools for
+        HTTP_POOL_MAXSIZE: maximum connections kept alive per host
+        HTTP_MAX_RETRIES: retries on failed connection establishment
+        (idempotent requests are also retried once on read errors, eg: kept-alive connection closed by server)
+        HTTP_RETRY_BACKOFF: backoff factor (seconds) between retries
+        HTTP_ENDPOINT_TIMEOUTS: timeouts of specific url paths, eg: "{'/predict': 10}"
+    """
+
+    __session = None
+    __adapter = None
+    __lock = threading.Lock()
+
+    endpoint_timeouts = Context.get_parameter('HTTP_ENDPOINT_TIMEOUTS', '{}', direct=False)
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        if cls.__session is None:
+            with cls.__lock:
+                if cls.__session is None:
+                    cls.__session = cls.__create_session()
+        return cls.__session
+
+    @classmethod
+    def __create_session(cls) -> requests.Session:
+        pool_connections = Context.get_parameter('HTTP_POOL_CONNECTIONS', '16', direct=False)
+        pool_maxsize = Context.get_parameter('HTTP_POOL_MAXSIZE', '16', direct=False)
+        max_retries = Context.get_parameter('HTTP_MAX_RETRIES', '2', direct=False)
+        retry_backoff = Context.get_parameter('HTTP_RETRY_BACKOFF', '0.1', direct=False)
+
+        # any method is retried on connection establishment, when requests have not been sent yet.
+        # non-idempotent requests (eg: task uploads) are never re-sent after they may have reached the server,
+        # kept-alive connections dropped while idle are detected and replaced by the pool before sending
+        retry = Retry(total=max_retries + 1, connect=max_retries, read=1, status=0,
+                      backoff_factor=retry_backoff, raise_on_status=False)
+        cls.__adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    max_retries=retry, pool_block=False)
+
+        session = requests.Session()
+        session.mount('http://', cls.__adapter)
+        session.mount('https://', cls.__adapter)
+
+        pool_gauge = Metrics.gauge('http_client_pool', 'Connection reuse statistics of outgoing requests', ('stat',))
+        for stat in ('requests', 'hits', 'misses', 'hosts'):
+            pool_gauge.set_function(lambda stat=stat: cls.get_pool_stats()[stat], stat=stat)
+        return session
+
+    @classmethod
+    def get_endpoint_timeout(cls, url: str):
+        return cls.endpoint_timeouts.get(urlparse(url).path)
+
+    @classmethod
+    def get_pool_stats(cls) -> dict:
+        """
+        connection reuse statistics of alive host pools
+        hits: requests served by kept-alive connections
+        misses: requests that needed a new connection
+        """
+        stats = {'requests': 0, 'hits': 0, 'misses': 0, 'hosts': 0}
+        if cls.__adapter is None:
+            return stats
+
+        pools = cls.__adapter.poolmanager.pools
+        host_pools = [pool for pool in (pools.get(key) for key in pools.keys()) if pool is not None]
+        for pool in host_pools:
+            stats['requests'] += pool.num_requests
+            stats['misses'] += pool.num_connections
+        stats['hits'] = max(stats['requests'] - stats['misses'], 0)
+        stats['hosts'] = len(host_pools)
+        return stats
 
 
 def http_request(url,
@@ -8,11 +92,12 @@ def http_request(url,
                  binary=True,
                  no_decode=False,
                  **kwargs):
-    _maxTimeout = timeout if timeout else 300
+    _maxTimeout = timeout if timeout else HttpSessionPool.get_endpoint_timeout(url) or 300
     _method = 'GET' if not method else method
 
     try:
-        response = requests.request(method=_method, url=url, timeout=_maxTimeout, **kwargs)
+        response = HttpSessionPool.get_session().request(method=_method, url=url, timeout=_maxTimeout, **kwargs)
+        TaskEnvelopeNegotiator.record(url, response)
         if response.status_code == 200:
             if no_decode:
                 return response
@@ -0,0 +1,73 @@
+from urllib.parse import urlparse
+
+from core.lib.common import Context
+from core.lib.content import TaskEnvelope
+
+
+class TaskEnvelopeNegotiator:
+    """
+    Negotiate task encoding per endpoint:
+    receivers supporting binary task envelope advertise the version in response header,
+    senders use binary envelope only for endpoints that have advertised it and json otherwise.
+    """
+
+    HEADER = 'X-Task-Envelope'
+    FORM_FIELD = 'envelope'
+
+    enabled = Context.get_parameter('TASK_BINARY_ENVELOPE', 'True', direct=False) and TaskEnvelope.is_available()
+
+    __endpoint_versions = {}
+
+    @staticmethod
+    def _get_endpoint(url: str) -> str:
+        parsed_url = urlparse(url)
+        return f'{parsed_url.netloc}{parsed_url.path}'
+
+    @classmethod
+    def record(cls, url: str, response) -> None:
+        version = response.headers.get(cls.HEADER)
+        if version:
+            cls.__endpoint_versions[cls._get_endpoint(url)] = int(version)
+
+    @classmethod
+    def accepts_binary(cls, url: str) -> bool:
+        if not cls.enabled:
+            return False
+        return cls.__endpoint_versions.get(cls._get_endpoint(url), 0) >= TaskEnvelope.VERSION
+
+    @classmethod
+    def build_task_payload(cls, url: str, task, files: dict = None, extra_data: dict = None) -> dict:
+        """build request payload (data/files) carrying task in the encoding accepted by endpoint"""
+        data = dict(extra_data) if extra_data else {}
+        files = dict(files) if files else {}
+        if cls.accepts_binary(url):
+            files[cls.FORM_FIELD] = (cls.FORM_FIELD, task.serialize(binary=True), 'application/octet-stream')
+        else:
+            data['data'] = task.serialize()
+
+        payload = {}
+        if data:
+            payload['data'] = data
+        if files:
+            payload['files'] = files
+        return payload
+
+    @staticmethod
+    async def read_task_data(data=None, envelope=None):
+        """get serialized task from request form, either json text field or binary envelope file"""
+        if envelope is not None:
+            return await envelope.read()
+        assert data is not None, 'No task data in request'
+        return data
+
+    @classmethod
+    def install(cls, app) -> None:
+        """advertise binary envelope support on all responses of app"""
+        if not cls.enabled:
+            return
+
+        @app.middleware('http')
+        async def advertise_task_envelope(request, call_next):
+            response = await call_next(request)
+            response.headers[cls.HEADER] = str(TaskEnvelope.VERSION)
+            return response
@@ -1,8 +1,30 @@
+import threading
+import time
+
 import kubernetes as k8s
-from core.lib.common import Context, SystemConstant
+from core.lib.common import Context, SystemConstant, LOGGER
 
 
 class PortInfo:
+    """
+    ports of services in namespace, served from an in-memory snapshot of services
+
+    the snapshot is kept up to date by a watch on namespace services (PORT_WATCH),
+    and refreshed with a full list when older than PORT_CACHE_TTL seconds (as fallback of broken watch)
+    or when a looked-up component is missing (at most once every PORT_MISS_REFRESH_INTERVAL seconds)
+    """
+
+    __api = None
+    __namespace = None
+    # service name -> (service type, node port)
+    __services = {}
+    __refresh_time = 0
+    __watch_thread = None
+    __lock = threading.RLock()
+
+    cache_ttl = Context.get_parameter('PORT_CACHE_TTL', '60', direct=False)
+    miss_refresh_interval = Context.get_parameter('PORT_MISS_REFRESH_INTERVAL', '1', direct=False)
+    watch_enabled = Context.get_parameter('PORT_WATCH', 'True', direct=False)
 
     @staticmethod
     def get_component_port(component_name: str) -> int:
@@ -12,24 +34,24 @@ class PortInfo:
             return ports_list[0]
         assert None, f"Component '{component_name}' does not exist."
 
-    @staticmethod
-    def get_all_ports(keyword: str) -> dict:
+    @classmethod
+    def get_all_ports(cls, keyword: str) -> dict:
+        services = cls.__get_services()
+        if not any(keyword in svc_name for svc_name in services) \
+                and time.time() - cls.__refresh_time > cls.miss_refresh_interval:
+            services = cls.__get_services(force_refresh=True)
+
         ports_dict = {}
-        k8s.config.load_incluster_config()
-        v1 = k8s.client.CoreV1Api()
-        namespace = Context.get_parameter('NAMESPACE')
-        svcs = v1.list_namespaced_service(namespace)
-        for svc in svcs.items:
-            if keyword in svc.metadata.name:
-                if svc.spec.type != "NodePort":
-                    assert None, f"Service '{svc.metadata.name}' is not of type NodePort."
-                ports_dict[svc.metadata.name] = int(svc.spec.ports[0].node_port)
+        for svc_name, (svc_type, node_port) in services.items():
+            if keyword in svc_name:
+                if svc_type != "NodePort":
+                    assert None, f"Service '{svc_name}' is not of type NodePort."
+                ports_dict[svc_name] = node_port
         return ports_dict
 
     @staticmethod
     def get_service_ports_dict() -> dict:
         component_name = SystemConstant.PROCESSOR.value
-        PortInfo.get_all_ports(component_name)
         ports_dict = PortInfo.get_all_ports(component_name)
         component_ports_dict = {}
         for svc_name in ports_dict:
@@ -42,3 +64,61 @@ class PortInfo:
     @staticmethod
     def get_service_port(service_name: str) -> int:
         return PortInfo.get_service_ports_dict().get(service_name)
+
+    @classmethod
+    def invalidate(cls):
+        with cls.__lock:
+            cls.__refresh_time = 0
+
+    @classmethod
+    def __get_services(cls, force_refresh=False) -> dict:
+        if force_refresh or time.time() - cls.__refresh_time > cls.cache_ttl:
+            with cls.__lock:
+                if force_refresh or time.time() - cls.__refresh_time > cls.cache_ttl:
+                    cls.__refresh_services()
+        return cls.__services
+
+    @classmethod
+    def __get_api(cls):
+        if cls.__api is None:
+            k8s.config.load_incluster_config()
+            cls.__api = k8s.client.CoreV1Api()
+            cls.__namespace = Context.get_parameter('NAMESPACE')
+        return cls.__api
+
+    @staticmethod
+    def __extract_service(svc):
+        node_port = svc.spec.ports[0].node_port if svc.spec.ports else None
+        return svc.spec.type, int(node_port) if node_port is not None else None
+
+    @classmethod
+    def __refresh_services(cls):
+        svcs = cls.__get_api().list_namespaced_service(cls.__namespace)
+        # replace snapshot as a whole, readers never see partial updates
+        cls.__services = {svc.metadata.name: cls.__extract_service(svc) for svc in svcs.items}
+        cls.__refresh_time = time.time()
+
+        if cls.watch_enabled and (cls.__watch_thread is None or not cls.__watch_thread.is_alive()):
+            cls.__watch_thread = threading.Thread(target=cls.__watch_services,
+                                                  args=(svcs.metadata.resource_version,), daemon=True)
+            cls.__watch_thread.start()
+
+    @classmethod
+    def __watch_services(cls, resource_version):
+        """apply service changes to snapshot, on exit the snapshot is invalidated and next lookup restarts watching"""
+        try:
+            watch = k8s.watch.Watch()
+            for event in watch.stream(cls.__get_api().list_namespaced_service, cls.__namespace,
+                                      resource_version=resource_version):
+                svc = event['object']
+                with cls.__lock:
+                    services = cls.__services.copy()
+                    if event['type'] == 'DELETED':
+                        services.pop(svc.metadata.name, None)
+                    else:
+                        services[svc.metadata.name] = cls.__extract_service(svc)
+                    cls.__services = services
+        except Exception as e:
+            LOGGER.warning(f'[Port Info] Watch of services stopped: {str(e)}')
+        finally:
+            cls.invalidate()
@@ -4,7 +4,7 @@ from .processor import Processor
 
 from core.lib.estimation import Timer
 from core.lib.content import Task
-from core.lib.common import Context, LOGGER, ClassFactory, ClassType
+from core.lib.common import Context, LOGGER, Metrics, ClassFactory, ClassType
 
 
 @ClassFactory.register(ClassType.PROCESSOR, alias='classifier_processor')
@@ -34,7 +34,7 @@ class ClassifierProcessor(Processor):
                         x_max = int(min(width, x_max))
                         y_max = int(min(height, y_max))
                         faces.append(frame[y_min:y_max, x_min:x_max])
-                    with Timer(f'Classification / {len(faces)} bboxes'):
+                    with Timer(f'Classification / {len(faces)} bboxes'), Metrics.timer('processor_inference_seconds'):
                         result = self.classifier(faces)
                 else:
                     result = []
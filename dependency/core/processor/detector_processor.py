@@ -1,43 +1,116 @@
+import time
+
 import numpy as np
 from typing import List
 import cv2
 
 from .processor import Processor
+from .frame_stream import FrameStream
 
-from core.lib.estimation import Timer
+from core.lib.estimation import Timer, Tracer
 from core.lib.content import Task
-from core.lib.common import LOGGER, Context, convert_ndarray_to_list
+from core.lib.common import LOGGER, Context, Metrics
 from core.lib.common import ClassFactory, ClassType
 
 
 @ClassFactory.register(ClassType.PROCESSOR, alias='detector_processor')
 class DetectorProcessor(Processor):
-    def __init__(self):
+    def __init__(self, stream_decode=False, chunk_size=8):
         super().__init__()
 
         self.detector = Context.get_instance('Detector')
 
         self.frame_size = None
 
+        # decode frames in background and detect them chunk by chunk instead of decoding the whole segment first
+        self.stream_decode = stream_decode
+        self.chunk_size = chunk_size
+
     def __call__(self, task: Task):
+        if self.stream_decode:
+            # decoding overlaps inference in stream mode
+            with Tracer.span('processor/decode_infer', task):
+                result = self.infer_stream(task)
+            return self.set_result(task, result) if result else None
+
+        with Tracer.span('processor/decode', task):
+            image_list = self.read_frames(task)
+        if not image_list:
+            return None
+
+        with Tracer.span('processor/infer', task, frames=len(image_list)):
+            result = self.infer(image_list)
+        return self.set_result(task, result)
+
+    def process_batch(self, tasks: List[Task]):
+        """
+        merge frames of several tasks into one detection batch and split results back per task,
+        segments are always fully decoded here (`stream_decode` is ignored) since the batch needs all their frames
+        """
+        image_lists = []
+        for task in tasks:
+            with Tracer.span('processor/decode', task):
+                image_lists.append(self.read_frames(task))
+        batch_images = [image for image_list in image_lists if image_list for image in image_list]
+
+        infer_start_time = time.time()
+        batch_result = self.infer(batch_images) if batch_images else []
+        infer_end_time = time.time()
+        for task in tasks:
+            Tracer.record_span('processor/infer', infer_start_time, infer_end_time, task,
+                               frames=len(batch_images), batch=len(tasks))
+
+        new_tasks = []
+        offset = 0
+        for task, image_list in zip(tasks, image_lists):
+            if not image_list:
+                new_tasks.append(None)
+                continue
+            result = batch_result[offset: offset + len(image_list)]
+            offset += len(image_list)
+            new_tasks.append(self.set_result(task, result))
+
+        return new_tasks
+
+    def read_frames(self, task: Task):
         data_file_path = task.get_file_path()
         cap = cv2.VideoCapture(data_file_path)
+        self.frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         image_list = []
         success, frame = cap.read()
         while success:
-            self.frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             image_list.append(frame)
             success, frame = cap.read()
+        cap.release()
 
         if len(image_list) == 0:
-            LOGGER.critical('ERROR: image list length is 0')
-            LOGGER.critical(f'Source: {task.get_source_id()}, Task: {task.get_task_id()}')
-            LOGGER.critical(f'file_path: {task.get_file_path()}')
-            return None
-        result = self.infer(image_list)
-        task = self.get_scenario(result, task)
-        task.set_current_content(convert_ndarray_to_list(result))
+            self.report_empty_segment(task)
+        return image_list
 
+    def infer_stream(self, task: Task):
+        frame_stream = FrameStream(task.get_file_path(), self.chunk_size)
+        self.frame_size = frame_stream.frame_size
+        result = []
+        try:
+            for chunk in frame_stream:
+                result.extend(self.infer(chunk))
+        finally:
+            frame_stream.close()
+
+        if len(result) == 0:
+            self.report_empty_segment(task)
+        return result
+
+    @staticmethod
+    def report_empty_segment(task: Task):
+        LOGGER.critical('ERROR: image list length is 0')
+        LOGGER.critical(f'Source: {task.get_source_id()}, Task: {task.get_task_id()}')
+        LOGGER.critical(f'file_path: {task.get_file_path()}')
+
+    def set_result(self, task: Task, result):
+        task = self.get_scenario(result, task)
+        # ndarray content is packed as raw blobs in binary envelope, converted to lists only for json
+        task.set_current_content(result)
         return task
 
     def infer(self, images: List[np.ndarray]):
@@ -45,7 +118,8 @@ class DetectorProcessor(Processor):
 
         LOGGER.debug(f'[Batch Size] Car detection batch: {len(images)}')
 
-        with Timer(f'Detection / {len(images)} frame'):
+        with Timer(f'Detection / {len(images)} frame'), Metrics.timer('processor_inference_seconds'):
             process_output = self.detector(images)
+        Metrics.inc('processor_inferred_frames_total', len(images))
 
         return process_output
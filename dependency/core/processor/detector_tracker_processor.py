@@ -6,7 +6,7 @@ from .processor import Processor
 
 from core.lib.estimation import Timer
 from core.lib.content import Task
-from core.lib.common import LOGGER, Context, convert_ndarray_to_list
+from core.lib.common import LOGGER, Context, Metrics
 from core.lib.common import ClassFactory, ClassType
 
 
@@ -37,7 +37,8 @@ class DetectorTrackerProcessor(Processor):
             return None
         result = self.infer(image_list)
         task = self.get_scenario(result, task)
-        task.set_current_content(convert_ndarray_to_list(result))
+        # ndarray content is packed as raw blobs in binary envelope, converted to lists only for json
+        task.set_current_content(result)
 
         return task
 
@@ -46,13 +47,39 @@ class DetectorTrackerProcessor(Processor):
         assert self.tracker, 'No tracker defined!'
 
         LOGGER.debug(f'[Batch Size] Car detection batch: {len(images)}')
+        if not hasattr(self.tracker, 'track'):
+            return self.infer_first_frame(images)
+
+        # trackers with incremental interface ask for a new detection when tracking quality drops
+        process_output = []
+        detection_frames = 0
+        with Timer(f'Detection and tracking / {len(images)} frame'):
+            for index, image in enumerate(images):
+                if index == 0 or self.tracker.need_detection():
+                    result = self.detect(image)
+                    self.tracker.reset(image, result)
+                    detection_frames += 1
+                else:
+                    result = self.tracker.track(image)
+                process_output.append(result)
+
+        LOGGER.debug(f'[Detection] Detect {detection_frames} of {len(images)} frames')
+        Metrics.inc('processor_tracked_frames_total', len(images) - detection_frames)
+        return process_output
+
+    def detect(self, image: np.ndarray):
+        with Metrics.timer('processor_inference_seconds'):
+            result = self.detector([image])[0]
+        Metrics.inc('processor_inferred_frames_total')
+        return result
+
+    def infer_first_frame(self, images: List[np.ndarray]):
+        """detect on the first frame and track the others"""
         detection_list = images[0:1]
         tracking_list = images[1:]
         with Timer(f'Detection / {len(detection_list)} frame'):
-            detection_output = self.detector(detection_list)
-        result_bbox, result_prob, result_class = detection_output[0]
+            detection_output = self.detect(detection_list[0])
         with Timer(f'Tracking / {len(tracking_list)} frame'):
-            tracking_output = self.tracker(tracking_list, detection_list[0], (result_bbox, result_prob, result_class))
-        process_output = tracking_output
+            tracking_output = self.tracker(tracking_list, detection_list[0], detection_output)
 
-        return process_output
+        return tracking_output
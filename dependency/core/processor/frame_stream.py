@@ -0,0 +1,73 @@
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+
+class FrameStream:
+    """
+    decode a video segment in a background thread into a fixed pool of preallocated frame buffers,
+    frames are consumed in chunks so that decoding overlaps with inference of the previous chunk
+    """
+
+    def __init__(self, file_path: str, chunk_size: int, pool_chunks: int = 2):
+        self.cap = cv2.VideoCapture(file_path)
+        # frame size is read once per segment
+        self.frame_size = (self.cap.get(cv2.CAP_PROP_FRAME_WIDTH), self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.chunk_size = max(int(chunk_size), 1)
+
+        width, height = int(self.frame_size[0]), int(self.frame_size[1])
+        self.pool_buffers = [np.empty((height, width, 3), dtype=np.uint8)
+                             for _ in range(self.chunk_size * max(pool_chunks, 1))]
+        # frames allocated by the decoder (buffer shape mismatch) are never returned to the pool
+        self.pool_buffer_ids = {id(buffer) for buffer in self.pool_buffers}
+        self.free_buffers = queue.Queue()
+        for buffer in self.pool_buffers:
+            self.free_buffers.put(buffer)
+        self.decoded_frames = queue.Queue()
+
+        self.decode_thread = threading.Thread(target=self.decode, daemon=True)
+        self.decode_thread.start()
+
+    def decode(self):
+        try:
+            while True:
+                buffer = self.free_buffers.get()
+                # stream is closed by consumer
+                if buffer is None:
+                    break
+                success, frame = self.cap.read(buffer)
+                if not success:
+                    break
+                # decoder allocates a new frame if buffer shape mismatches, recycle the unused buffer
+                if frame is not buffer:
+                    self.free_buffers.put(buffer)
+                self.decoded_frames.put(frame)
+        finally:
+            self.cap.release()
+            self.decoded_frames.put(None)
+
+    def release(self, frames):
+        for frame in frames:
+            if id(frame) in self.pool_buffer_ids:
+                self.free_buffers.put(frame)
+
+    def close(self):
+        self.free_buffers.put(None)
+
+    def __iter__(self):
+        """yield chunks of frames, buffers of a chunk are recycled once the next chunk is requested"""
+        chunk = []
+        while True:
+            frame = self.decoded_frames.get()
+            if frame is None:
+                break
+            chunk.append(frame)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                self.release(chunk)
+                chunk = []
+        if chunk:
+            yield chunk
+            self.release(chunk)
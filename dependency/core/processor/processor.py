@@ -1,3 +1,5 @@
+from typing import List
+
 from core.lib.content import Task
 from core.lib.common import Context
 
@@ -15,6 +17,10 @@ class Processor:
     def __call__(self, task: Task):
         raise NotImplementedError
 
+    def process_batch(self, tasks: List[Task]):
+        """process several tasks together, processors supporting cross-task batching should override it"""
+        return [self(task) for task in tasks]
+
     def get_scenario(self, result, task):
         scenarios = {}
 
@@ -1,15 +1,22 @@
+import asyncio
 import threading
+import time
+from typing import List
 
 from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form
 
 from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from core.lib.common import Context, SystemConstant
-from core.lib.common import LOGGER, FileOps
+from core.lib.common import LOGGER, FileOps, Metrics
 from core.lib.network import NodeInfo, PortInfo, http_request, merge_address, NetworkAPIMethod, NetworkAPIPath
+from core.lib.network import TaskEnvelopeNegotiator
 from core.lib.content import Task
-from core.lib.estimation import TimeEstimator
+from core.lib.estimation import TimeEstimator, Tracer
+
+from .worker_pool import ProcessorWorkerPool
 
 
 class ProcessorServer:
@@ -20,6 +27,11 @@ class ProcessorServer:
                      response_class=JSONResponse,
                      methods=[NetworkAPIMethod.PROCESSOR_PROCESS]
                      ),
+            APIRoute(NetworkAPIPath.PROCESSOR_PROCESS_LOCAL,
+                     self.process_local_service,
+                     response_class=JSONResponse,
+                     methods=[NetworkAPIMethod.PROCESSOR_PROCESS_LOCAL]
+                     ),
             APIRoute(NetworkAPIPath.PROCESSOR_PROCESS_RETURN,
                      self.process_return_service,
                      response_class=JSONResponse,
@@ -30,17 +42,55 @@ class ProcessorServer:
                      response_class=JSONResponse,
                      methods=[NetworkAPIMethod.PROCESSOR_QUEUE_LENGTH]
                      ),
+            APIRoute(NetworkAPIPath.PROCESSOR_LOOP_TIME,
+                     self.query_loop_time,
+                     response_class=JSONResponse,
+                     methods=[NetworkAPIMethod.PROCESSOR_LOOP_TIME]
+                     ),
+            APIRoute(NetworkAPIPath.PROCESSOR_LOAD,
+                     self.query_load,
+                     response_class=JSONResponse,
+                     methods=[NetworkAPIMethod.PROCESSOR_LOAD]
+                     ),
         ], log_level='trace', timeout=6000)
 
         self.app.add_middleware(
             CORSMiddleware, allow_origins=["*"], allow_credentials=True,
             allow_methods=["*"], allow_headers=["*"],
         )
+        TaskEnvelopeNegotiator.install(self.app)
+        Metrics.install(self.app)
 
-        self.processor = Context.get_algorithm('PROCESSOR')
+        # worker pool mode: process tasks in worker processes each owning a processor (0 to process in-place)
+        self.num_workers = Context.get_parameter('PROCESSOR_WORKERS', '0', direct=False)
+        self.worker_queue_depth = Context.get_parameter('WORKER_QUEUE_DEPTH', '2', direct=False)
+        if self.num_workers > 0:
+            self.processor = None
+            self.worker_pool = ProcessorWorkerPool(self.num_workers, self.worker_queue_depth)
+        else:
+            self.processor = Context.get_algorithm('PROCESSOR')
+            self.worker_pool = None
 
         self.task_queue = Context.get_algorithm('PRO_QUEUE')
 
+        # original file paths of tasks handed over through the local spool directory
+        self.handoff_file_paths = {}
+        # queueing time of traced tasks
+        self.enqueue_times = {}
+
+        # accumulated seconds of processing loop waiting for tasks / processing tasks
+        self.queue_wait_timeout = Context.get_parameter('QUEUE_WAIT_TIMEOUT', '1', direct=False)
+        self.loop_idle_time = 0
+        self.loop_busy_time = 0
+
+        # moving average of seconds to process one task, advertised as service rate for admission control
+        self.service_time = None
+        self.service_time_weight = Context.get_parameter('SERVICE_TIME_WEIGHT', '0.2', direct=False)
+
+        # cross-task batching: merge queued tasks up to a frame budget within a latency budget (0 to disable)
+        self.max_batch_frames = Context.get_parameter('MAX_BATCH_FRAMES', '0', direct=False)
+        self.max_batch_latency = Context.get_parameter('MAX_BATCH_LATENCY', '0.05', direct=False)
+
         self.local_device = NodeInfo.get_local_device()
         self.processor_port = Context.get_parameter('GUNICORN_PORT')
         self.controller_port = PortInfo.get_component_port(SystemConstant.CONTROLLER.value)
@@ -48,10 +98,17 @@ class ProcessorServer:
                                                 port=self.controller_port,
                                                 path=NetworkAPIPath.CONTROLLER_RETURN)
 
-        threading.Thread(target=self.loop_process).start()
+        self.register_metrics()
 
-    async def process_service(self, backtask: BackgroundTasks, file: UploadFile = File(...), data: str = Form(...)):
+        if self.worker_pool:
+            threading.Thread(target=self.loop_dispatch).start()
+        else:
+            threading.Thread(target=self.loop_process).start()
+
+    async def process_service(self, backtask: BackgroundTasks, file: UploadFile = File(...),
+                              data: str = Form(None), envelope: UploadFile = File(None)):
         file_data = await file.read()
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
         cur_task = Task.deserialize(data)
         backtask.add_task(self.process_service_background, data, file_data)
         LOGGER.debug(f'[Monitor Task] (Process Request) '
@@ -60,11 +117,74 @@ class ProcessorServer:
     def process_service_background(self, data, file_data):
         cur_task = Task.deserialize(data)
         FileOps.save_data_file(cur_task, file_data)
-        self.task_queue.put(cur_task)
+        self.put_task(cur_task)
         LOGGER.debug(f'[Task Queue] Queue Size (receive request): {self.task_queue.size()}')
         LOGGER.debug(f'[Monitor Task] (Process Request Background) '
                      f'Source: {cur_task.get_source_id()} / Task: {cur_task.get_task_id()} ')
 
+    async def process_local_service(self, backtask: BackgroundTasks, file_path: str = Form(...),
+                                    data: str = Form(None), envelope: UploadFile = File(None)):
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
+        cur_task = Task.deserialize(data)
+        backtask.add_task(self.process_local_service_background, data, file_path)
+        LOGGER.debug(f'[Monitor Task] (Process Local Request) '
+                     f'Source: {cur_task.get_source_id()} / Task: {cur_task.get_task_id()} ')
+
+    def process_local_service_background(self, data, file_path):
+        """file of task is shared by co-located controller in spool directory, read it in place"""
+        cur_task = Task.deserialize(data)
+        self.handoff_file_paths[cur_task.get_task_uuid()] = cur_task.get_file_path()
+        cur_task.set_file_path(file_path)
+        self.put_task(cur_task)
+        LOGGER.debug(f'[Task Queue] Queue Size (receive local request): {self.task_queue.size()}')
+        LOGGER.debug(f'[Monitor Task] (Process Local Request Background) '
+                     f'Source: {cur_task.get_source_id()} / Task: {cur_task.get_task_id()} ')
+
+    def put_task(self, task: Task):
+        """queue task, tasks dropped by a bounded queue are discarded with their files"""
+        if Tracer.is_sampled(task):
+            self.enqueue_times[task.get_task_uuid()] = time.time()
+        Metrics.update('tasks_in_flight', 1, component='processor')
+        for dropped_task in self.task_queue.put(task) or []:
+            Metrics.update('tasks_in_flight', -1, component='processor')
+            Metrics.inc('dropped_tasks_total', component='processor', reason='queue_full')
+            self.enqueue_times.pop(dropped_task.get_task_uuid(), None)
+            file_path = dropped_task.get_file_path()
+            self.restore_handoff_file_path(dropped_task)
+            FileOps.remove_file(file_path)
+
+    def register_metrics(self):
+        Metrics.gauge('tasks_in_flight', 'Tasks being handled by component', ('component',))
+        Metrics.counter('dropped_tasks_total', 'Tasks dropped by component per reason', ('component', 'reason'))
+        Metrics.histogram('processor_execute_seconds', 'Real execute time of tasks in processor')
+        Metrics.histogram('processor_inference_seconds', 'Time of model inference calls')
+        Metrics.counter('processor_inferred_frames_total', 'Frames passed to model inference')
+        Metrics.counter('processor_tracked_frames_total', 'Frames whose results are propagated by tracker')
+        Metrics.gauge('processor_queue_length', 'Tasks waiting in processor').set_function(
+            lambda: self.task_queue.size() + (sum(self.worker_pool.get_queue_lengths()) if self.worker_pool else 0))
+        Metrics.gauge('processor_service_rate', 'Tasks processed per second when busy').set_function(
+            lambda: max(self.num_workers, 1) / self.service_time if self.service_time else 0)
+        Metrics.gauge('processor_loop_busy_seconds', 'Accumulated seconds of processing loop processing tasks')\
+            .set_function(lambda: self.loop_busy_time)
+        Metrics.gauge('processor_loop_idle_seconds', 'Accumulated seconds of processing loop waiting for tasks')\
+            .set_function(lambda: self.loop_idle_time)
+
+    def record_queue_wait(self, tasks: List[Task]):
+        dequeue_time = time.time()
+        for task in tasks:
+            enqueue_time = self.enqueue_times.pop(task.get_task_uuid(), None)
+            if enqueue_time is not None:
+                Tracer.record_span('processor/queue_wait', enqueue_time, dequeue_time, task)
+
+    def restore_handoff_file_path(self, task: Task, new_task: Task = None):
+        """recover file path of controller side for task handed over through spool directory"""
+        original_file_path = self.handoff_file_paths.pop(task.get_task_uuid(), None)
+        if original_file_path is None:
+            return
+        task.set_file_path(original_file_path)
+        if new_task:
+            new_task.set_file_path(original_file_path)
+
     async def process_return_service(self, file: UploadFile = File(...),
                                      data: str = Form(...)):
         file_data = await file.read()
@@ -73,50 +193,164 @@ class ProcessorServer:
                     f'task {cur_task.get_task_id()}')
         FileOps.save_data_file(cur_task, file_data)
 
-        new_task = self.processor(cur_task)
+        if self.worker_pool:
+            future = await run_in_threadpool(self.worker_pool.submit, cur_task)
+            new_task = await asyncio.wrap_future(future)
+        else:
+            new_task = self.processor(cur_task)
         LOGGER.debug(f'[Processor Return completed] content length: {len(new_task.get_current_content())}')
         FileOps.remove_data_file(cur_task)
         if new_task:
             return new_task.serialize()
 
-    async def query_queue_length(self):
-        return self.task_queue.size()
+    async def query_queue_length(self, detail: bool = False):
+        """
+        number of tasks waiting in processor (including tasks dispatched to workers in worker pool mode)
+        with detail, return {'queue': length of task queue, 'workers': outstanding tasks of each worker}
+        """
+        worker_lengths = self.worker_pool.get_queue_lengths() if self.worker_pool else []
+        if detail:
+            return {'queue': self.task_queue.size(), 'workers': worker_lengths}
+        return self.task_queue.size() + sum(worker_lengths)
+
+    async def query_loop_time(self):
+        return {'idle_time': self.loop_idle_time, 'busy_time': self.loop_busy_time}
+
+    async def query_load(self):
+        """
+        load advertised to controllers for admission control:
+        queue_length: number of tasks waiting in processor
+        service_rate: tasks processed per second when busy (0 if no task is processed yet)
+        """
+        queue_length = await self.query_queue_length()
+        service_rate = max(self.num_workers, 1) / self.service_time if self.service_time else 0
+        return {'queue_length': queue_length, 'service_rate': service_rate}
+
+    def record_service_time(self, service_time: float):
+        if self.service_time is None:
+            self.service_time = service_time
+        else:
+            self.service_time += self.service_time_weight * (service_time - self.service_time)
 
     def loop_process(self):
         LOGGER.info('Start processing loop..')
         while True:
-            if self.task_queue.empty():
-                continue
-            task = self.task_queue.get()
-            if not task:
+            wait_start_time = time.time()
+            task = self.task_queue.get(block=True, timeout=self.queue_wait_timeout)
+            if task and self.max_batch_frames > 0:
+                tasks = self.collect_batch_tasks(task)
+            else:
+                tasks = [task] if task else []
+            process_start_time = time.time()
+            self.loop_idle_time += process_start_time - wait_start_time
+            if not tasks:
                 continue
+            self.record_queue_wait(tasks)
             LOGGER.debug(f'[Task Queue] Queue Size (loop): {self.task_queue.size()}')
 
-            try:
-                new_task = self.process_task_service(task)
-            except Exception as e:
-                LOGGER.critical("[Processor Error] Processor encountered error when processing data.")
-                LOGGER.exception(e)
+            self.process_and_return(tasks)
+            process_time = time.time() - process_start_time
+            self.loop_busy_time += process_time
+            self.record_service_time(process_time / len(tasks))
+
+    def loop_dispatch(self):
+        LOGGER.info(f'Start dispatching loop to {self.num_workers} workers..')
+        while True:
+            wait_start_time = time.time()
+            task = self.task_queue.get(block=True, timeout=self.queue_wait_timeout)
+            dispatch_start_time = time.time()
+            self.loop_idle_time += dispatch_start_time - wait_start_time
+            if not task:
                 continue
+            self.record_queue_wait([task])
+            LOGGER.debug(f'[Task Queue] Queue Size (dispatch): {self.task_queue.size()}')
 
-            if new_task:
-                self.send_result_back_to_controller(new_task)
-            FileOps.remove_data_file(task)
+            file_path = task.get_file_path()
+            self.worker_pool.submit(task, callback=lambda new_task, task=task, file_path=file_path:
+                                    self.return_result(task, new_task, file_path))
+            self.loop_busy_time += time.time() - dispatch_start_time
 
-    def process_task_service(self, task: Task):
-        LOGGER.debug(f'[Monitor Task] (Process start) Source: {task.get_source_id()} / Task: {task.get_task_id()} ')
+    def collect_batch_tasks(self, first_task: Task):
+        """gather queued tasks (possibly from different sources) until frame budget or latency budget is used up"""
+        tasks = [first_task]
+        frame_count = self.get_task_frame_count(first_task)
+        deadline = time.time() + self.max_batch_latency
+        while frame_count < self.max_batch_frames:
+            remaining_time = deadline - time.time()
+            if remaining_time <= 0:
+                break
+            task = self.task_queue.get(block=True, timeout=remaining_time)
+            if not task:
+                break
+            tasks.append(task)
+            frame_count += self.get_task_frame_count(task)
 
-        TimeEstimator.record_dag_ts(task, is_end=False, sub_tag='real_execute')
-        new_task = self.processor(task)
-        duration = TimeEstimator.record_dag_ts(new_task, is_end=True, sub_tag='real_execute')
-        new_task.save_real_execute_time(duration)
+        LOGGER.debug(f'[Task Batch] Merge {len(tasks)} tasks with {frame_count} frames')
+        return tasks
 
-        LOGGER.debug(f'[Monitor Task] (Process end) Source: {task.get_source_id()} / Task: {task.get_task_id()} ')
-        LOGGER.info(f'[Process Task] Source: {task.get_source_id()} / Task: {task.get_task_id()} Duration: {duration} ')
+    @staticmethod
+    def get_task_frame_count(task: Task):
+        metadata = task.get_metadata()
+        return metadata.get('buffer_size', 1) if metadata else 1
 
-        return new_task
+    def process_and_return(self, tasks: List[Task]):
+        file_paths = [task.get_file_path() for task in tasks]
+        try:
+            new_tasks = self.process_task_service(tasks)
+        except Exception as e:
+            LOGGER.critical("[Processor Error] Processor encountered error when processing data.")
+            LOGGER.exception(e)
+            for task, file_path in zip(tasks, file_paths):
+                self.restore_handoff_file_path(task)
+                FileOps.remove_file(file_path)
+            Metrics.update('tasks_in_flight', -len(tasks), component='processor')
+            return
 
-    def send_result_back_to_controller(self, task):
+        for task, new_task, file_path in zip(tasks, new_tasks, file_paths):
+            self.return_result(task, new_task, file_path)
 
-        http_request(url=self.controller_address, method=NetworkAPIMethod.CONTROLLER_RETURN,
-                     data={'data': task.serialize()})
+    def return_result(self, task: Task, new_task: Task, file_path: str):
+        self.restore_handoff_file_path(task, new_task)
+        if new_task:
+            execute_time = new_task.get_dag().get_node(new_task.get_flow_index()).service.get_real_execute_time()
+            Metrics.observe('processor_execute_seconds', execute_time)
+            # workers process tasks one by one, service time of a worker is the real execute time of task
+            if self.worker_pool and execute_time > 0:
+                self.record_service_time(execute_time)
+            self.send_result_back_to_controller(new_task)
+        FileOps.remove_file(file_path)
+        Metrics.update('tasks_in_flight', -1, component='processor')
+
+    def process_task_service(self, tasks: List[Task]):
+        return self.process_tasks(self.processor, tasks)
+
+    @staticmethod
+    def process_tasks(processor, tasks: List[Task]):
+        for task in tasks:
+            LOGGER.debug(f'[Monitor Task] (Process start) '
+                         f'Source: {task.get_source_id()} / Task: {task.get_task_id()} ')
+            TimeEstimator.record_dag_ts(task, is_end=False, sub_tag='real_execute')
+
+        process_start_time = time.time()
+        new_tasks = [processor(tasks[0])] if len(tasks) == 1 else processor.process_batch(tasks)
+        process_end_time = time.time()
+        for task in tasks:
+            Tracer.record_span('processor/process', process_start_time, process_end_time, task, batch=len(tasks))
+
+        for task, new_task in zip(tasks, new_tasks):
+            if not new_task:
+                continue
+            duration = TimeEstimator.record_dag_ts(new_task, is_end=True, sub_tag='real_execute')
+            new_task.save_real_execute_time(duration)
+
+            LOGGER.debug(f'[Monitor Task] (Process end) '
+                         f'Source: {task.get_source_id()} / Task: {task.get_task_id()} ')
+            LOGGER.info(f'[Process Task] Source: {task.get_source_id()} / '
+                        f'Task: {task.get_task_id()} Duration: {duration} ')
+
+        return new_tasks
+
+    def send_result_back_to_controller(self, task):
+        with Tracer.span('processor/return', task):
+            http_request(url=self.controller_address, method=NetworkAPIMethod.CONTROLLER_RETURN,
+                         **TaskEnvelopeNegotiator.build_task_payload(self.controller_address, task))
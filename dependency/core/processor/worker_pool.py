@@ -0,0 +1,147 @@
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from core.lib.common import Context, LOGGER
+from core.lib.content import Task, TaskEnvelope
+
+
+def run_processor_worker(worker_id, task_queue, result_queue):
+    """worker process owning its processor instance, processing tasks one by one"""
+    from .processor_server import ProcessorServer
+
+    processor = Context.get_algorithm('PROCESSOR')
+    LOGGER.info(f'[Processor Worker {worker_id}] Start processing..')
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        task_key, data = item
+
+        new_data = None
+        try:
+            new_task = ProcessorServer.process_tasks(processor, [Task.deserialize(data)])[0]
+            if new_task:
+                new_data = new_task.serialize(binary=TaskEnvelope.is_available())
+        except Exception as e:
+            LOGGER.critical(f'[Processor Worker {worker_id}] Processor encountered error when processing data.')
+            LOGGER.exception(e)
+        result_queue.put((worker_id, task_key, new_data))
+
+
+class ProcessorWorkerPool:
+    """
+    processes each owning a processor instance (model loaded separately in each process)
+
+    tasks are dispatched to the worker with the fewest outstanding tasks,
+    submitting blocks while every worker holds `worker_queue_depth` tasks, so that tasks keep waiting
+    in the processor task queue (in its order) instead of worker queues.
+    callbacks of results are invoked in submission order of each source.
+    """
+
+    def __init__(self, num_workers: int, worker_queue_depth: int = 2, health_check_interval: float = 5):
+        self.context = multiprocessing.get_context('spawn')
+        self.num_workers = num_workers
+        self.worker_queue_depth = worker_queue_depth
+        self.health_check_interval = health_check_interval
+
+        self.lock = threading.Condition()
+        self.result_queue = self.context.Queue()
+        self.worker_queues = [None] * num_workers
+        self.workers = [None] * num_workers
+        self.worker_loads = [0] * num_workers
+
+        # task key -> (worker id, future of result)
+        self.pending_tasks = {}
+        # source id -> deque of (future, callback) in submission order
+        self.source_orders = {}
+        self.task_count = 0
+
+        for worker_id in range(num_workers):
+            self.start_worker(worker_id)
+
+        threading.Thread(target=self.loop_collect, daemon=True).start()
+
+    def start_worker(self, worker_id):
+        self.worker_queues[worker_id] = self.context.Queue()
+        self.workers[worker_id] = self.context.Process(
+            target=run_processor_worker,
+            args=(worker_id, self.worker_queues[worker_id], self.result_queue),
+            daemon=True)
+        self.workers[worker_id].start()
+
+    def submit(self, task: Task, callback=None) -> Future:
+        """dispatch task to a worker, callback(new_task) is called after results of earlier tasks of the source"""
+        future = Future()
+        with self.lock:
+            self.lock.wait_for(lambda: min(self.worker_loads) < self.worker_queue_depth)
+            worker_id = min(range(self.num_workers), key=lambda idx: self.worker_loads[idx])
+            self.worker_loads[worker_id] += 1
+
+            task_key = self.task_count
+            self.task_count += 1
+            self.pending_tasks[task_key] = (worker_id, future)
+            if callback:
+                self.source_orders.setdefault(task.get_source_id(), deque()).append((future, callback))
+
+        self.worker_queues[worker_id].put((task_key, task.serialize(binary=TaskEnvelope.is_available())))
+        return future
+
+    def get_queue_lengths(self):
+        """number of tasks dispatched to each worker and not returned yet"""
+        with self.lock:
+            return list(self.worker_loads)
+
+    def loop_collect(self):
+        while True:
+            try:
+                worker_id, task_key, new_data = self.result_queue.get(timeout=self.health_check_interval)
+            except queue.Empty:
+                self.check_workers()
+                continue
+
+            try:
+                new_task = Task.deserialize(new_data) if new_data else None
+            except Exception as e:
+                LOGGER.warning(f'[Processor Worker {worker_id}] Invalid result: {str(e)}')
+                new_task = None
+            self.finish_task(task_key, new_task)
+            self.release_ordered_results()
+
+    def finish_task(self, task_key, new_task):
+        with self.lock:
+            if task_key not in self.pending_tasks:
+                return
+            worker_id, future = self.pending_tasks.pop(task_key)
+            self.worker_loads[worker_id] -= 1
+            self.lock.notify_all()
+        future.set_result(new_task)
+
+    def check_workers(self):
+        """restart dead workers, tasks on them are finished without result"""
+        for worker_id, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            LOGGER.warning(f'[Processor Worker {worker_id}] Worker exits with code {worker.exitcode}, restart it.')
+            with self.lock:
+                lost_keys = [key for key, (wid, _) in self.pending_tasks.items() if wid == worker_id]
+            for task_key in lost_keys:
+                self.finish_task(task_key, None)
+            self.start_worker(worker_id)
+        self.release_ordered_results()
+
+    def release_ordered_results(self):
+        ready_results = []
+        with self.lock:
+            for orders in self.source_orders.values():
+                while orders and orders[0][0].done():
+                    ready_results.append(orders.popleft())
+
+        for future, callback in ready_results:
+            try:
+                callback(future.result())
+            except Exception as e:
+                LOGGER.warning(f'[Processor Worker] Result callback failed: {str(e)}')
+                LOGGER.exception(e)
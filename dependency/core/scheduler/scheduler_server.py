@@ -1,13 +1,13 @@
 import json
 
-from fastapi import FastAPI, Form
+from fastapi import FastAPI, Form, UploadFile, File
 from fastapi.routing import APIRoute
 from starlette.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from core.lib.network import NetworkAPIMethod, NetworkAPIPath
+from core.lib.network import NetworkAPIMethod, NetworkAPIPath, TaskEnvelopeNegotiator
 from core.lib.content import Task
-from core.lib.common import LOGGER
+from core.lib.common import LOGGER, Metrics
 
 from .scheduler import Scheduler
 
@@ -55,6 +55,9 @@ class SchedulerServer:
             CORSMiddleware, allow_origins=["*"], allow_credentials=True,
             allow_methods=["*"], allow_headers=["*"],
         )
+        TaskEnvelopeNegotiator.install(self.app)
+        Metrics.install(self.app)
+        Metrics.histogram('scheduler_plan_seconds', 'Time of generating schedule plan per source')
 
         self.scheduler = Scheduler()
 
@@ -62,14 +65,16 @@ class SchedulerServer:
         data = json.loads(data)
 
         self.scheduler.register_schedule_table(data['source_id'])
-        plan = self.scheduler.get_schedule_plan(data)
+        with Metrics.timer('scheduler_plan_seconds'):
+            plan = self.scheduler.get_schedule_plan(data)
 
         return {'plan': plan}
 
     async def get_schedule_overhead(self):
         return self.scheduler.get_schedule_overhead()
 
-    async def update_object_scenario(self, data: str = Form(...)):
+    async def update_object_scenario(self, data: str = Form(None), envelope: UploadFile = File(None)):
+        data = await TaskEnvelopeNegotiator.read_task_data(data, envelope)
         task = Task.deserialize(data)
 
         self.scheduler.update_scheduler_scenario(task)
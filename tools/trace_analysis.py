@@ -0,0 +1,140 @@
+"""
+Dayu Trace Analysis Tool
+
+Tool script to summarize latency of task hops from trace files exported by dayu components.
+
+Trace files are written into TRACE_DIR of each component when tracing is enabled
+(set TRACE_ENABLED=True and TRACE_SAMPLE_RATE in component env), and can also be loaded by chrome://tracing or Perfetto.
+
+Examples:
+    python tools/trace_analysis.py --trace trace_dir
+    python tools/trace_analysis.py --trace trace-edge1-12.json trace-cloud-8.json --stage processor --bins 20
+
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Dayu Trace Analysis Tool",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "--trace",
+        type=str,
+        nargs='+',
+        required=True,
+        metavar="TRACE_PATH",
+        help="Specify trace files or directories of trace files"
+    )
+    parser.add_argument(
+        "--stage",
+        type=str,
+        default=None,
+        help="Only analyze spans whose name starts with the stage (eg: processor or processor/infer)"
+    )
+    parser.add_argument(
+        "--bins",
+        type=int,
+        default=10,
+        help="Number of histogram bins of each span"
+    )
+
+    return parser.parse_args()
+
+
+def collect_trace_files(paths):
+    trace_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            trace_files.extend(os.path.join(path, file) for file in sorted(os.listdir(path))
+                               if file.endswith('.json'))
+        elif os.path.isfile(path):
+            trace_files.append(path)
+        else:
+            print(f"Trace path {path} not exists")
+    return trace_files
+
+
+def parse_trace(trace_file):
+    """complete events of trace file, trace files are appended lines of events without closing bracket"""
+    events = []
+    with open(trace_file) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if not line or line in ('[', ']'):
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # last line may be partially written
+                continue
+            if event.get('ph') == 'X':
+                events.append(event)
+    return events
+
+
+def group_spans(events, stage=None):
+    """span name -> durations in milliseconds"""
+    spans = {}
+    for event in events:
+        if stage and not event['name'].startswith(stage):
+            continue
+        spans.setdefault(event['name'], []).append(event['dur'] / 1e3)
+    return {name: np.array(durations) for name, durations in spans.items()}
+
+
+def print_histogram(durations, bins, width=40):
+    counts, edges = np.histogram(durations, bins=bins)
+    max_count = max(counts.max(), 1)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        bar = '#' * int(round(count / max_count * width))
+        print(f'    {low:10.2f} - {high:10.2f} ms | {bar:<{width}} {count}')
+
+
+def analyze_spans(spans, bins):
+    for name in sorted(spans):
+        durations = spans[name]
+        p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+        print(f'[{name}] count: {len(durations)}  mean: {durations.mean():.2f}ms  '
+              f'p50: {p50:.2f}ms  p90: {p90:.2f}ms  p99: {p99:.2f}ms  max: {durations.max():.2f}ms')
+        print_histogram(durations, bins)
+        print()
+
+
+def parse_and_analyze_traces(paths, stage=None, bins=10):
+    trace_files = collect_trace_files(paths)
+    if not trace_files:
+        return
+
+    events = []
+    for trace_file in trace_files:
+        try:
+            events.extend(parse_trace(trace_file))
+        except Exception as e:
+            print(f"Failed to parse trace file {trace_file}: {str(e)}")
+
+    spans = group_spans(events, stage)
+    if not spans:
+        print('No span found in trace files.')
+        return
+
+    print('##################################################################')
+    print('##################### Dayu Trace Analysis Tool ###################')
+    print(f'Analyze {len(trace_files)} trace files with {sum(len(d) for d in spans.values())} spans ..')
+    print()
+
+    analyze_spans(spans, bins)
+
+    print('##################################################################')
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    parse_and_analyze_traces(args.trace, args.stage, args.bins)